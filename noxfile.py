@@ -11,6 +11,10 @@ PYTHON_PATHS = [
     "./noxfile.py",
 ]
 
+BENCHMARK = "./workflow-executor/benchmarks/bench.py"
+SIMULATOR = "./workflow-executor/simulator/simulate.py"
+TESTS = "./workflow-executor/tests/"
+
 
 @nox.session
 def black(session):
@@ -34,3 +38,23 @@ def linters(session):
     session.run("black", "--check", *PYTHON_PATHS)
     session.run("isort", "--profile=black", "--check", *PYTHON_PATHS)
     session.run("flake8", *PYTHON_PATHS)
+
+
+@nox.session
+def tests(session):
+    session.install("-r", "./workflow-executor/requirements.txt")
+    session.install("pytest")
+    session.run("pytest", TESTS, *session.posargs)
+
+
+@nox.session
+def benchmark(session):
+    session.install("-r", "./workflow-executor/requirements.txt")
+    session.run("python", BENCHMARK, *session.posargs)
+
+
+@nox.session
+def simulate(session):
+    session.install("-r", "./workflow-executor/requirements.txt")
+    session.install("pyyaml")
+    session.run("python", SIMULATOR, *session.posargs)
@@ -0,0 +1,441 @@
+"""
+Benchmarks for the workflow submission path, runnable without a cluster.
+
+The scheduler and the proxy are driven against an in-process fake of the
+Kubernetes API and a stub Argo server, with synthetic workflows and
+WorkflowWorkers catalogues. Each benchmark reports throughput, p50/p99
+latency and the peak memory allocated per operation.
+
+    python workflow-executor/benchmarks/bench.py [--quick] [--only NAME]
+        [--profile NAME] [--save FILE] [--compare FILE] [--tolerance 0.25]
+"""
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+import requests
+import synthetic
+
+from fake_kubernetes import FakeKubernetes
+from stub_argo import StubArgo
+
+
+Result = namedtuple('Result', ['name', 'params', 'ops', 'p50', 'p99', 'peak_kib'])
+
+REPORT = sys.stdout
+
+
+def percentile(timings, q):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(q * len(timings)))]
+
+
+def measure(func, min_time=1.0, max_iterations=10000):
+    """
+    Calls ``func`` until ``min_time`` seconds have passed (at least three
+    times) and returns the list of call durations in seconds.
+    """
+    timings = []
+    started = time.perf_counter()
+
+    while len(timings) < max_iterations and \
+        (len(timings) < 3 or time.perf_counter() - started < min_time):
+            t = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - t)
+
+    return timings
+
+
+def peak_allocation(func, iterations=3):
+    """
+    Returns the largest peak of traced memory, in KiB, over a few calls.
+    """
+    tracemalloc.start()
+    try:
+        peak = 0
+        for _ in range(iterations):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            func()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+        return peak / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def result(name, params, timings, peak_kib, elapsed=None):
+    return Result(
+        name,
+        params,
+        len(timings) / (elapsed or sum(timings)),
+        percentile(timings, 0.50) * 1000,
+        percentile(timings, 0.99) * 1000,
+        peak_kib,
+    )
+
+
+class Benchmarks():
+
+    def __init__(self, quick=False, min_time=1.0):
+        self.quick = quick
+        self.min_time = min_time
+
+        self.templates = [10, 1000] if quick else [10, 100, 1000, 10000]
+        self.catalogues = [1, 100] if quick else [1, 10, 100, 500]
+        self.walks = [10, 1000] if quick else [10, 100, 1000, 10000]
+        self.proxy_requests = 100 if quick else 500
+        self.concurrency = 32
+
+        self.fake = None
+        self.argo = None
+        self.proxy = None
+        self.scheduler = None
+
+    def setup(self):
+        sizes = synthetic.worker_sizes(4)
+
+        self.fake = FakeKubernetes().start()
+        self.fake.replace(('workflow.io', 'workflowworkers', None), sizes)
+        self.fake.replace('nodes', synthetic.nodes(16, sizes))
+        self.argo = StubArgo().start()
+
+        os.environ.update(
+            KUBECONFIG=self.fake.kubeconfig,
+            METRICS_PORT='0',
+            TARGET_SERVER='http://127.0.0.1',
+            TARGET_PORT=str(self.argo.port),
+        )
+
+        import WorkflowProxyHandler
+        self.proxy = WorkflowProxyHandler
+        self.scheduler = WorkflowProxyHandler.scheduler
+        self.scheduler.started.wait(30)
+
+    def teardown(self):
+        self.argo.stop()
+        self.fake.stop()
+
+    def use_catalogue(self, count):
+        self.fake.replace(
+            ('workflow.io', 'workflowworkers', None),
+            synthetic.worker_sizes(count),
+        )
+        self.scheduler.worker_catalogue.relist()
+
+    def bench_parse_memory(self):
+        from quantity import parse_memory_to_bytes
+
+        values = ['512Mi', '2Gi', '1024Ki', '1.5Gi', '1073741824', '16384000Ki', '4Ti', '500M', '1e9'] * 200
+
+        def run():
+            for value in values:
+                parse_memory_to_bytes(value)
+
+        yield result(
+            'parse_memory_to_bytes',
+            f"batch={len(values)}",
+            measure(run, self.min_time),
+            peak_allocation(run),
+        )
+
+    def bench_schedule_workflow(self):
+        for sizes in self.catalogues:
+            self.use_catalogue(sizes)
+
+            for templates in self.templates:
+                workflow = synthetic.workflow(templates)
+
+                def run():
+                    self.scheduler.schedule_workflow(workflow)
+
+                yield result(
+                    'schedule_workflow',
+                    f"templates={templates} sizes={sizes}",
+                    measure(run, self.min_time),
+                    peak_allocation(run),
+                )
+
+    def bench_pods_pending(self):
+        from workflow_counters import workflow_pods_pending
+
+        for nodes in self.walks:
+            workflows = [
+                synthetic.running_workflow(nodes, 'size-000', seed=i, name=f"running-{i}")
+                for i in range(10)
+            ]
+
+            def run():
+                for workflow in workflows:
+                    workflow_pods_pending(workflow)
+
+            yield result(
+                'pods_pending_walk',
+                f"nodes={nodes} workflows={len(workflows)}",
+                measure(run, self.min_time),
+                peak_allocation(run),
+            )
+
+        self.use_catalogue(4)
+        self.fake.replace(
+            ('argoproj.io', 'workflows', 'argo'),
+            [
+                synthetic.running_workflow(100, f"size-{i % 4:03d}", seed=i, name=f"running-{i}")
+                for i in range(1000)
+            ],
+        )
+        for cache in self.scheduler.workflow_caches:
+            cache.relist()
+
+        def scrape():
+            for _ in self.scheduler.collector.collect():
+                pass
+
+        yield result(
+            'collect_metrics',
+            "workflows=1000",
+            measure(scrape, self.min_time),
+            peak_allocation(scrape),
+        )
+
+    def bench_label_nodes(self):
+        self.use_catalogue(10)
+        sizes = synthetic.worker_sizes(10)
+
+        for count in ([16, 256] if self.quick else [16, 256, 1024]):
+            self.fake.replace('nodes', synthetic.nodes(count, sizes))
+            self.scheduler.node_controller.nodes.relist()
+
+            def relabel():
+                self.scheduler.label_workflow_nodes(force=True)
+
+            yield result(
+                'label_workflow_nodes',
+                f"nodes={count} changed=all",
+                measure(relabel, self.min_time, max_iterations=20),
+                peak_allocation(relabel, iterations=1),
+            )
+            yield result(
+                'label_workflow_nodes',
+                f"nodes={count} changed=none",
+                measure(self.scheduler.label_workflow_nodes, self.min_time, max_iterations=20),
+                peak_allocation(self.scheduler.label_workflow_nodes, iterations=1),
+            )
+
+    def bench_sync_workflow_nodes(self):
+        sizes = synthetic.worker_sizes(10)
+        mirror = ('workflow.io', 'workflownodes', None)
+
+        for count in ([16, 256] if self.quick else [16, 256, 1024]):
+            self.fake.replace('nodes', synthetic.nodes(count, sizes))
+            self.scheduler.node_controller.nodes.relist()
+
+            def resync():
+                self.fake.replace(mirror, [])
+                self.scheduler.sync_workflow_nodes()
+
+            yield result(
+                'sync_workflow_nodes',
+                f"nodes={count} changed=all",
+                measure(resync, self.min_time, max_iterations=20),
+                peak_allocation(resync, iterations=1),
+            )
+            yield result(
+                'sync_workflow_nodes',
+                f"nodes={count} changed=none",
+                measure(self.scheduler.sync_workflow_nodes, self.min_time, max_iterations=20),
+                peak_allocation(self.scheduler.sync_workflow_nodes, iterations=1),
+            )
+
+    def bench_proxy(self):
+        self.use_catalogue(10)
+
+        for mode, start in (('threaded', self.start_threaded_proxy), ('async', self.start_async_proxy)):
+            port, stop = start()
+            try:
+                for templates in self.templates[:2]:
+                    body = json.dumps(synthetic.workflow(templates)).encode()
+                    yield self.load(mode, port, templates, body)
+            finally:
+                stop()
+
+    def load(self, mode, port, templates, body):
+        url = f"http://127.0.0.1:{port}/api/v1/workflows/argo"
+        headers = {'Content-Type': 'application/json'}
+        sessions = threading.local()
+
+        def submit():
+            if not hasattr(sessions, 'session'):
+                sessions.session = requests.Session()
+            t = time.perf_counter()
+            response = sessions.session.post(url, data=body, headers=headers)
+            response.raise_for_status()
+            return time.perf_counter() - t
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            timings = list(executor.map(lambda _: submit(), range(self.proxy_requests)))
+        elapsed = time.perf_counter() - started
+
+        def sequential():
+            for _ in range(5):
+                submit()
+
+        return result(
+            'proxy_submit',
+            f"mode={mode} templates={templates} concurrency={self.concurrency}",
+            timings,
+            peak_allocation(sequential, iterations=1),
+            elapsed=elapsed,
+        )
+
+    def start_threaded_proxy(self):
+        httpd = self.proxy.ProxyServer(('127.0.0.1', 0), self.proxy.ProxyHandler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+        def stop():
+            httpd.shutdown()
+            httpd.server_close()
+
+        return httpd.server_address[1], stop
+
+    def start_async_proxy(self):
+        from aiohttp import web
+        from async_proxy import AsyncProxy
+
+        proxy = AsyncProxy(
+            self.scheduler,
+            self.proxy.TARGET_SERVER,
+            self.proxy.TARGET_PORT,
+        )
+
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(proxy.application())
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        loop.run_until_complete(site.start())
+        port = runner.addresses[0][1]
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+
+        def stop():
+            asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+
+        return port, stop
+
+    def names(self):
+        return [name[len('bench_'):] for name in dir(self) if name.startswith('bench_')]
+
+    def run(self, name):
+        yield from getattr(self, f"bench_{name}")()
+
+
+def report(result):
+    print(
+        f"{result.name:<22} {result.params:<44} "
+        f"{result.ops:>12.1f} {result.p50:>10.3f} {result.p99:>10.3f} {result.peak_kib:>12.1f}",
+        file=REPORT,
+        flush=True,
+    )
+
+
+def compare(results, baseline_path, tolerance):
+    """
+    Returns the benchmarks whose p50 got slower than the saved baseline by
+    more than ``tolerance``.
+    """
+    with open(baseline_path) as f:
+        baseline = {(x['name'], x['params']): x for x in json.load(f)}
+
+    regressions = []
+    for x in results:
+        previous = baseline.get((x.name, x.params))
+        if previous and x.p50 > previous['p50'] * (1 + tolerance):
+            regressions.append((x, previous['p50']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--quick', action='store_true', help="smaller parameter grid")
+    parser.add_argument('--only', action='append', help="benchmark to run, can be repeated")
+    parser.add_argument('--min-time', type=float, default=1.0, help="seconds per measurement")
+    parser.add_argument('--profile', help="run one benchmark under cProfile")
+    parser.add_argument('--profile-out', help="write the cProfile stats to this file")
+    parser.add_argument('--save', help="write the results as JSON")
+    parser.add_argument('--compare', help="JSON results to compare p50 latencies with")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p50 regression ratio")
+    parser.add_argument('--verbose', action='store_true', help="keep the proxy and scheduler output")
+    args = parser.parse_args()
+
+    benchmarks = Benchmarks(quick=args.quick, min_time=args.min_time)
+    names = [args.profile] if args.profile else (args.only or benchmarks.names())
+
+    output = open(os.devnull, 'w') if not args.verbose else sys.stdout
+
+    def quiet():
+        stack = contextlib.ExitStack()
+        stack.enter_context(contextlib.redirect_stdout(output))
+        stack.enter_context(contextlib.redirect_stderr(output))
+        return stack
+
+    with quiet():
+        benchmarks.setup()
+
+    print(
+        f"{'benchmark':<22} {'params':<44} {'ops/s':>12} {'p50 ms':>10} {'p99 ms':>10} {'peak KiB':>12}",
+        file=REPORT,
+    )
+
+    results = []
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        with quiet():
+            for name in names:
+                if profiler:
+                    profiler.enable()
+                for x in benchmarks.run(name):
+                    results.append(x)
+                    report(x)
+                if profiler:
+                    profiler.disable()
+    finally:
+        benchmarks.teardown()
+
+    if profiler:
+        stats = pstats.Stats(profiler, stream=REPORT).sort_stats('cumulative')
+        stats.print_stats(25)
+        if args.profile_out:
+            stats.dump_stats(args.profile_out)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump([x._asdict() for x in results], f, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for x, previous in regressions:
+            print(
+                f"REGRESSION {x.name} {x.params}: p50 {x.p50:.3f} ms, was {previous:.3f} ms",
+                file=REPORT,
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+In-process fake of the parts of the Kubernetes API the workflow executor
+talks to: nodes, cluster scoped and namespaced custom objects, with list,
+watch, create, patch and delete. Watches stream the changes made after
+they were opened, until their timeout.
+"""
+import json
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+NODES = re.compile(r"^/api/v1/nodes(?:/(?P<name>[^/]+))?$")
+CUSTOM = re.compile(
+    r"^/apis/(?P<group>[^/]+)/(?P<version>[^/]+)"
+    r"(?:/namespaces/(?P<namespace>[^/]+))?"
+    r"/(?P<plural>[^/]+)(?:/(?P<name>[^/]+))?$"
+)
+
+
+def merge_patch(target, patch):
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_patch(target[key], value)
+        elif value is None:
+            target.pop(key, None)
+        else:
+            target[key] = value
+    return target
+
+
+class FakeKubernetes():
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.collections = {}
+        self.resource_version = 0
+        self.calls = Counter()
+        self.watchers = {}
+        self.stopped = threading.Event()
+        self.server = None
+        self.kubeconfig = None
+
+    def collection(self, key):
+        return self.collections.setdefault(key, {})
+
+    def put(self, key, obj):
+        with self.lock:
+            self.resource_version += 1
+            obj.setdefault('metadata', {})['resourceVersion'] = str(self.resource_version)
+            items = self.collection(key)
+            event = 'MODIFIED' if obj['metadata']['name'] in items else 'ADDED'
+            items[obj['metadata']['name']] = obj
+            self.notify(key, event, obj)
+            return obj
+
+    def replace(self, key, objs):
+        with self.lock:
+            removed = self.collections.pop(key, {})
+            names = {obj['metadata']['name'] for obj in objs}
+            for name, obj in removed.items():
+                if name not in names:
+                    self.notify(key, 'DELETED', obj)
+            self.collections[key] = {
+                name: obj for name, obj in removed.items() if name in names
+            }
+        for obj in objs:
+            self.put(key, obj)
+
+    def notify(self, key, event, obj):
+        line = json.dumps({'type': event, 'object': obj}).encode() + b"\n"
+        for watcher in self.watchers.get(key, ()):
+            watcher.put(line)
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.handle(self, 'GET')
+
+            def do_POST(self):
+                fake.handle(self, 'POST')
+
+            def do_PATCH(self):
+                fake.handle(self, 'PATCH')
+
+            def do_PUT(self):
+                fake.handle(self, 'PUT')
+
+            def do_DELETE(self):
+                fake.handle(self, 'DELETE')
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.server.socket.listen(128)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        host = f"http://127.0.0.1:{self.server.server_address[1]}"
+        fd, self.kubeconfig = tempfile.mkstemp(suffix='.kubeconfig')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'apiVersion': 'v1',
+                'kind': 'Config',
+                'clusters': [{'name': 'fake', 'cluster': {'server': host}}],
+                'users': [{'name': 'fake', 'user': {'token': 'fake'}}],
+                'contexts': [{'name': 'fake', 'context': {'cluster': 'fake', 'user': 'fake'}}],
+                'current-context': 'fake',
+            }, f)
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.server.shutdown()
+        os.unlink(self.kubeconfig)
+
+    def handle(self, request, method):
+        url = urlparse(request.path)
+        query = parse_qs(url.query)
+
+        match = NODES.match(url.path)
+        if match:
+            key, name = 'nodes', match.group('name')
+        else:
+            match = CUSTOM.match(url.path)
+            if not match:
+                return self.respond(request, 404, {'kind': 'Status', 'code': 404})
+            key = (match.group('group'), match.group('plural'), match.group('namespace'))
+            name = match.group('name')
+
+        verb = method.lower() if name or method != 'GET' else 'list'
+        if query.get('watch', [''])[0].lower() == 'true':
+            verb = 'watch'
+        self.calls[verb] += 1
+
+        if verb == 'watch':
+            return self.watch(request, key, int(query.get('timeoutSeconds', ['30'])[0]))
+
+        with self.lock:
+            items = self.collection(key)
+
+            if verb == 'list':
+                return self.respond(request, 200, {
+                    'kind': 'List',
+                    'apiVersion': 'v1',
+                    'metadata': {'resourceVersion': str(self.resource_version)},
+                    'items': list(items.values()),
+                })
+
+            body = {}
+            length = int(request.headers.get('Content-Length', 0))
+            if length:
+                body = json.loads(request.rfile.read(length))
+
+            if verb != 'get':
+                self.resource_version += 1
+            if verb == 'post':
+                body.setdefault('metadata', {})['resourceVersion'] = str(self.resource_version)
+                items[body['metadata']['name']] = body
+                self.notify(key, 'ADDED', body)
+                return self.respond(request, 201, body)
+            if name not in items:
+                return self.respond(request, 404, {'kind': 'Status', 'code': 404})
+            if verb == 'get':
+                return self.respond(request, 200, items[name])
+            if verb == 'delete':
+                self.notify(key, 'DELETED', items[name])
+                return self.respond(request, 200, items.pop(name))
+            if verb == 'patch':
+                merge_patch(items[name], body)
+            elif verb == 'put':
+                items[name] = body
+            items[name]['metadata']['resourceVersion'] = str(self.resource_version)
+            self.notify(key, 'MODIFIED', items[name])
+            return self.respond(request, 200, items[name])
+
+    def watch(self, request, key, timeout):
+        events = queue.Queue()
+        with self.lock:
+            self.watchers.setdefault(key, set()).add(events)
+
+        try:
+            request.send_response(200)
+            request.send_header('Content-Type', 'application/json')
+            request.send_header('Transfer-Encoding', 'chunked')
+            request.end_headers()
+
+            deadline = time.monotonic() + timeout
+            while not self.stopped.is_set() and time.monotonic() < deadline:
+                try:
+                    line = events.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                request.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                request.wfile.flush()
+            request.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.lock:
+                self.watchers[key].discard(events)
+
+    def respond(self, request, status, body):
+        data = json.dumps(body).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
@@ -0,0 +1,50 @@
+"""
+Stub Argo server: answers every request with a small JSON document after
+reading the whole body, like the Argo API server does for submissions.
+"""
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubArgo():
+
+    def __init__(self):
+        self.server = None
+        self.port = None
+
+    def start(self):
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def respond(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length) if length else b""
+
+                data = json.dumps({
+                    'metadata': {'name': 'stub'},
+                    'received': len(body),
+                }).encode()
+                self.send_response(200 if self.command != 'POST' else 201)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = respond
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.server.socket.listen(128)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
@@ -0,0 +1,136 @@
+"""
+Synthetic WorkflowWorkers catalogues, cluster nodes and Argo workflows.
+"""
+import random
+
+
+WORKER_LABEL = 'nebulouscloud.eu/workflow-worker-node'
+
+
+def worker_sizes(count):
+    """
+    Returns ``count`` WorkflowWorkers objects with growing cpu and memory.
+    """
+    return [
+        {
+            'apiVersion': 'workflow.io/v1',
+            'kind': 'WorkflowWorkers',
+            'metadata': {'name': f"size-{i:03d}"},
+            'spec': {
+                'cpu': str(1 + i // 4),
+                'memory': f"{2 + i}Gi",
+            },
+        }
+        for i in range(count)
+    ]
+
+
+def nodes(count, sizes, seed=0):
+    """
+    Returns ``count`` schedulable worker nodes, each large enough for one of
+    the given WorkflowWorkers sizes.
+    """
+    rng = random.Random(seed)
+
+    result = []
+    for i in range(count):
+        spec = rng.choice(sizes)['spec']
+        result.append({
+            'apiVersion': 'v1',
+            'kind': 'Node',
+            'metadata': {
+                'name': f"worker-ip-10-0-{i // 256}-{i % 256}",
+                'labels': {WORKER_LABEL: 'true'},
+            },
+            'spec': {'unschedulable': False},
+            'status': {
+                'capacity': {
+                    'cpu': spec['cpu'],
+                    'memory': spec['memory'],
+                },
+            },
+        })
+    return result
+
+
+def workflow(templates, seed=0, name='synthetic'):
+    """
+    Returns an Argo workflow submission with ``templates`` script and
+    container templates of random sizes, in the shape the proxy receives.
+    """
+    rng = random.Random(seed)
+
+    steps = []
+    for i in range(templates):
+        resources = {
+            'requests': {
+                'cpu': f"{rng.choice([100, 250, 500, 1000])}m",
+                'memory': f"{rng.choice([128, 256, 512, 1024])}Mi",
+            },
+            'limits': {
+                'cpu': str(rng.choice([1, 2])),
+                'memory': f"{rng.choice([1, 2])}Gi",
+            },
+        }
+        kind = 'script' if i % 2 else 'container'
+        steps.append({
+            'name': f"step-{i}",
+            kind: {
+                'image': 'python:3.10',
+                'command': ['python'],
+                'resources': resources,
+            },
+        })
+
+    return {
+        'workflow': {
+            'metadata': {
+                'generateName': f"{name}-",
+                'labels': {'workflow': name},
+            },
+            'spec': {
+                'entrypoint': 'main',
+                'templates': [{
+                    'name': 'main',
+                    'dag': {
+                        'tasks': [
+                            {'name': step['name'], 'template': step['name']}
+                            for step in steps
+                        ],
+                    },
+                }] + steps,
+            },
+        },
+    }
+
+
+def running_workflow(nodes_count, workersize, seed=0, name='running'):
+    """
+    Returns a Running Argo workflow object with a DAG node and
+    ``nodes_count`` pod nodes in random phases.
+    """
+    rng = random.Random(seed)
+
+    children = [f"{name}-{i}" for i in range(nodes_count)]
+    status_nodes = {
+        name: {'type': 'DAG', 'phase': 'Running', 'children': children},
+    }
+    for child in children:
+        status_nodes[child] = {
+            'type': 'Pod',
+            'phase': rng.choice(['Pending', 'Pending', 'Pending', 'Running']),
+        }
+
+    return {
+        'apiVersion': 'argoproj.io/v1alpha1',
+        'kind': 'Workflow',
+        'metadata': {
+            'name': name,
+            'namespace': 'argo',
+            'labels': {
+                'workflow.nebulouscloud.eu/workersize': workersize,
+                'workflows.argoproj.io/phase': 'Running',
+            },
+        },
+        'status': {'phase': 'Running', 'nodes': status_nodes},
+    }
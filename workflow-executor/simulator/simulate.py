@@ -0,0 +1,451 @@
+"""
+Discrete-event simulator of the workflow scheduler, runnable without a cluster.
+
+Replays a trace of workflow submissions, as recorded by the proxy with
+TRACE_FILE, against a node inventory and a WorkflowWorkers catalogue. The
+submissions are sized and admitted by the scheduler's own code and the nodes
+labelled by the node assignment strategies; the pods of each workflow then
+run, one after the other or all at once with --parallel, on the nodes of
+their workersize. Every combination of sizing mode and assignment strategy is
+reported with its queue time, CPU utilization per workersize and makespan.
+
+    python workflow-executor/simulator/simulate.py --trace FILE
+        --catalogue FILE|NAME=CPU/MEMORY[,...] --nodes FILE|COUNTxCPU/MEMORY[,...]
+        [--sizing workflow,template] [--assignment largest,demand]
+        [--duration 60] [--parallel] [--json]
+
+Catalogue and node files are JSON or YAML, either lists or Kubernetes List
+objects, e.g. the output of ``kubectl get workflowworkers,nodes -o json``.
+Trace records may carry a ``duration`` in seconds, otherwise every workflow
+runs for --duration.
+"""
+import argparse
+import copy
+import heapq
+import itertools
+import json
+import logging
+import os
+import sys
+
+from collections import Counter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+import codec
+import yaml
+
+from admission import AdmissionPolicy
+from assignment import STRATEGIES, strategy
+from node_controller import NODE_REBALANCE_PERIOD, WORKER_NODE_LABEL
+from quantity import parse_cpu_to_millicores, parse_memory_to_bytes
+from scheduler import Scheduler
+from sizing import template_resources
+from utils import filter_nodes_by_label
+from worker_catalogue import SizeIndex, build_index
+from workflow_cache import WORKERSIZE_LABEL
+
+
+class Node():
+
+    def __init__(self, name, cpu, memory):
+        self.name = name
+        self.cpu = cpu
+        self.memory = memory
+        self.free_cpu = cpu
+        self.free_memory = memory
+        self.workersize = None
+
+    def fits(self, pod):
+        return pod.cpu <= self.free_cpu and pod.memory <= self.free_memory
+
+
+class Pod():
+
+    def __init__(self, workflow, cpu, memory, workersize, colocated):
+        self.workflow = workflow
+        self.cpu = cpu
+        self.memory = memory
+        self.workersize = workersize
+        self.colocated = colocated
+        self.ready = None
+        self.node = None
+
+
+class Workflow():
+
+    def __init__(self, sequence, submitted, priority, admission, pods, duration):
+        self.sequence = sequence
+        self.submitted = submitted
+        self.priority = priority
+        self.admission = admission
+        self.pods = pods
+        self.duration = duration
+        self.next = 0
+        self.done = 0
+        self.waited = 0.0
+        self.node = None
+        self.finished = None
+
+
+def load(path):
+    with open(path) as f:
+        document = yaml.safe_load(f)
+    if isinstance(document, dict):
+        document = document.get('items') or []
+    return document
+
+
+def catalogue_items(value):
+    """
+    Returns WorkflowWorkers objects from a file or from NAME=CPU/MEMORY,...
+    """
+    if os.path.exists(value):
+        return [item for item in load(value) if item.get('kind', 'WorkflowWorkers') == 'WorkflowWorkers']
+
+    items = []
+    for entry in value.split(','):
+        name, resources = entry.split('=')
+        cpu, memory = resources.split('/')
+        items.append({'metadata': {'name': name.strip()}, 'spec': {'cpu': cpu, 'memory': memory}})
+    return items
+
+
+def inventory(value):
+    """
+    Returns the worker nodes from a file of Nodes or of {name, cpu, memory},
+    or from COUNTxCPU/MEMORY,...
+    """
+    if not os.path.exists(value):
+        nodes = []
+        for entry in value.split(','):
+            count, resources = entry.split('x')
+            cpu, memory = resources.split('/')
+            for _ in range(int(count)):
+                nodes.append(Node(
+                    f"node-{len(nodes)}",
+                    parse_cpu_to_millicores(cpu),
+                    parse_memory_to_bytes(memory),
+                ))
+        return nodes
+
+    nodes = []
+    for item in load(value):
+        if 'status' in item:
+            metadata = item.get('metadata') or {}
+            if item.get('kind', 'Node') != 'Node' or (item.get('spec') or {}).get('unschedulable') or \
+                not filter_nodes_by_label(metadata.get('labels') or {}, WORKER_NODE_LABEL):
+                    continue
+            name, capacity = metadata.get('name'), item['status'].get('capacity') or {}
+        else:
+            name, capacity = item.get('name'), item
+        nodes.append(Node(
+            name,
+            parse_cpu_to_millicores(capacity.get('cpu')),
+            parse_memory_to_bytes(capacity.get('memory')),
+        ))
+    return nodes
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Simulation():
+    """
+    One replay of ``trace`` with a sizing mode and an assignment strategy.
+
+    Submissions go through Scheduler.admit_workflow with an AdmissionPolicy
+    reading the simulated node counts and demand; the policy never holds,
+    since waiting for capacity is what the pending pods already model. The
+    nodes are labelled by the strategy at the start and, for the strategies
+    following the demand, every ``rebalance_period`` simulated seconds. Pods
+    start on the node of their workersize with the most free CPU, the
+    co-located pods of a workflow on the node of its first pod, and labels
+    changing under running pods do not evict them.
+    """
+
+    def __init__(
+            self,
+            trace,
+            catalogue,
+            nodes,
+            sizing_mode = 'workflow',
+            assignment = 'largest',
+            duration = 60.0,
+            parallel = False,
+            rebalance_period = NODE_REBALANCE_PERIOD,
+        ):
+
+        self.trace = trace
+        self.catalogue = SizeIndex(build_index(catalogue))
+        self.nodes = [Node(node.name, node.cpu, node.memory) for node in nodes]
+        self.sizing_mode = sizing_mode
+        self.assignment = strategy(assignment)
+        self.duration = duration
+        self.parallel = parallel
+        self.rebalance_period = rebalance_period
+
+        self.scheduler = Scheduler.offline(
+            self.catalogue,
+            AdmissionPolicy(self.catalogue, self.workers, self.demand, hold_timeout=0, reservation_ttl=0),
+            sizing_mode,
+        )
+
+        self.now = 0.0
+        self.events = []
+        self.sequence = itertools.count()
+        self.pending = []
+        self.workflows = []
+        self.busy = Counter()
+        self.capacity = Counter()
+
+    def workers(self):
+        return Counter(node.workersize for node in self.nodes if node.workersize)
+
+    def demand(self):
+        """
+        Workflows with pods waiting for a node, per workersize, as
+        WorkflowCounters.demand counts them in a cluster.
+        """
+        return Counter(
+            workflow.admission.workersize
+            for workflow in {pod.workflow for _, _, pod in self.pending}
+            if workflow.admission.workersize
+        )
+
+    def run(self):
+        if not self.trace:
+            return self.report()
+        start = min(record['time'] for record in self.trace)
+
+        for record in self.trace:
+            self.schedule(record['time'] - start, self.submit, record)
+
+        self.relabel()
+        if self.assignment.uses_demand:
+            self.schedule(self.rebalance_period, self.rebalance)
+
+        while self.events:
+            when, _, action, argument = heapq.heappop(self.events)
+            self.advance(when)
+            action(argument)
+            self.place()
+
+        return self.report()
+
+    def schedule(self, delay, action, argument=None):
+        heapq.heappush(self.events, (self.now + delay, next(self.sequence), action, argument))
+
+    def advance(self, when):
+        """
+        Moves the clock, accounting the CPU capacity of every workersize.
+        """
+        elapsed = when - self.now
+        for node in self.nodes:
+            if node.workersize:
+                self.capacity[node.workersize] += node.cpu * elapsed
+        self.now = when
+
+    def relabel(self):
+        """
+        Labels the nodes as the strategy says and tells whether any moved.
+        """
+        labels = self.assignment.assign(
+            {node.name: (node.cpu, node.memory) for node in self.nodes},
+            self.catalogue,
+            self.demand() if self.assignment.uses_demand else None,
+            {node.name: node.workersize for node in self.nodes},
+        )
+
+        moved = False
+        for node in self.nodes:
+            moved |= node.workersize != labels.get(node.name)
+            node.workersize = labels.get(node.name)
+        return moved
+
+    def rebalance(self, _):
+        # Once the trace is over, keep going only while the labels move.
+        moved = self.relabel()
+        if self.events or (self.pending and moved):
+            self.schedule(self.rebalance_period, self.rebalance)
+
+    def submit(self, record):
+        workflow, admission = self.scheduler.admit_workflow(
+            {'workflow': copy.deepcopy(record['workflow'])}
+        )
+
+        pods = []
+        for template in workflow['workflow'].get('spec', {}).get('templates') or ():
+            resources = template_resources(template)
+            if resources is not None:
+                pods.append((
+                    *resources,
+                    (template.get('nodeSelector') or {}).get(WORKERSIZE_LABEL),
+                    'podAffinity' in (template.get('affinity') or {}),
+                ))
+
+        simulated = Workflow(
+            len(self.workflows),
+            self.now,
+            workflow['workflow'].get('spec', {}).get('priority') or 0,
+            admission,
+            [],
+            float(record.get('duration') or self.duration),
+        )
+        simulated.pods = [Pod(simulated, *pod) for pod in pods]
+        self.workflows.append(simulated)
+
+        if not simulated.pods:
+            simulated.finished = self.now
+            return
+        self.release(simulated)
+
+    def release(self, workflow):
+        """
+        Makes the next pods of the workflow ready to be placed.
+        """
+        count = len(workflow.pods) if self.parallel else 1
+        for pod in workflow.pods[workflow.next:workflow.next + count]:
+            pod.ready = self.now
+            heapq.heappush(self.pending, ((-workflow.priority, workflow.submitted), next(self.sequence), pod))
+        workflow.next += count
+
+    def place(self):
+        waiting = []
+        while self.pending:
+            entry = heapq.heappop(self.pending)
+            node = self.node_for(entry[2])
+            if node is None:
+                waiting.append(entry)
+            else:
+                self.start(entry[2], node)
+        for entry in waiting:
+            heapq.heappush(self.pending, entry)
+
+    def node_for(self, pod):
+        if pod.colocated and pod.workflow.node is not None:
+            return pod.workflow.node if pod.workflow.node.fits(pod) else None
+
+        candidates = [
+            node for node in self.nodes
+            if node.workersize and (pod.workersize is None or node.workersize == pod.workersize)
+            and node.fits(pod)
+        ]
+        return max(candidates, key=lambda node: (node.free_cpu, node.free_memory), default=None)
+
+    def start(self, pod, node):
+        workflow = pod.workflow
+        # Queue time: the waits of the steps add up, parallel pods overlap.
+        if self.parallel:
+            workflow.waited = max(workflow.waited, self.now - pod.ready)
+        else:
+            workflow.waited += self.now - pod.ready
+        if workflow.node is None:
+            workflow.node = node
+
+        pod.node = node
+        node.free_cpu -= pod.cpu
+        node.free_memory -= pod.memory
+
+        duration = workflow.duration / len(workflow.pods) if not self.parallel else workflow.duration
+        self.busy[node.workersize] += pod.cpu * duration
+        self.schedule(duration, self.finish, pod)
+
+    def finish(self, pod):
+        pod.node.free_cpu += pod.cpu
+        pod.node.free_memory += pod.memory
+
+        workflow = pod.workflow
+        workflow.done += 1
+        if workflow.done == len(workflow.pods):
+            workflow.finished = self.now
+        elif not self.parallel:
+            self.release(workflow)
+
+    def report(self):
+        finished = [workflow for workflow in self.workflows if workflow.finished is not None]
+        waited = [workflow.waited for workflow in finished]
+
+        return {
+            'sizing': self.sizing_mode,
+            'assignment': self.assignment.name,
+            'workflows': len(self.workflows),
+            'unfinished': len(self.workflows) - len(finished),
+            'admissions': dict(Counter(workflow.admission.action for workflow in self.workflows)),
+            'queue_mean': sum(waited) / len(waited) if waited else 0.0,
+            'queue_p50': percentile(waited, 0.5),
+            'queue_p95': percentile(waited, 0.95),
+            'queue_max': max(waited, default=0.0),
+            'makespan': max((workflow.finished for workflow in finished), default=0.0),
+            'utilization': {
+                workersize: self.busy[workersize] / capacity
+                for workersize, capacity in sorted(self.capacity.items()) if capacity
+            },
+        }
+
+
+def print_report(results):
+    print(
+        f"{'sizing':<10} {'assignment':<10} {'workflows':>9} {'unfinished':>10} "
+        f"{'queue mean s':>12} {'p50 s':>9} {'p95 s':>9} {'max s':>9} {'makespan s':>11}  utilization"
+    )
+    for result in results:
+        utilization = ' '.join(
+            f"{workersize}={value:.0%}" for workersize, value in result['utilization'].items()
+        )
+        print(
+            f"{result['sizing']:<10} {result['assignment']:<10} {result['workflows']:>9} "
+            f"{result['unfinished']:>10} {result['queue_mean']:>12.1f} {result['queue_p50']:>9.1f} "
+            f"{result['queue_p95']:>9.1f} {result['queue_max']:>9.1f} {result['makespan']:>11.1f}  {utilization}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--trace', required=True, help="JSON lines recorded by the proxy with TRACE_FILE")
+    parser.add_argument('--catalogue', required=True, help="WorkflowWorkers file or NAME=CPU/MEMORY,...")
+    parser.add_argument('--nodes', required=True, help="nodes file or COUNTxCPU/MEMORY,...")
+    parser.add_argument('--sizing', default='workflow', help="comma separated sizing modes")
+    parser.add_argument('--assignment', default='largest', help=f"comma separated of {', '.join(STRATEGIES)}")
+    parser.add_argument('--duration', type=float, default=60.0, help="seconds a workflow runs without one in the trace")
+    parser.add_argument('--parallel', action='store_true', help="run the pods of a workflow all at once")
+    parser.add_argument('--rebalance-period', type=float, default=NODE_REBALANCE_PERIOD, help="seconds between demand rebalances")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    parser.add_argument('--verbose', action='store_true', help="keep the scheduler output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    with open(args.trace, 'rb') as f:
+        trace = [codec.loads(line) for line in f if line.strip()]
+    catalogue = catalogue_items(args.catalogue)
+    nodes = inventory(args.nodes)
+
+    results = [
+        Simulation(
+            trace,
+            catalogue,
+            nodes,
+            sizing_mode=sizing_mode,
+            assignment=assignment,
+            duration=args.duration,
+            parallel=args.parallel,
+            rebalance_period=args.rebalance_period,
+        ).run()
+        for sizing_mode in args.sizing.split(',')
+        for assignment in args.assignment.split(',')
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,36 +2,59 @@ import logging
 import http.server
 import socketserver
 import sys
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
-import json
-import time
-import threading
 import os
+from admission import ADMISSION_HEADER
+from metrics import PROXY_IN_FLIGHT, PROXY_STAGE_SECONDS, PROXY_STAGES, UPSTREAM_RESPONSES, start_metrics_server
+from rewrite import dry_run_submissions, is_readiness_probe, readiness, rewrite_submission, should_dry_run, should_rewrite
 from scheduler import Scheduler
+from utils import CHUNK_SIZE, BodyStream, end_to_end_headers, iter_chunked_body, read_body, setup_logging
 
 PROXY_PORT = int(os.environ.get('PROXY_PORT', 8080))
 PROXY_ADDRESS = os.environ.get('PROXY_ADDRESS', "0.0.0.0")
 TARGET_SERVER = os.environ.get('TARGET_SERVER', "http://0.0.0.0")
 TARGET_PORT = int(os.environ.get('TARGET_PORT', 2746))
+PROXY_MODE = os.environ.get('PROXY_MODE', "threaded")
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get('UPSTREAM_MAX_CONNECTIONS', 100))
+UPSTREAM_TIMEOUT = int(os.environ.get('UPSTREAM_TIMEOUT', 15))
+PROXY_MAX_CONCURRENCY = int(os.environ.get('PROXY_MAX_CONCURRENCY', 256))
+PROXY_MAX_PENDING = int(os.environ.get('PROXY_MAX_PENDING', 1024))
+
+setup_logging()
+log = logging.getLogger(__name__)
+
+IN_FLIGHT = PROXY_IN_FLIGHT.labels('threaded')
+STAGES = {stage: PROXY_STAGE_SECONDS.labels('threaded', stage) for stage in PROXY_STAGES}
 
-print(f"--- Starting Scheduler ---", flush=True)
+log.info("--- Starting Scheduler ---")
 scheduler = Scheduler(
     TARGET_SERVER,
     TARGET_PORT,
 )
 
+upstream = requests.Session()
+upstream.mount('http://', HTTPAdapter(pool_maxsize=UPSTREAM_MAX_CONNECTIONS))
+upstream.mount('https://', HTTPAdapter(pool_maxsize=UPSTREAM_MAX_CONNECTIONS))
+
 class ProxyHandler(http.server.BaseHTTPRequestHandler):
     """
     This handler intercepts client requests, forwards them to the TARGET_SERVER,
     modifies specific responses, and sends them back to the client.
     """ 
 
+    disable_nagle_algorithm = True
+
     def do_GET(self):
         """Handle GET requests."""
-        self.send_response(301)
-        self.send_header('Location',f"{TARGET_SERVER}:{TARGET_PORT}")
-        self.end_headers()
+        self._forward_and_modify_request("GET")
+
+
+    def do_HEAD(self):
+        """Handle HEAD requests."""
+        self._forward_and_modify_request("HEAD")
 
 
     def do_POST(self):
@@ -39,98 +62,229 @@ class ProxyHandler(http.server.BaseHTTPRequestHandler):
         self._forward_and_modify_request("POST")
 
 
+    def do_PUT(self):
+        """Handle PUT requests."""
+        self._forward_and_modify_request("PUT")
+
+
+    def do_PATCH(self):
+        """Handle PATCH requests."""
+        self._forward_and_modify_request("PATCH")
+
+
+    def do_DELETE(self):
+        """Handle DELETE requests."""
+        self._forward_and_modify_request("DELETE")
+
+
+    def do_OPTIONS(self):
+        """Handle OPTIONS requests."""
+        self._forward_and_modify_request("OPTIONS")
+
+
     def _forward_and_modify_request(self, method):
         """
         The core logic for forwarding requests and modifying responses.
+        Workflow submissions are buffered and rewritten; every other request,
+        whatever its method, takes the fast path: its body is streamed to the
+        target untouched and the response is streamed back with its headers.
         """
+        if is_readiness_probe(method, self.path):
+            self.__respond(*readiness(scheduler), body=method != 'HEAD')
+            return
+
+        with IN_FLIGHT.track_inprogress(), STAGES['total'].time():
+            self.__forward(method)
+
+    def __forward(self, method):
         target_url = f"{TARGET_SERVER}:{TARGET_PORT}{self.path}"
-        print(f"Proxying request: {method} {self.path} -> {target_url}", flush=True)
+        log.debug("Proxying request", extra={'method': method, 'path': self.path, 'target': target_url})
 
-        request_headers = dict(self.headers)
+        request_headers = {
+            key: value for key, value in end_to_end_headers(self.headers)
+            if key.lower() != 'content-length'
+        }
         request_body = None
 
         try:
-            content_length = int(request_headers.get('Content-Length', 0))
-            request_body = self.rfile.read(content_length)
+            if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+                request_body = iter_chunked_body(self.rfile)
+            else:
+                content_length = int(self.headers.get('Content-Length', 0))
+                if content_length < 0:
+                    raise ValueError(content_length)
+                if content_length:
+                    request_body = BodyStream(self.rfile, content_length)
         except (TypeError, ValueError):
             self.send_error(400, "Invalid Content-Length header")
             return
         
-        print(f"Request address: {TARGET_SERVER}:{TARGET_PORT}", flush=True)
         request_headers["Host"] = TARGET_SERVER.split('//')[1].split('/')[0]
 
+        headers_sent = False
         try:
+            if should_dry_run(method, self.path):
+                self.__dry_run(request_body)
+                return
 
-            modified_body = ""
+            admission = None
             content_type = request_headers.get("Content-Type", "")
-            if method == 'POST' and \
-                self.path == '/api/v1/workflows/argo' and \
-                'application/json' in content_type:
-                
-                modified_body = scheduler.schedule_workflow(
-                    json.loads(
-                        request_body.decode('utf8')
+            if should_rewrite(method, self.path, content_type):
+                with STAGES['read_body'].time():
+                    request_body = read_body(request_body)
+                with STAGES['rewrite'].time():
+                    request_body, admission = rewrite_submission(
+                        scheduler,
+                        request_body,
                     )
-                )
-
-                modified_body = json.dumps(
-                    modified_body
-                ).encode()
 
-            real_response = requests.post(
-                target_url,
-                headers=request_headers,
-                data=modified_body,
-                timeout=15,
-            )
-            
-            self.send_response(real_response.status_code)
-            
+            with STAGES['upstream'].time():
+                real_response = upstream.request(
+                    method,
+                    target_url,
+                    headers=request_headers,
+                    data=request_body,
+                    stream=True,
+                    timeout=UPSTREAM_TIMEOUT,
+                )
+            UPSTREAM_RESPONSES.labels('threaded', method, real_response.status_code).inc()
 
-            self.end_headers()
+            try:
+                with STAGES['response'].time():
+                    self.log_request(real_response.status_code)
+                    self.send_response_only(real_response.status_code)
+                    for key, value in end_to_end_headers(real_response.raw.headers):
+                        self.send_header(key, value)
+                    if admission:
+                        self.send_header(ADMISSION_HEADER, str(admission))
+                    self.end_headers()
+                    headers_sent = True
 
-            self.wfile.write(real_response.content)
-            # self.wfile.close()
+                    for chunk in real_response.raw.stream(CHUNK_SIZE, decode_content=False):
+                        self.wfile.write(chunk)
+            finally:
+                real_response.close()
 
         except BrokenPipeError:
-            print(f"Broken Pipe Error: Client {self.client_address} disconnected prematurely.", flush=True)
+            log.info("Client disconnected prematurely", extra={'client': self.client_address[0]})
 
         except RequestException as e:
+            UPSTREAM_RESPONSES.labels('threaded', method, 'error').inc()
             error_message = f"Proxy could not connect to target server: {e}"
-            print(error_message, flush=True)
-            self.send_error(502, "Bad Gateway", error_message)
+            log.warning(error_message)
+            if not headers_sent:
+                self.send_error(502, "Bad Gateway", error_message)
         except Exception as e:
-            print(f"An unexpected error occurred: {e}", flush=True)
-            if not self.headers_sent:
-                self.send_error(500, "Internal Server Error", error_message)
-
-def publish_metrics(scheduler):
-    print("--- Publishing metrics ---", flush=True)
-    while True:
-        time.sleep(5)
+            log.exception("An unexpected error occurred")
+            if not headers_sent:
+                self.send_error(500, "Internal Server Error", str(e))
+
+    def __dry_run(self, request_body):
+        """
+        Answers POST /schedule locally with the scheduling of the posted
+        submissions, without forwarding them.
+        """
+        with STAGES['read_body'].time():
+            request_body = read_body(request_body)
+        with STAGES['rewrite'].time():
+            status, body = dry_run_submissions(scheduler, request_body)
+
+        with STAGES['response'].time():
+            self.__respond(status, body)
+
+    def __respond(self, status, content, body=True):
+        """
+        Sends a JSON response produced by the proxy itself.
+        """
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if body:
+            self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args, extra={'client': self.client_address[0]})
+
+class ProxyServer(socketserver.ThreadingTCPServer):
+    """
+    Threaded proxy server. The default listen backlog of 5 resets clients
+    as soon as a few dozen connect at once, so it is PROXY_BACKLOG. At most
+    ``max_threads`` (PROXY_MAX_CONCURRENCY) requests are handled at once,
+    the next connections wait in the backlog, and half of these threads
+    may be taken by the submissions held by the admission policy.
+    """
+    daemon_threads = True
+    request_queue_size = int(os.environ.get('PROXY_BACKLOG', 128))
+    max_threads = PROXY_MAX_CONCURRENCY
+
+    def __init__(self, *args, **kwargs):
+        self.threads = threading.BoundedSemaphore(self.max_threads)
+        super().__init__(*args, **kwargs)
+
+    def process_request(self, request, client_address):
+        self.threads.acquire()
         try:
-            scheduler.check_publish_metrics()
-        except Exception as e:
-            print(f"Error publishing metrics: {e}", flush=True)
-            
+            super().process_request(request, client_address)
+        except Exception:
+            self.threads.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.threads.release()
+
 def run_proxy():
     """
     Starts the proxy server.
     """
-    httpd = socketserver.ThreadingTCPServer((PROXY_ADDRESS, PROXY_PORT), ProxyHandler)
+    if PROXY_MODE == "async":
+        return run_async_proxy()
+
+    httpd = ProxyServer((PROXY_ADDRESS, PROXY_PORT), ProxyHandler)
+    scheduler.limit_held(max(1, ProxyServer.max_threads // 2))
 
-    print(f"--- Starting HTTP Proxy Server on port {PROXY_PORT} ---", flush=True)
-    print(f"--- Forwarding requests to: {TARGET_SERVER}:{TARGET_PORT} ---", flush=True)
+    log.info(f"--- Starting HTTP Proxy Server on port {PROXY_PORT} ---")
+    log.info(f"--- Forwarding requests to: {TARGET_SERVER}:{TARGET_PORT} ---")
     
+    start_metrics_server()
+    scheduler.start()
     try:
-        metrics = threading.Thread(target=publish_metrics, args=(scheduler,))
-        metrics.start()
         httpd.serve_forever()
     except KeyboardInterrupt:
-        print("\n--- Shutting down the proxy server. ---", flush=True)
+        log.info("--- Shutting down the proxy server. ---")
         httpd.shutdown()
         httpd.server_close()
-        metrics.join(timeout=2)
+    finally:
+        scheduler.stop()
+
+def run_async_proxy():
+    """
+    Starts the asyncio proxy server (PROXY_MODE=async).
+    """
+    from async_proxy import AsyncProxy
+
+    proxy = AsyncProxy(
+        scheduler,
+        TARGET_SERVER,
+        TARGET_PORT,
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_concurrency=PROXY_MAX_CONCURRENCY,
+        max_pending=PROXY_MAX_PENDING,
+        timeout=UPSTREAM_TIMEOUT,
+    )
+
+    log.info(f"--- Starting async HTTP Proxy Server on port {PROXY_PORT} ---")
+    log.info(f"--- Forwarding requests to: {TARGET_SERVER}:{TARGET_PORT} ---")
+
+    start_metrics_server()
+    scheduler.start()
+    try:
+        proxy.run(PROXY_ADDRESS, PROXY_PORT)
+    finally:
+        scheduler.stop()
         
 
 if __name__ == "__main__":
@@ -0,0 +1,221 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from collections import Counter, deque, namedtuple
+
+
+log = logging.getLogger(__name__)
+
+ADMISSION_HEADER = 'X-Workflow-Admission'
+
+ADMISSION_MAX_BACKLOG = float(os.environ.get('ADMISSION_MAX_BACKLOG', 1))
+# Larger sizes a submission may be promoted to, none by default.
+ADMISSION_MAX_PROMOTION = int(os.environ.get('ADMISSION_MAX_PROMOTION', 0))
+ADMISSION_HOLD_TIMEOUT = float(os.environ.get('ADMISSION_HOLD_TIMEOUT', 0))
+# Capped by the proxy at the threads it can park, see limit_held.
+ADMISSION_MAX_HELD = int(os.environ.get('ADMISSION_MAX_HELD', 256))
+ADMISSION_RESERVATION_TTL = float(os.environ.get('ADMISSION_RESERVATION_TTL', 10))
+
+
+class Admission(namedtuple('Admission', ['action', 'workersize', 'requested', 'held'])):
+    """
+    Decision taken for a workflow submission:
+    - admit: pinned to the smallest size it fits.
+    - promote: pinned to a larger size because the smallest one is saturated.
+    - overflow: pinned to the smallest size although it is saturated, once
+      the hold timed out or the hold queue is full.
+    - hold: dry runs only, the submission would be held.
+    - unschedulable: no size fits, forwarded without a nodeSelector.
+    - error: the workflow could not be read, forwarded untouched.
+    ``held`` is the number of seconds the submission waited in the queue.
+    """
+
+    def __str__(self):
+        value = self.action
+        if self.workersize:
+            value += f"; workersize={self.workersize}"
+        if self.requested and self.requested != self.workersize:
+            value += f"; requested={self.requested}"
+        if self.held:
+            value += f"; held={self.held:.3f}"
+        return value
+
+
+class AdmissionPolicy():
+    """
+    Chooses the workersize of a submission from the live capacity and
+    backlog of the pools. A pool is saturated when it has no node or when
+    its backlog (Pending workflows, Running workflows waiting for pods and
+    the submissions admitted in the last ``reservation_ttl`` seconds, which
+    the workflow cache may not show yet) reaches ``max_backlog`` workflows
+    per node.
+
+    A submission goes to the smallest size it fits, or to one of the next
+    ``max_promotion`` larger sizes if the smallest is saturated. If they
+    all are, the submission is held, by workflow priority and then in
+    arrival order, until one frees up or ``hold_timeout`` expires. Holding
+    is disabled with a zero timeout. A held submission keeps its proxy
+    thread, so at most ``max_held`` are held and the others overflow.
+    """
+
+    def __init__(
+            self,
+            worker_catalogue,
+            workers,
+            demand,
+            max_backlog = ADMISSION_MAX_BACKLOG,
+            max_promotion = ADMISSION_MAX_PROMOTION,
+            hold_timeout = ADMISSION_HOLD_TIMEOUT,
+            max_held = ADMISSION_MAX_HELD,
+            reservation_ttl = ADMISSION_RESERVATION_TTL,
+        ):
+
+        self.worker_catalogue = worker_catalogue
+        self.workers = workers
+        self.demand = demand
+
+        self.max_backlog = max_backlog
+        self.max_promotion = max_promotion
+        self.hold_timeout = hold_timeout
+        self.max_held = max_held
+        self.reservation_ttl = reservation_ttl
+
+        self.condition = threading.Condition()
+        self.reservations = deque()
+        self.reserved = Counter()
+        self.held = {}
+        self.sequence = itertools.count()
+
+    def attach(self, informer):
+        """
+        Wakes the held submissions up on every workflow event.
+        """
+        informer.add_handler(
+            lambda x: self.notify(),
+            lambda x, y: self.notify(),
+            lambda x: self.notify(),
+        )
+        return self
+
+    def limit_held(self, threads):
+        """
+        Caps ``max_held`` at ``threads``, the number of proxy threads the
+        held submissions may take.
+        """
+        if self.max_held > threads:
+            self.max_held = threads
+            if self.hold_timeout > 0:
+                log.info(f"Holding at most {threads} submissions, the thread budget of the proxy.")
+
+    def notify(self):
+        with self.condition:
+            if self.held:
+                self.condition.notify_all()
+
+    def admit(self, cpu, memory, priority=0, dry_run=False, catalogue=None, reserved=None):
+        """
+        Returns the Admission of a workflow needing ``cpu`` millicores and
+        ``memory`` bytes, blocking while it is held. A dry run neither holds
+        nor reserves anything and tells what would be decided now, from
+        ``catalogue`` (a SizeIndex) if given. The dry runs of a batch share
+        ``reserved``, a Counter of the hypothetical reservations of the
+        ones decided before, which counts as backlog and gets the decision.
+        """
+        catalogue = catalogue or self.worker_catalogue
+        candidates = catalogue.fitting(cpu, memory, self.max_promotion + 1)
+        if not candidates:
+            return Admission('unschedulable', None, None, 0)
+
+        requested = candidates[0].name
+        started = time.monotonic()
+
+        with self.condition:
+            size = self.__free(candidates, reserved)
+            if dry_run:
+                admission = self.__dry_run(size, candidates[0], requested)
+                if reserved is not None:
+                    reserved[admission.workersize] += 1
+                return admission
+
+            if size is not None and not self.held.get(requested):
+                return self.__admit(size, requested)
+
+            if self.hold_timeout <= 0 or sum(map(len, self.held.values())) >= self.max_held:
+                return self.__admit(candidates[0], requested, action='overflow')
+
+            ticket = (-priority, next(self.sequence))
+            queue = self.held.setdefault(requested, [])
+            heapq.heappush(queue, ticket)
+            deadline = started + self.hold_timeout
+
+            try:
+                while True:
+                    if queue[0] == ticket:
+                        size = self.__free(candidates)
+                        if size is not None:
+                            return self.__admit(size, requested, time.monotonic() - started)
+
+                    now = time.monotonic()
+                    if now >= deadline:
+                        return self.__admit(candidates[0], requested, now - started, 'overflow')
+                    wait = min(deadline, self.reservations[0][0]) if self.reservations else deadline
+                    self.condition.wait(min(wait - now, 1))
+            finally:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                if not queue:
+                    del self.held[requested]
+                self.condition.notify_all()
+
+    def release(self, admission):
+        """
+        Gives back the capacity reserved by ``admission``, for a submission
+        that was not pinned to its workersize after all.
+        """
+        with self.condition:
+            for i in range(len(self.reservations) - 1, -1, -1):
+                if self.reservations[i][1] == admission.workersize:
+                    del self.reservations[i]
+                    self.reserved[admission.workersize] -= 1
+                    self.condition.notify_all()
+                    return
+
+    def __free(self, candidates, reserved=None):
+        """
+        Returns the first of the candidate sizes that is not saturated, or
+        None. ``reserved`` adds hypothetical reservations to the backlog.
+        """
+        now = time.monotonic()
+        while self.reservations and self.reservations[0][0] <= now:
+            self.reserved[self.reservations.popleft()[1]] -= 1
+
+        workers = self.workers()
+        demand = self.demand()
+
+        for size in candidates:
+            nodes = workers.get(size.name, 0)
+            backlog = demand.get(size.name, 0) + self.reserved[size.name]
+            if reserved:
+                backlog += reserved[size.name]
+            if nodes and backlog < nodes * self.max_backlog:
+                return size
+        return None
+
+    def __dry_run(self, size, smallest, requested):
+        if size is not None and not self.held.get(requested):
+            return Admission('admit' if size.name == requested else 'promote', size.name, requested, 0)
+        if self.hold_timeout <= 0 or sum(map(len, self.held.values())) >= self.max_held:
+            return Admission('overflow', smallest.name, requested, 0)
+        return Admission('hold', smallest.name, requested, 0)
+
+    def __admit(self, size, requested, held=0, action=None):
+        self.reservations.append((time.monotonic() + self.reservation_ttl, size.name))
+        self.reserved[size.name] += 1
+
+        if action is None:
+            action = 'admit' if size.name == requested else 'promote'
+        return Admission(action, size.name, requested, held)
@@ -0,0 +1,112 @@
+import os
+
+
+NODE_ASSIGNMENT = os.environ.get('NODE_ASSIGNMENT', 'largest')
+NODE_ASSIGNMENT_RESERVE = int(os.environ.get('NODE_ASSIGNMENT_RESERVE', 1))
+
+
+def apportion(total, weights):
+    """
+    Splits ``total`` units across the keys of ``weights`` in proportion to
+    their weight, giving the units left by the rounding to the largest
+    remainders.
+    """
+    whole = sum(weights.values())
+    if total <= 0 or whole <= 0:
+        return {key: 0 for key in weights}
+
+    shares = {key: total * weight / whole for key, weight in weights.items()}
+    result = {key: int(share) for key, share in shares.items()}
+
+    left = total - sum(result.values())
+    for key in sorted(shares, key=lambda key: result[key] - shares[key])[:left]:
+        result[key] += 1
+    return result
+
+
+class LargestFit():
+    """
+    Gives every node the largest WorkflowWorkers size it fits, whatever the
+    demand.
+    """
+
+    name = 'largest'
+    uses_demand = False
+
+    def assign(self, nodes, catalogue, demand=None, current=None):
+        """
+        ``nodes`` maps the worker node names to their (cpu, memory) capacity
+        and ``current`` to their current workersize. ``demand`` maps
+        workersizes to their number of pending workflows. Returns the
+        workersize of every node, or None for the nodes no size fits.
+        """
+        result = {}
+        for name, (cpu, memory) in nodes.items():
+            size = catalogue.largest_fitting(cpu, memory)
+            result[name] = size.name if size else None
+        return result
+
+
+class DemandAware(LargestFit):
+    """
+    Splits the nodes across the workersizes by pending demand. Every size
+    keeps ``reserve`` nodes, and the other nodes are shared in proportion
+    to the demand. Sizes are then served from the largest down, each taking
+    the fitting nodes that waste the least capacity, nodes already labelled
+    with the size first so that a steady demand does not move labels. Nodes
+    left over keep the largest size they fit.
+    """
+
+    name = 'demand'
+    uses_demand = True
+
+    def __init__(self, reserve=NODE_ASSIGNMENT_RESERVE):
+        self.reserve = reserve
+
+    def assign(self, nodes, catalogue, demand=None, current=None):
+        result = super().assign(nodes, catalogue)
+        current = current or {}
+
+        sizes = catalogue.index[0]
+        demand = {
+            size.name: demand.get(size.name, 0)
+            for size in sizes if demand and demand.get(size.name, 0) > 0
+        }
+        if not demand:
+            return result
+
+        free = {name for name, size in result.items() if size}
+        targets = apportion(len(free) - self.reserve * len(sizes), demand)
+
+        for size in reversed(sizes):
+            target = self.reserve + targets.get(size.name, 0)
+
+            candidates = sorted(
+                (
+                    current.get(name) != size.name,
+                    nodes[name][0] - size.cpu,
+                    nodes[name][1] - size.memory,
+                    name,
+                )
+                for name in free
+                if nodes[name][0] >= size.cpu and nodes[name][1] >= size.memory
+            )
+            for *_, name in candidates[:target]:
+                result[name] = size.name
+                free.discard(name)
+
+        return result
+
+
+STRATEGIES = {
+    LargestFit.name: LargestFit,
+    DemandAware.name: DemandAware,
+}
+
+
+def strategy(name=NODE_ASSIGNMENT):
+    if name not in STRATEGIES:
+        raise ValueError(
+            f"Unknown node assignment '{name}', expected one of {', '.join(STRATEGIES)}."
+        )
+    return STRATEGIES[name]()
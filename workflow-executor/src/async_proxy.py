@@ -0,0 +1,190 @@
+import asyncio
+import logging
+
+import aiohttp
+from aiohttp import web
+from concurrent.futures import ThreadPoolExecutor
+from admission import ADMISSION_HEADER
+from metrics import PROXY_IN_FLIGHT, PROXY_STAGE_SECONDS, PROXY_STAGES, UPSTREAM_RESPONSES
+from rewrite import dry_run_submissions, is_readiness_probe, readiness, rewrite_submission, should_dry_run, should_rewrite
+from utils import CHUNK_SIZE, end_to_end_headers
+
+
+log = logging.getLogger(__name__)
+
+
+class AsyncProxy():
+    """
+    asyncio based proxy engine. Upstream calls share one keep-alive
+    connection pool, at most ``max_concurrency`` requests are forwarded at a
+    time and once ``max_pending`` more are waiting new requests are refused
+    with 503 instead of piling up. Submissions are rewritten on a pool of
+    ``max_rewrites`` threads of their own, since the admission policy may
+    hold them for a while; at most half of the threads are held, so that
+    the other submissions still get sized.
+    """
+
+    def __init__(
+            self,
+            scheduler,
+            target_server,
+            target_port,
+            max_connections = 100,
+            max_concurrency = 256,
+            max_pending = 1024,
+            max_rewrites = 64,
+            timeout = 15,
+        ):
+
+        self.scheduler = scheduler
+        self.target_server = target_server
+        self.target_port = target_port
+        self.target_host = target_server.split('//')[1].split('/')[0]
+
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.timeout = timeout
+
+        self.executor = ThreadPoolExecutor(max_workers=max_rewrites)
+        self.scheduler.limit_held(max(1, max_rewrites // 2))
+
+        self.in_flight = PROXY_IN_FLIGHT.labels('async')
+        self.stages = {stage: PROXY_STAGE_SECONDS.labels('async', stage) for stage in PROXY_STAGES}
+
+        self.pending = 0
+        self.semaphore = None
+        self.session = None
+
+    async def on_startup(self, app):
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections),
+            # Like the requests timeout of the threaded proxy, a bound on
+            # connecting and on each read, not on the whole exchange:
+            # streamed responses (logs, events, artifacts) last as long as
+            # they need.
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout),
+            auto_decompress=False,
+        )
+
+    async def on_cleanup(self, app):
+        await self.session.close()
+        self.executor.shutdown(wait=False)
+
+    def application(self):
+        app = web.Application(client_max_size=0)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        app.router.add_route('*', '/{path:.*}', self.handle)
+        return app
+
+    async def handle(self, request):
+        """Handle requests of any method."""
+        if is_readiness_probe(request.method, request.path_qs):
+            status, body = readiness(self.scheduler)
+            return web.Response(status=status, body=body, content_type='application/json')
+
+        if self.pending >= self.max_pending:
+            return web.Response(status=503, headers={'Retry-After': '1'}, text="Proxy overloaded")
+
+        self.pending += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.pending -= 1
+
+        try:
+            with self.in_flight.track_inprogress(), self.stages['total'].time():
+                if should_dry_run(request.method, request.path_qs):
+                    return await self._dry_run(request)
+                return await self._forward_and_modify_request(request, request.method)
+        finally:
+            self.semaphore.release()
+
+    async def _dry_run(self, request):
+        """
+        Answers POST /schedule locally, as ProxyHandler does.
+        """
+        with self.stages['read_body'].time():
+            request_body = await request.read()
+        with self.stages['rewrite'].time():
+            status, body = await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                dry_run_submissions,
+                self.scheduler,
+                request_body,
+            )
+        return web.Response(status=status, body=body, content_type='application/json')
+
+    async def _forward_and_modify_request(self, request, method):
+        """
+        Same forwarding and rewrite rules as ProxyHandler._forward_and_modify_request:
+        submissions are buffered and rewritten, every other request takes the
+        fast path and every response is streamed with its headers.
+        """
+        target_url = f"{self.target_server}:{self.target_port}{request.path_qs}"
+        log.debug("Proxying request", extra={'method': method, 'path': request.path_qs, 'target': target_url})
+
+        request_headers = dict(end_to_end_headers(request.headers))
+        request_headers["Host"] = self.target_host
+
+        response = None
+        try:
+            request_body = request.content if request.body_exists else None
+
+            admission = None
+            content_type = request_headers.get("Content-Type", "")
+            if should_rewrite(method, request.path_qs, content_type):
+                request_headers.pop("Content-Length", None)
+                with self.stages['read_body'].time():
+                    request_body = await request.read()
+                with self.stages['rewrite'].time():
+                    request_body, admission = await asyncio.get_running_loop().run_in_executor(
+                        self.executor,
+                        rewrite_submission,
+                        self.scheduler,
+                        request_body,
+                    )
+
+            with self.stages['upstream'].time():
+                real_response = await self.session.request(
+                    method,
+                    target_url,
+                    headers=request_headers,
+                    data=request_body,
+                )
+            UPSTREAM_RESPONSES.labels('async', method, real_response.status).inc()
+
+            async with real_response:
+                with self.stages['response'].time():
+                    response = web.StreamResponse(status=real_response.status)
+                    for key, value in end_to_end_headers(real_response.headers):
+                        response.headers.add(key, value)
+                    if admission:
+                        response.headers[ADMISSION_HEADER] = str(admission)
+                    await response.prepare(request)
+
+                    async for chunk in real_response.content.iter_chunked(CHUNK_SIZE):
+                        await response.write(chunk)
+                    await response.write_eof()
+                    return response
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if response is None:
+                UPSTREAM_RESPONSES.labels('async', method, 'error').inc()
+            error_message = f"Proxy could not connect to target server: {e}"
+            log.warning(error_message)
+            if response is None or not response.prepared:
+                return web.Response(status=502, text=error_message)
+        except ConnectionResetError:
+            log.info("Client disconnected prematurely", extra={'client': request.remote})
+        except Exception:
+            log.exception("An unexpected error occurred")
+            if response is None or not response.prepared:
+                return web.Response(status=500, text="Internal Server Error")
+
+        return response if response is not None else web.Response(status=500)
+
+    def run(self, address, port):
+        web.run_app(self.application(), host=address, port=port, print=None)
@@ -0,0 +1,65 @@
+import json
+import logging
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+log = logging.getLogger(__name__)
+
+# "orjson" when it is installed, "json" for the standard library.
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'orjson' if orjson else 'json')
+
+
+class StdlibCodec():
+    name = 'json'
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(obj).encode()
+
+
+class OrjsonCodec():
+    """
+    orjson reads and writes bytes directly. The documents it refuses but
+    the standard library accepts (integers beyond 64 bits, NaN) go through
+    the standard library instead.
+    """
+    name = 'orjson'
+
+    @staticmethod
+    def loads(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return json.loads(data)
+
+    @staticmethod
+    def dumps(obj):
+        try:
+            return orjson.dumps(obj)
+        except orjson.JSONEncodeError:
+            return json.dumps(obj).encode()
+
+
+def codec(name=JSON_BACKEND):
+    if name == 'orjson':
+        if orjson is not None:
+            return OrjsonCodec
+        log.warning("orjson is not installed, using the json module.")
+    elif name != 'json':
+        raise ValueError(f"Unknown JSON_BACKEND '{name}', expected orjson or json.")
+    return StdlibCodec
+
+
+CODEC = codec()
+
+loads = CODEC.loads
+dumps = CODEC.dumps
@@ -0,0 +1,241 @@
+import logging
+import threading
+
+from kubernetes import client, watch
+
+
+log = logging.getLogger(__name__)
+
+HTTP_STATUS_GONE = 410
+
+
+def object_key(obj):
+    """
+    Returns the cache key of a Kubernetes object: ``namespace/name`` for
+    namespaced objects and ``name`` for cluster scoped ones. Works for both
+    plain dicts (custom objects) and typed client models.
+    """
+    if isinstance(obj, dict):
+        metadata = obj.get('metadata') or {}
+        namespace, name = metadata.get('namespace'), metadata.get('name')
+    else:
+        namespace, name = obj.metadata.namespace, obj.metadata.name
+
+    return f"{namespace}/{name}" if namespace else name
+
+
+def resource_version_of(obj):
+    if isinstance(obj, dict):
+        return (obj.get('metadata') or {}).get('resourceVersion')
+    return obj.metadata.resource_version
+
+
+class Informer():
+    """
+    Keeps an in-memory copy of a Kubernetes collection up to date.
+
+    The collection is listed once and then followed with a resumable watch
+    starting at the list's resourceVersion. When the API server answers
+    410 Gone the collection is listed again and the difference with the
+    cached state is replayed to the registered handlers. Objects rejected
+    by ``filter`` are kept out of the cache.
+    """
+
+    def __init__(
+            self,
+            list_func,
+            *args,
+            name = None,
+            watch_timeout = 300,
+            retry_period = 5,
+            filter = None,
+            **kwargs,
+        ):
+
+        self.list_func = list_func
+        self.args = args
+        self.kwargs = kwargs
+        self.name = name or getattr(list_func, '__name__', 'informer')
+        self.watch_timeout = watch_timeout
+        self.retry_period = retry_period
+        self.filter = filter
+
+        self.resource_version = None
+        self.epoch = 0
+        self.generation = 0
+        self.store = {}
+        self.handlers = []
+
+        self.lock = threading.RLock()
+        self.synced = threading.Event()
+        self._stopped = threading.Event()
+        self._watch = None
+        self._thread = None
+
+    def add_handler(self, on_add=None, on_update=None, on_delete=None):
+        """
+        Registers callbacks that are invoked, from the informer thread, for
+        every change applied to the cache.
+        """
+        with self.lock:
+            self.handlers.append((on_add, on_update, on_delete))
+            if on_add:
+                for obj in self.store.values():
+                    on_add(obj)
+
+    def get(self, key):
+        with self.lock:
+            return self.store.get(key)
+
+    def list(self):
+        with self.lock:
+            return list(self.store.values())
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self.run,
+                name=f"informer-{self.name}",
+                daemon=True,
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._watch:
+            self._watch.stop()
+
+    def wait_for_sync(self, timeout=None):
+        return self.synced.wait(timeout)
+
+    def seed(self, objs):
+        """
+        Fills the cache, before its first list, with objects saved by a
+        previous run so that it can be read right away. The first list then
+        replays the differences to the handlers.
+        """
+        with self.lock:
+            if self.synced.is_set():
+                return
+            for obj in objs:
+                self.__upsert(object_key(obj), obj)
+
+    def reselect(self, **kwargs):
+        """
+        Changes the arguments of the list and watch calls (e.g. the label
+        selector) and lists again. The running watch stops at its next
+        event and resumes from the new list.
+        """
+        with self.lock:
+            self.kwargs.update(kwargs)
+            self.epoch += 1
+        self.relist()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                if self.resource_version is None:
+                    self.relist()
+                self.watch()
+            except client.ApiException as e:
+                if e.status == HTTP_STATUS_GONE:
+                    log.info(f"Watch on {self.name} expired, re-listing.")
+                    self.resource_version = None
+                    continue
+                log.warning(f"Error watching {self.name}: {e}")
+                self._stopped.wait(self.retry_period)
+            except Exception as e:
+                log.warning(f"Error watching {self.name}: {e}")
+                self._stopped.wait(self.retry_period)
+
+    def relist(self):
+        result = self.list_func(*self.args, **self.kwargs)
+
+        if isinstance(result, dict):
+            items = result.get('items') or []
+            resource_version = (result.get('metadata') or {}).get('resourceVersion')
+        else:
+            items = result.items or []
+            resource_version = result.metadata.resource_version
+
+        fresh = {
+            object_key(obj): obj for obj in items
+            if self.filter is None or self.filter(obj)
+        }
+
+        with self.lock:
+            for key in set(self.store) - set(fresh):
+                self.__delete(key)
+            for key, obj in fresh.items():
+                self.__upsert(key, obj)
+
+            self.resource_version = resource_version
+
+        self.synced.set()
+
+    def watch(self):
+        self._watch = watch.Watch()
+        epoch = self.epoch
+
+        for event in self._watch.stream(
+                self.list_func,
+                *self.args,
+                resource_version=self.resource_version,
+                timeout_seconds=self.watch_timeout,
+                allow_watch_bookmarks=True,
+                **self.kwargs,
+            ):
+            if self._stopped.is_set():
+                break
+
+            event_type = event.get('type')
+            obj = event.get('object')
+
+            with self.lock:
+                if self.epoch != epoch:
+                    break
+
+                if event_type in ('ADDED', 'MODIFIED'):
+                    if self.filter is None or self.filter(obj):
+                        self.__upsert(object_key(obj), obj)
+                    else:
+                        self.__delete(object_key(obj))
+                elif event_type == 'DELETED':
+                    self.__delete(object_key(obj))
+
+                resource_version = resource_version_of(event.get('raw_object'))
+                if resource_version:
+                    self.resource_version = resource_version
+
+    def __upsert(self, key, obj):
+        old = self.store.get(key)
+
+        if old is not None and \
+            resource_version_of(old) == resource_version_of(obj):
+                return
+
+        self.store[key] = obj
+        self.generation += 1
+        for on_add, on_update, _ in self.handlers:
+            if old is None:
+                self.__dispatch(on_add, obj)
+            else:
+                self.__dispatch(on_update, old, obj)
+
+    def __delete(self, key):
+        old = self.store.pop(key, None)
+        if old is None:
+            return
+        self.generation += 1
+
+        for _, _, on_delete in self.handlers:
+            self.__dispatch(on_delete, old)
+
+    def __dispatch(self, handler, *args):
+        if handler is None:
+            return
+        try:
+            handler(*args)
+        except Exception as e:
+            log.exception(f"Error handling {self.name} event: {e}")
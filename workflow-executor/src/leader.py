@@ -0,0 +1,212 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from datetime import datetime, timezone
+from kubernetes import client
+
+
+log = logging.getLogger(__name__)
+
+LEADER_ELECTION = os.environ.get('LEADER_ELECTION', 'false').lower() == 'true'
+LEASE_NAME = os.environ.get('LEASE_NAME', 'workflow-executor')
+LEASE_DURATION = int(os.environ.get('LEASE_DURATION', 15))
+LEASE_RENEW_DEADLINE = float(os.environ.get('LEASE_RENEW_DEADLINE', 10))
+LEASE_RETRY_PERIOD = float(os.environ.get('LEASE_RETRY_PERIOD', 2))
+
+SERVICE_ACCOUNT_NAMESPACE = '/var/run/secrets/kubernetes.io/serviceaccount/namespace'
+
+
+def lease_namespace():
+    """
+    Returns LEASE_NAMESPACE or, when it is not set, the namespace of the
+    pod's service account.
+    """
+    if os.environ.get('LEASE_NAMESPACE'):
+        return os.environ.get('LEASE_NAMESPACE')
+    try:
+        with open(SERVICE_ACCOUNT_NAMESPACE) as f:
+            return f.read().strip()
+    except OSError:
+        return 'default'
+
+
+def lease_identity():
+    return os.environ.get('POD_NAME') or f"{socket.gethostname()}_{uuid.uuid4().hex[:8]}"
+
+
+class LeaderElector():
+    """
+    Elects one leader among the replicas through a coordination.k8s.io
+    Lease. The lease is acquired when its holder did not renew it for
+    ``lease_duration`` seconds, renewed every ``retry_period`` seconds, and
+    leadership is given up when it could not be renewed for
+    ``renew_deadline`` seconds. Expiry is measured on the local clock since
+    the lease was last seen changing, so clock skew between the replicas
+    does not matter.
+
+    ``on_started_leading`` and ``on_stopped_leading`` are called from the
+    elector thread.
+    """
+
+    def __init__(
+            self,
+            coordination_client,
+            name = LEASE_NAME,
+            namespace = None,
+            identity = None,
+            lease_duration = LEASE_DURATION,
+            renew_deadline = LEASE_RENEW_DEADLINE,
+            retry_period = LEASE_RETRY_PERIOD,
+            on_started_leading = None,
+            on_stopped_leading = None,
+        ):
+
+        self.coordination_client = coordination_client
+        self.name = name
+        self.namespace = namespace or lease_namespace()
+        self.identity = identity or lease_identity()
+        self.lease_duration = lease_duration
+        self.renew_deadline = renew_deadline
+        self.retry_period = retry_period
+        self.on_started_leading = on_started_leading
+        self.on_stopped_leading = on_stopped_leading
+
+        self.observed = None
+        self.observed_at = 0
+        self.renewed_at = 0
+        self._leading = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def leading(self):
+        return self._leading.is_set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="leader-election", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stops campaigning and, when leading, releases the lease so that
+        another replica takes over without waiting for it to expire.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        log.info(f"Campaigning for lease {self.namespace}/{self.name} as {self.identity}.")
+        while not self._stopped.is_set():
+            try:
+                renewed = self.try_acquire_or_renew()
+            except Exception as e:
+                log.warning(f"Error updating lease {self.namespace}/{self.name}: {e}")
+                renewed = False
+
+            if renewed:
+                self.renewed_at = time.monotonic()
+                if not self.leading:
+                    log.info(f"Became the leader of {self.namespace}/{self.name}.")
+                    self._leading.set()
+                    self.__dispatch(self.on_started_leading)
+            elif self.leading and time.monotonic() - self.renewed_at > self.renew_deadline:
+                self.__step_down()
+
+            self._stopped.wait(self.retry_period)
+
+        if self.leading:
+            self.release()
+            log.info(f"Released the lease {self.namespace}/{self.name}.")
+            self._leading.clear()
+            self.__dispatch(self.on_stopped_leading)
+
+    def try_acquire_or_renew(self):
+        """
+        Takes or renews the lease and tells whether this replica holds it.
+        Concurrent updates are arbitrated by the resourceVersion of the
+        lease.
+        """
+        now = datetime.now(timezone.utc)
+        try:
+            lease = self.coordination_client.read_namespaced_lease(self.name, self.namespace)
+        except client.ApiException as e:
+            if e.status != 404:
+                raise
+            return self.__create(now)
+
+        spec = lease.spec or client.V1LeaseSpec()
+        holder = spec.holder_identity
+
+        record = (holder, spec.renew_time, spec.lease_transitions)
+        if record != self.observed:
+            self.observed = record
+            self.observed_at = time.monotonic()
+
+        if holder and holder != self.identity and \
+            time.monotonic() - self.observed_at < (spec.lease_duration_seconds or self.lease_duration):
+                return False
+
+        if holder != self.identity:
+            spec.acquire_time = now
+            spec.lease_transitions = (spec.lease_transitions or 0) + 1
+        spec.holder_identity = self.identity
+        spec.lease_duration_seconds = self.lease_duration
+        spec.renew_time = now
+        lease.spec = spec
+
+        try:
+            self.coordination_client.replace_namespaced_lease(self.name, self.namespace, lease)
+        except client.ApiException as e:
+            if e.status == 409:
+                return False
+            raise
+        return True
+
+    def release(self):
+        try:
+            lease = self.coordination_client.read_namespaced_lease(self.name, self.namespace)
+            if lease.spec and lease.spec.holder_identity == self.identity:
+                lease.spec.holder_identity = None
+                lease.spec.lease_duration_seconds = 1
+                self.coordination_client.replace_namespaced_lease(self.name, self.namespace, lease)
+        except Exception as e:
+            log.warning(f"Error releasing lease {self.namespace}/{self.name}: {e}")
+
+    def __create(self, now):
+        body = client.V1Lease(
+            metadata=client.V1ObjectMeta(name=self.name, namespace=self.namespace),
+            spec=client.V1LeaseSpec(
+                holder_identity=self.identity,
+                lease_duration_seconds=self.lease_duration,
+                acquire_time=now,
+                renew_time=now,
+                lease_transitions=0,
+            ),
+        )
+        try:
+            self.coordination_client.create_namespaced_lease(self.namespace, body)
+        except client.ApiException as e:
+            if e.status == 409:
+                return False
+            raise
+        return True
+
+    def __step_down(self):
+        log.warning(f"Lost the lead of {self.namespace}/{self.name}.")
+        self._leading.clear()
+        self.__dispatch(self.on_stopped_leading)
+
+    def __dispatch(self, handler):
+        if handler is None:
+            return
+        try:
+            handler()
+        except Exception as e:
+            log.exception(f"Error handling leader election of {self.name}: {e}")
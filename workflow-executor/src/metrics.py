@@ -0,0 +1,207 @@
+import os
+import time
+
+from kubernetes.client import ApiClient
+from kubernetes.client.exceptions import ApiException
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+from urllib.parse import urlsplit
+from workflow_counters import PODS_PENDING
+
+
+# Also export the former per-workersize metric names (e.g.
+# workflow_pending_<size>_count) for the dashboards and scaling rules that
+# still read them.
+LEGACY_METRICS = os.environ.get('LEGACY_METRICS', 'true').lower() == 'true'
+
+PHASES = ('Pending', 'Running', 'Succeeded', 'Failed', 'Error')
+
+LEGACY_NAMES = {
+    'Pending': ('workflow_pending_{}_count', 'Number of pending workflows for {}'),
+    PODS_PENDING: ('workflow_pods_pending_{}_count', 'Number of workflows with pending pods for {}'),
+    'Running': ('workflow_running_{}_count', 'Number of running workflows for {}'),
+    'Succeeded': ('workflow_succeed_{}_count', 'Number of succeed workflows for {}'),
+    'Error': ('error_finished_{}_count', 'Number of error workflows for {}'),
+    'Failed': ('failed_finished_{}_count', 'Number of failed workflows for {}'),
+}
+
+
+LATENCY_BUCKETS = (
+    .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30,
+)
+
+PROXY_STAGES = ('read_body', 'rewrite', 'upstream', 'response', 'total')
+SCHEDULER_STAGES = ('decode', 'resources', 'admission', 'stamp', 'encode')
+
+PROXY_STAGE_SECONDS = Histogram(
+    'workflow_executor_proxy_stage_seconds',
+    'Time spent in each stage of a proxied request',
+    ['engine', 'stage'],
+    buckets=LATENCY_BUCKETS,
+)
+PROXY_IN_FLIGHT = Gauge(
+    'workflow_executor_proxy_in_flight_requests',
+    'Number of requests being proxied',
+    ['engine'],
+)
+UPSTREAM_RESPONSES = Counter(
+    'workflow_executor_upstream_responses',
+    'Responses of the upstream Argo server by status code, "error" when it could not be reached',
+    ['engine', 'method', 'code'],
+)
+SCHEDULER_STAGE_SECONDS = Histogram(
+    'workflow_executor_scheduler_stage_seconds',
+    'Time spent in each stage of the rewrite of a workflow submission',
+    ['stage'],
+    buckets=LATENCY_BUCKETS,
+)
+KUBERNETES_REQUEST_SECONDS = Histogram(
+    'workflow_executor_kubernetes_request_seconds',
+    'Latency of the Kubernetes API calls by verb, up to the response headers for watches',
+    ['verb'],
+    buckets=LATENCY_BUCKETS,
+)
+KUBERNETES_REQUESTS = Counter(
+    'workflow_executor_kubernetes_requests',
+    'Kubernetes API calls by verb and status code',
+    ['verb', 'code'],
+)
+
+LEADER = Gauge(
+    'workflow_executor_leader',
+    '1 when this replica holds the lease and runs the node labelling and sync loops',
+)
+
+KUBERNETES_VERBS = {
+    'GET': 'get',
+    'POST': 'create',
+    'PUT': 'update',
+    'PATCH': 'patch',
+    'DELETE': 'delete',
+}
+
+
+def start_metrics_server(port=None):
+    """
+    Serves the metrics on METRICS_PORT. Called by the proxy once it starts,
+    rather than on import.
+    """
+    start_http_server(int(port or os.environ.get('METRICS_PORT', 9999)))
+
+
+def kubernetes_verb(method, url, query_params=None):
+    """
+    Returns the API verb of a request: a GET is a ``watch`` with the watch
+    parameter, a ``list`` of a collection (e.g. /api/v1/nodes or
+    /apis/argoproj.io/v1alpha1/namespaces/argo/workflows) and a ``get`` of
+    an object or of its subresources otherwise.
+    """
+    if ('watch', True) in (query_params or ()):
+        return 'watch'
+    if method != 'GET':
+        return KUBERNETES_VERBS.get(method, method.lower())
+
+    parts = [part for part in urlsplit(url).path.split('/') if part]
+    for i, part in enumerate(parts):
+        if part in ('api', 'apis'):
+            # /api/{version}/... or /apis/{group}/{version}/...
+            parts = parts[i + (2 if part == 'api' else 3):]
+            break
+    if len(parts) >= 3 and parts[0] == 'namespaces':
+        parts = parts[2:]
+    return 'list' if len(parts) == 1 else 'get'
+
+
+class InstrumentedApiClient(ApiClient):
+    """
+    ApiClient recording the latency and the status code of every Kubernetes
+    API call by verb.
+    """
+
+    def request(self, method, url, query_params=None, *args, **kwargs):
+        verb = kubernetes_verb(method, url, query_params)
+
+        code = 'error'
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, query_params, *args, **kwargs)
+            code = response.status
+            return response
+        except ApiException as e:
+            code = e.status
+            raise
+        finally:
+            KUBERNETES_REQUEST_SECONDS.labels(verb).observe(time.perf_counter() - started)
+            KUBERNETES_REQUESTS.labels(verb, code).inc()
+
+
+class SchedulerCollector():
+    """
+    Prometheus collector reading the scheduler state at scrape time: the
+    worker nodes per workersize and the workflows per workersize and phase,
+    as one labelled family each. Every size of the catalogue is exported,
+    with zeros, and the sizes removed from it disappear with their last
+    workflow.
+    """
+
+    def __init__(self, scheduler, legacy=LEGACY_METRICS):
+        self.scheduler = scheduler
+        self.legacy = legacy
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        workersizes = self.scheduler.worker_catalogue.names()
+        workers = self.scheduler.node_controller.workers()
+        phases, pods_pending = self.scheduler.workflow_counters.snapshot()
+
+        nodes = GaugeMetricFamily(
+            'workflow_executor_worker_nodes',
+            'Number of worker nodes labelled with a workersize',
+            labels=['workersize'],
+        )
+        workflows = GaugeMetricFamily(
+            'workflow_executor_workflows',
+            'Number of workflows per workersize and phase',
+            labels=['workersize', 'phase'],
+        )
+        waiting = GaugeMetricFamily(
+            'workflow_executor_workflows_pods_pending',
+            'Number of Running workflows waiting for their pods per workersize',
+            labels=['workersize'],
+        )
+
+        for workersize in sorted(set(workersizes) | set(workers)):
+            nodes.add_metric([workersize], workers.get(workersize, 0))
+
+        counts = {(workersize, phase): 0 for workersize in workersizes for phase in PHASES}
+        counts.update(
+            (key, count) for key, count in phases.items()
+            if key[0] and key[1] and count
+        )
+        for (workersize, phase), count in sorted(counts.items()):
+            workflows.add_metric([workersize, phase], count)
+
+        for workersize in sorted(set(workersizes) | {x for x, count in pods_pending.items() if x and count}):
+            waiting.add_metric([workersize], pods_pending.get(workersize, 0))
+
+        yield nodes
+        yield workflows
+        yield waiting
+
+        if self.legacy:
+            yield from self.__legacy(workersizes, workers, counts, pods_pending)
+
+    def __legacy(self, workersizes, workers, counts, pods_pending):
+        for workersize in workersizes:
+            name = workersize.replace('-', '_')
+
+            yield GaugeMetricFamily(f'{name}_count', f'Number of {workersize} ', value=workers.get(workersize, 0))
+
+            for phase, (metric, documentation) in LEGACY_NAMES.items():
+                if phase == PODS_PENDING:
+                    value = pods_pending.get(workersize, 0)
+                else:
+                    value = counts.get((workersize, phase), 0)
+                yield GaugeMetricFamily(metric.format(name), documentation.format(workersize), value=value)
@@ -0,0 +1,351 @@
+import logging
+import os
+import threading
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from kubernetes import client
+from assignment import strategy
+from informer import Informer
+from quantity import parse_cpu_to_millicores, parse_memory_to_bytes
+from refresh import RefreshLoop
+from utils import call_with_retry, filter_nodes_by_label
+from workflow_cache import WORKERSIZE_LABEL
+from workqueue import RateLimitedQueue
+
+
+log = logging.getLogger(__name__)
+
+WORKER_NODE_LABEL = r"nebulouscloud\.eu/?.+worker?.+"
+
+LABEL_WORKERS = int(os.environ.get('LABEL_WORKERS', 16))
+LABEL_ATTEMPTS = int(os.environ.get('LABEL_ATTEMPTS', 3))
+NODE_QUEUE_QPS = float(os.environ.get('NODE_QUEUE_QPS', 10))
+NODE_QUEUE_BURST = int(os.environ.get('NODE_QUEUE_BURST', 100))
+NODE_REBALANCE_PERIOD = float(os.environ.get('NODE_REBALANCE_PERIOD', 60))
+
+
+def is_worker_node(node):
+    return filter_nodes_by_label(node.metadata.labels or {}, WORKER_NODE_LABEL) \
+        and not node.spec.unschedulable
+
+
+def retryable(e):
+    return not isinstance(e, client.ApiException) or \
+        e.status in (409, 429) or e.status >= 500
+
+
+class NodeController():
+    """
+    Keeps the workersize label of the worker nodes in line with the
+    WorkflowWorkers catalogue. Nodes are watched, and every node that is
+    added, becomes schedulable or changes capacity goes through a rate
+    limited work queue and is labelled with the size the assignment
+    strategy gives it (by default the largest size it fits). The number of
+    nodes per workersize is updated as nodes are reconciled.
+
+    The assignment of all the nodes is planned at once and kept until the
+    nodes or the catalogue change. Strategies that follow the pending
+    demand, read through ``demand``, are replanned by a refresh loop every
+    NODE_REBALANCE_PERIOD seconds, when the nodes, the catalogue or the
+    demand changed.
+
+    Nodes are only labelled while ``leading()`` is true. The other replicas
+    count the nodes per workersize from the labels the leader sets.
+    """
+
+    def __init__(self, core_client, worker_catalogue, demand=None, assignment=None, leading=None):
+        self.core_client = core_client
+        self.worker_catalogue = worker_catalogue
+        self.demand = demand or dict
+        self.assignment = assignment or strategy()
+        self.leading = leading or (lambda: True)
+
+        self.nodes = Informer(core_client.list_node, name='nodes')
+        self.queue = RateLimitedQueue(qps=NODE_QUEUE_QPS, burst=NODE_QUEUE_BURST)
+
+        self.lock = threading.Lock()
+        self.assignments = {}
+        self.counts = Counter()
+        self.plan = None
+        self.generation = 0
+        # Changes with the nodes and the node fields the assignment reads,
+        # not with the status heartbeats of the kubelets.
+        self.revision = 0
+        self.rebalancer = RefreshLoop(
+            self.rebalance,
+            self.fingerprint,
+            name='node-rebalance',
+            interval=NODE_REBALANCE_PERIOD,
+        )
+        self._thread = None
+
+        self.nodes.add_handler(self.on_add, self.on_update, self.on_delete)
+        self.worker_catalogue.add_handler(
+            lambda x: self.on_catalogue(),
+            lambda x, y: self.on_catalogue(),
+            lambda x: self.on_catalogue(),
+        )
+
+    @property
+    def name(self):
+        return self.nodes.name
+
+    def start(self):
+        if self._thread is None:
+            self.nodes.start()
+            self._thread = threading.Thread(target=self.run, name="node-controller", daemon=True)
+            self._thread.start()
+            if self.assignment.uses_demand:
+                self.rebalancer.start()
+        return self
+
+    def stop(self):
+        self.rebalancer.stop()
+        self.queue.shutdown()
+        self.nodes.stop()
+
+    def wait_for_sync(self, timeout=None):
+        return self.nodes.wait_for_sync(timeout)
+
+    def workers(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def on_add(self, node):
+        self.revision += 1
+        self.__invalidate()
+        self.queue.add(node.metadata.name)
+
+    def on_update(self, old, new):
+        if self.__capacity(old) != self.__capacity(new):
+            self.__invalidate()
+        if self.__state(old) != self.__state(new):
+            self.revision += 1
+            self.queue.add(new.metadata.name)
+
+    def on_delete(self, node):
+        self.revision += 1
+        self.__invalidate()
+        self.queue.add(node.metadata.name)
+
+    def on_catalogue(self):
+        self.__invalidate()
+        self.enqueue_all()
+
+    def enqueue_all(self):
+        for node in self.nodes.list():
+            self.queue.add(node.metadata.name)
+
+    def desired_workersize(self, name):
+        return self.__plan().get(name)
+
+    def fingerprint(self):
+        """
+        Changes whenever the nodes, the catalogue or the demand change.
+        """
+        return (
+            self.revision,
+            self.worker_catalogue.generation,
+            tuple(sorted(self.demand().items())),
+        )
+
+    def rebalance(self, budget=None):
+        """
+        Replans the assignment with the current demand and queues the nodes
+        whose workersize changes, as many as the budget allows. Returns
+        False if some were left for the next time.
+        """
+        if not self.leading():
+            return True
+
+        self.__invalidate()
+        plan = self.__plan()
+
+        moved = [
+            node.metadata.name for node in self.nodes.list()
+            if (node.metadata.labels or {}).get(WORKERSIZE_LABEL) != plan.get(node.metadata.name)
+        ]
+        granted = budget.take(len(moved)) if budget else len(moved)
+
+        for name in moved[:granted]:
+            self.queue.add(name)
+        return granted == len(moved)
+
+    def run(self):
+        while True:
+            name = self.queue.get()
+            if name is None:
+                return
+
+            try:
+                self.reconcile(name)
+                self.queue.forget(name)
+            except Exception as e:
+                log.warning(f"Error reconciling node {name}, requeuing: {e}")
+                self.queue.add_rate_limited(name)
+            finally:
+                self.queue.done(name)
+
+    def reconcile(self, name):
+        node = self.nodes.get(name)
+
+        if node is None or not is_worker_node(node):
+            self.__assign(name, None)
+            return
+
+        if not self.leading():
+            self.__assign(name, (node.metadata.labels or {}).get(WORKERSIZE_LABEL))
+            return
+
+        workersize = self.desired_workersize(name)
+        if (node.metadata.labels or {}).get(WORKERSIZE_LABEL) != workersize:
+            self.__label(name, workersize)
+            log.info(f"Labeled node {name} as {workersize}")
+
+        self.__assign(name, workersize)
+
+    def reconcile_all(self, force=False, budget=None):
+        """
+        Reconciles every cached node at once: only the nodes whose label
+        differs from the desired one are patched (all of them with
+        ``force``), concurrently and with retries. With a budget, the
+        patches it does not allow are left for the next call, which is
+        told by returning False. Replicas that are not leading only recount
+        the labels.
+        """
+        if not self.leading():
+            for node in self.nodes.list():
+                labels = node.metadata.labels or {}
+                self.__assign(node.metadata.name, labels.get(WORKERSIZE_LABEL) if is_worker_node(node) else None)
+            return True
+
+        self.__invalidate()
+        plan = self.__plan()
+
+        desired = {}
+        drifted = []
+
+        for node in self.nodes.list():
+            if not is_worker_node(node):
+                desired[node.metadata.name] = None
+                continue
+
+            workersize = plan.get(node.metadata.name)
+            desired[node.metadata.name] = workersize
+
+            if force or (node.metadata.labels or {}).get(WORKERSIZE_LABEL) != workersize:
+                drifted.append((node.metadata.name, workersize))
+
+        deferred = set()
+        if budget is not None:
+            granted = budget.take(len(drifted))
+            deferred = {name for name, _ in drifted[granted:]}
+            drifted = drifted[:granted]
+
+        failed = set()
+        if drifted:
+            with ThreadPoolExecutor(max_workers=LABEL_WORKERS) as executor:
+                results = executor.map(lambda x: self.__try_label(*x), drifted)
+                failed = {name for (name, _), ok in zip(drifted, results) if not ok}
+
+        for name, workersize in desired.items():
+            if name in failed:
+                self.queue.add_rate_limited(name)
+            elif name not in deferred:
+                self.__assign(name, workersize)
+
+        return not deferred
+
+    def __try_label(self, name, workersize):
+        try:
+            call_with_retry(
+                self.__label,
+                name,
+                workersize,
+                attempts=LABEL_ATTEMPTS,
+                retryable=retryable,
+            )
+            return True
+        except Exception as e:
+            log.warning(f"Error labeling node {name}: {e}")
+            return False
+
+    def __label(self, name, workersize):
+        body = {
+            "metadata": {
+                "labels": {
+                    WORKERSIZE_LABEL: workersize
+                }
+            }
+        }
+
+        self.core_client.patch_node(
+            name,
+            body,
+        )
+
+    def __assign(self, name, workersize):
+        with self.lock:
+            previous = self.assignments.pop(name, None)
+            if previous:
+                self.counts[previous] -= 1
+            if workersize:
+                self.assignments[name] = workersize
+                self.counts[workersize] += 1
+
+    def __invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.plan = None
+
+    def __plan(self):
+        """
+        Returns the planned workersize of every worker node. The plan is
+        computed outside the lock, since the informers call in with their
+        own lock held, and is only kept if no node changed meanwhile.
+        """
+        with self.lock:
+            if self.plan is not None:
+                return self.plan
+            generation = self.generation
+
+        nodes = {}
+        current = {}
+        for node in self.nodes.list():
+            if not is_worker_node(node):
+                continue
+            try:
+                nodes[node.metadata.name] = (
+                    parse_cpu_to_millicores(node.status.capacity.get('cpu')),
+                    parse_memory_to_bytes(node.status.capacity.get('memory')),
+                )
+            except (TypeError, ValueError) as e:
+                log.warning(f"Ignoring node {node.metadata.name}: {e}")
+                continue
+            current[node.metadata.name] = (node.metadata.labels or {}).get(WORKERSIZE_LABEL)
+
+        plan = self.assignment.assign(
+            nodes,
+            self.worker_catalogue,
+            self.demand() if self.assignment.uses_demand else None,
+            current,
+        )
+
+        with self.lock:
+            if self.generation == generation:
+                self.plan = plan
+        return plan
+
+    def __capacity(self, node):
+        return (
+            is_worker_node(node),
+            node.status.capacity,
+        )
+
+    def __state(self, node):
+        return (
+            node.metadata.labels,
+            node.spec.unschedulable,
+            node.status.capacity,
+        )
@@ -0,0 +1,87 @@
+import math
+import re
+
+from fractions import Fraction
+from functools import lru_cache
+
+
+# <signedNumber><suffix> as defined by Kubernetes resource.Quantity. Lower
+# case binary suffixes ("mi", "gi") are accepted for compatibility with the
+# WorkflowWorkers specs written for the previous parser.
+QUANTITY = re.compile(
+    r"^\s*([+-]?(?:\d+\.?\d*|\.\d+))"
+    r"(?:([KkMmGgTtPpEe]i|[numkMGTPE])|[eE]([+-]?\d+))?\s*$"
+)
+
+SUFFIXES = {
+    'n': Fraction(1, 10**9),
+    'u': Fraction(1, 10**6),
+    'm': Fraction(1, 10**3),
+    'k': 10**3,
+    'M': 10**6,
+    'G': 10**9,
+    'T': 10**12,
+    'P': 10**15,
+    'E': 10**18,
+    'ki': 2**10,
+    'mi': 2**20,
+    'gi': 2**30,
+    'ti': 2**40,
+    'pi': 2**50,
+    'ei': 2**60,
+}
+
+
+def _parse(quantity):
+    match = QUANTITY.match(quantity)
+    if not match:
+        raise ValueError(
+            f"Invalid quantity format: '{quantity}'. "
+            "Expected a number with an optional suffix like '500m', '2', '1.5Gi', '500M' or '1e9'."
+        )
+
+    number, suffix, exponent = match.groups()
+    value = Fraction(number)
+
+    if suffix:
+        return value * SUFFIXES[suffix if len(suffix) == 1 else suffix.lower()]
+    if exponent:
+        return value * Fraction(10)**int(exponent)
+    return value
+
+def parse_quantity(quantity):
+    """
+    Parses a Kubernetes quantity (e.g., "500m", "2", "1.5Gi", "500M", "1e9",
+    or a plain number) into an exact Fraction. Strings are parsed with a
+    precompiled grammar.
+    - Binary suffixes: Ki, Mi, Gi, Ti, Pi, Ei (powers of 1024).
+    - Decimal suffixes: n, u, m, k, M, G, T, P, E (powers of 1000).
+    - Decimal exponents: e<n> or E<n>.
+    """
+    if isinstance(quantity, bool):
+        raise TypeError(f"Quantity must be a string or number, got {type(quantity)}: '{quantity}'")
+    if isinstance(quantity, int):
+        return Fraction(quantity)
+    if isinstance(quantity, float):
+        return Fraction(str(quantity))
+    if not isinstance(quantity, str):
+        raise TypeError(f"Quantity must be a string or number, got {type(quantity)}: '{quantity}'")
+
+    return _parse(quantity)
+
+@lru_cache(maxsize=4096)
+def parse_memory_to_bytes(memory_string):
+    """
+    Parses a memory quantity (e.g., "1000Mi", "2Gi", "500M", "1e9", or a plain
+    number for bytes) into an integer number of bytes, rounded up. Results
+    are memoized.
+    """
+    return math.ceil(parse_quantity(memory_string))
+
+@lru_cache(maxsize=4096)
+def parse_cpu_to_millicores(cpu_string):
+    """
+    Parses a CPU quantity (e.g., "2", "1.5", "500m", or a plain number of cores)
+    into an integer number of millicores, rounded up. Results are memoized.
+    """
+    return math.ceil(parse_quantity(cpu_string) * 1000)
@@ -0,0 +1,117 @@
+import logging
+import os
+import random
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = float(os.environ.get('REFRESH_INTERVAL', 30))
+REFRESH_JITTER = float(os.environ.get('REFRESH_JITTER', 0.1))
+REFRESH_MAX_BACKOFF = float(os.environ.get('REFRESH_MAX_BACKOFF', 300))
+REFRESH_MAX_DUTY = float(os.environ.get('REFRESH_MAX_DUTY', 0.1))
+REFRESH_API_BUDGET = int(os.environ.get('REFRESH_API_BUDGET', 50))
+
+
+class Budget():
+    """
+    Number of Kubernetes API calls a refresh cycle may still make.
+    """
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def take(self, calls):
+        """
+        Takes up to ``calls`` calls from the budget and returns how many
+        were granted.
+        """
+        granted = max(0, min(calls, self.calls))
+        self.calls -= granted
+        return granted
+
+
+class RefreshLoop():
+    """
+    Calls ``refresh(budget)`` in a daemon thread, ``interval`` seconds
+    (+/- ``jitter`` of it) after the end of the previous cycle, so slow
+    cycles never run back to back. Cycles that take more than ``max_duty``
+    of the interval stretch it, failed cycles back off exponentially up to
+    ``max_backoff``, and each cycle gets a Budget of ``budget`` API calls.
+
+    ``fingerprint``, if given, summarizes the state the refresh depends on:
+    a cycle is skipped when it is unchanged since the last complete one. A
+    refresh that ran out of budget returns False and the next cycle runs
+    anyway.
+    """
+
+    def __init__(
+            self,
+            refresh,
+            fingerprint = None,
+            name = 'refresh',
+            interval = REFRESH_INTERVAL,
+            jitter = REFRESH_JITTER,
+            max_backoff = REFRESH_MAX_BACKOFF,
+            max_duty = REFRESH_MAX_DUTY,
+            budget = REFRESH_API_BUDGET,
+        ):
+
+        self.refresh = refresh
+        self.fingerprint = fingerprint
+        self.name = name
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.max_duty = max_duty
+        self.budget = budget
+
+        self.failures = 0
+        self.last = None
+        self.stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        delay = self.interval
+        while not self.stopped.wait(self.__jittered(delay)):
+            delay = self.run_once()
+
+    def run_once(self):
+        """
+        Runs one cycle and returns the delay before the next one.
+        """
+        fingerprint = self.fingerprint() if self.fingerprint else None
+        if fingerprint is not None and fingerprint == self.last:
+            log.debug(f"Skipping {self.name}, nothing changed.")
+            return self.interval
+
+        started = time.monotonic()
+        try:
+            complete = self.refresh(Budget(self.budget))
+        except Exception as e:
+            self.failures += 1
+            self.last = None
+            delay = min(self.interval * 2**self.failures, self.max_backoff)
+            log.warning(f"Error in {self.name}, retrying in {delay:.1f}s: {e}")
+            return delay
+
+        self.failures = 0
+        self.last = fingerprint if complete is not False else None
+
+        elapsed = time.monotonic() - started
+        return max(self.interval, elapsed / self.max_duty) if self.max_duty else self.interval
+
+    def __jittered(self, delay):
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
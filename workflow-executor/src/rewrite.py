@@ -0,0 +1,108 @@
+import codec
+import os
+import re
+import time
+
+from metrics import SCHEDULER_STAGE_SECONDS
+from traces import TRACER, trace_record
+
+
+# Workflow submissions to any namespace, e.g. /api/v1/workflows/argo
+SUBMIT_PATH = re.compile(r"^/api/v1/workflows/[a-z0-9]([-a-z0-9]*[a-z0-9])?/?(\?.*)?$")
+
+# Local dry-run endpoint, answered by the proxy without calling Argo.
+SCHEDULE_PATH = re.compile(r"^/schedule/?(\?.*)?$")
+
+# Readiness endpoint, answered by the proxy itself.
+READINESS_PATH = os.environ.get('READINESS_PATH', '/readyz')
+
+DECODE_SECONDS = SCHEDULER_STAGE_SECONDS.labels('decode')
+ENCODE_SECONDS = SCHEDULER_STAGE_SECONDS.labels('encode')
+
+
+def should_rewrite(method, path, content_type):
+    """
+    Tells whether a proxied request is a workflow submission that has to go
+    through the scheduler before being forwarded to Argo.
+    """
+    return method == 'POST' and \
+        SUBMIT_PATH.match(path) and \
+        'application/json' in content_type
+
+
+def is_readiness_probe(method, path):
+    return method in ('GET', 'HEAD') and path.split('?')[0] == READINESS_PATH
+
+
+def readiness(scheduler):
+    """
+    Returns 200 once the scheduler finished its startup and 503 before,
+    with the state of each startup phase as a JSON body.
+    """
+    ready, phases = scheduler.readiness()
+    return 200 if ready else 503, codec.dumps(dict(phases, ready=ready))
+
+
+def should_dry_run(method, path):
+    return method == 'POST' and SCHEDULE_PATH.match(path) is not None
+
+
+def dry_run_submissions(scheduler, request_body):
+    """
+    Answers a dry run of one submission or of an array of them, each either
+    an Argo submission body or a bare Workflow. Returns the HTTP status and
+    the JSON body with, for each submission, the chosen workersize, the
+    Admission and the patched workflow.
+    """
+    try:
+        with DECODE_SECONDS.time():
+            submissions = codec.loads(request_body)
+    except ValueError as e:
+        return 400, codec.dumps({'error': f"Invalid JSON: {e}"})
+
+    batch = isinstance(submissions, list)
+    if not batch:
+        submissions = [submissions]
+
+    bare = [
+        not isinstance(submission, dict) or 'workflow' not in submission
+        for submission in submissions
+    ]
+    results = scheduler.dry_run([
+        {'workflow': submission} if wrap else submission
+        for submission, wrap in zip(submissions, bare)
+    ])
+
+    response = [
+        {
+            'workersize': admission.workersize,
+            'admission': admission._asdict(),
+            'workflow': workflow['workflow'] if wrap else workflow,
+        }
+        for (workflow, admission), wrap in zip(results, bare)
+    ]
+
+    with ENCODE_SECONDS.time():
+        return 200, codec.dumps(response if batch else response[0])
+
+
+def rewrite_submission(scheduler, request_body):
+    """
+    Returns the rewritten submission body and the Admission decision taken
+    for it. The body is decoded from and encoded to bytes by the JSON_BACKEND
+    codec, and the workflow is modified in place. With TRACE_FILE, the
+    submission is recorded for the simulator.
+    """
+    with DECODE_SECONDS.time():
+        workflow = codec.loads(request_body)
+
+    if TRACER:
+        submitted, record = time.time(), trace_record(workflow)
+
+    workflow, admission = scheduler.admit_workflow(workflow)
+
+    if TRACER:
+        TRACER.record(record, admission, submitted)
+
+    with ENCODE_SECONDS.time():
+        return codec.dumps(workflow), admission
@@ -1,13 +1,45 @@
+import logging
 import os
-import re
+import threading
+import time
 
+from collections import Counter
 from kubernetes import client, config
-from kubernetes.client import CustomObjectsApi
-from prometheus_client import start_http_server, Gauge
-from utils import filter_nodes_by_label, parse_memory_to_bytes
+from prometheus_client import REGISTRY
+from admission import Admission, AdmissionPolicy
+from leader import LEADER_ELECTION, LeaderElector
+from metrics import LEADER, SCHEDULER_STAGE_SECONDS, SCHEDULER_STAGES, InstrumentedApiClient, SchedulerCollector
+from quantity import parse_cpu_to_millicores, parse_memory_to_bytes
+from refresh import RefreshLoop
+from sharding import Shard, workflow_namespaces
+from shard_demand import ShardDemand
+from sizing import SIZING_MODE, co_location_affinity, colocated, largest_resources, template_resources
+from node_controller import LABEL_WORKERS, NodeController
+from worker_catalogue import WorkerCatalogue
+from workflow_cache import WORKERSIZE_LABEL, WorkflowCache
+from workflow_counters import WorkflowCounters
+from workflow_nodes import WORKFLOW_NODES_WORKERS, WorkflowNodesMirror
+
+
+log = logging.getLogger(__name__)
+
+STAGES = {stage: SCHEDULER_STAGE_SECONDS.labels(stage) for stage in SCHEDULER_STAGES}
+
+# Mirror the worker nodes as WorkflowNodes objects.
+WORKFLOW_NODES_SYNC = os.environ.get('WORKFLOW_NODES_SYNC', 'false').lower() == 'true'
+
+# Return from Scheduler() without waiting for the caches, which then sync
+# behind the readiness state.
+FAST_START = os.environ.get('FAST_START', 'true').lower() == 'true'
+# Seconds after which a startup that is not over is reported.
+STARTUP_TIMEOUT = float(os.environ.get('STARTUP_TIMEOUT', 300))
+# Seconds a submission waits for the catalogue to sync when there is no warm
+# copy to size it against.
+CATALOGUE_SYNC_WAIT = float(os.environ.get('CATALOGUE_SYNC_WAIT', 30))
+# Copy of the catalogue kept for warm starts, empty to disable them. It only
+# survives a restart on a volume, e.g. an emptyDir for container restarts.
+CATALOGUE_CACHE = os.environ.get('CATALOGUE_CACHE', '/tmp/workflow-executor-catalogue.json')
 
-
-start_http_server(int(os.environ.get('METRICS_PORT', 9999)))
 class Scheduler():
     def __init__(
             self,
@@ -17,334 +49,517 @@ class Scheduler():
             version = "v1",
         ):
 
+        self.sizing_mode = SIZING_MODE
+        self.elector = None
+        self.shard_demand = None
+        self.control_loops = []
+        self.warm_started = False
+        self.started = threading.Event()
+
         try:
             try:
-                print("Trying to load in-cluster config.", flush=True)
+                log.info("Trying to load in-cluster config.")
                 config.load_incluster_config()
             except:
-                print("In-cluster config not found, loading kube config from local machine.", flush=True)
+                log.info("In-cluster config not found, loading kube config from local machine.")
                 config.load_kube_config()                
 
             self.argo_ip = argo_ip
             self.argo_port = argo_port
 
-            self.core_client = client.CoreV1Api()
-            self.api_client = client.ApiClient()
+            # Room for the concurrent labelling of the initial sweep.
+            configuration = client.Configuration.get_default_copy()
+            configuration.connection_pool_maxsize = max(
+                configuration.connection_pool_maxsize,
+                LABEL_WORKERS,
+                WORKFLOW_NODES_WORKERS,
+            )
+            self.api_client = InstrumentedApiClient(configuration)
+            self.core_client = client.CoreV1Api(self.api_client)
+
+            if LEADER_ELECTION:
+                self.elector = LeaderElector(
+                    client.CoordinationV1Api(self.api_client),
+                    on_started_leading=self.start_control_loops,
+                    on_stopped_leading=self.stop_control_loops,
+                )
 
             self.group = group
             self.v = version
 
-            self.metrics = {}
+            sync_timeout = int(os.environ.get('CACHE_SYNC_TIMEOUT', 30))
+
+            self.worker_catalogue = WorkerCatalogue(self.api_client, group, version, cache_file=CATALOGUE_CACHE)
+            self.warm_started = self.worker_catalogue.warm_start()
+            self.worker_catalogue.start()
+
+            self.shard = Shard()
+            if self.shard.enabled and self.shard.by == 'workersize':
+                self.worker_catalogue.wait_for_sync(sync_timeout)
+
+            self.workflow_caches = self.__workflow_caches()
+            self.workflow_counters = WorkflowCounters()
+            for cache in self.workflow_caches:
+                self.workflow_counters.attach(cache)
+                cache.start()
+
+            # A sharded replica admits submissions for every shard, against
+            # the demand its peers publish for theirs.
+            demand = self.workflow_counters.demand
+            if self.shard.enabled:
+                self.shard_demand = ShardDemand(
+                    client.CoordinationV1Api(self.api_client),
+                    self.shard,
+                    self.workflow_counters.demand,
+                ).start()
+                demand = self.shard_demand.demand
+
+            if self.shard.enabled and self.shard.by == 'workersize':
+                self.worker_catalogue.add_handler(
+                    lambda x: self.__reshard(),
+                    lambda x, y: self.__reshard(),
+                    lambda x: self.__reshard(),
+                )
 
-            self.check_publish_metrics()
+            self.node_controller = NodeController(
+                self.core_client,
+                self.worker_catalogue,
+                demand=demand,
+                leading=self.leading,
+            ).start()
+            self.workflow_nodes = WorkflowNodesMirror(self.api_client, self.node_controller.nodes, group, version)
+            self.admission = AdmissionPolicy(
+                self.worker_catalogue,
+                self.node_controller.workers,
+                demand,
+            )
+            for cache in self.workflow_caches:
+                self.admission.attach(cache)
+            if self.shard_demand is not None:
+                self.admission.attach(self.shard_demand.leases)
+
+            if not FAST_START:
+                for cache in self.caches():
+                    if not cache.wait_for_sync(sync_timeout):
+                        log.warning(f"Cache {cache.name} not synced yet, results may be incomplete.")
+
+            self.collector = SchedulerCollector(self)
+            REGISTRY.register(self.collector)
+
+            threading.Thread(target=self.initial_sweep, name="initial-sweep", daemon=True).start()
         except Exception as e:
-            print(f"Cluster context can not be retrieved: {e}", flush=True)
-
-
-    def define_metrics(self):
-        workflow_workers = self.__get_crds("workflowworkers").get("items")
-
-        if workflow_workers:
-            self.metrics = {
-                'nodes': {},
-                'workflows': {
-                    'Pending': {},
-                    'Pods_pending': {},
-                    'Running': {},
-                    'Failed': {},
-                    'Error': {},
-                    'Succeeded': {},
-                }
-            }
-
-            for i in workflow_workers:
-                w_name = i.get('metadata').get('name')
-                self.metrics.get('nodes')[w_name] = Gauge(f'{w_name}_count'.replace('-','_'), f'Number of {w_name} ')
-                self.metrics.get('workflows').get('Pending')[w_name] = Gauge(f'workflow_pending_{w_name}_count'.replace('-','_'), f'Number of pending workflows for {w_name}')
-                self.metrics.get('workflows').get('Pods_pending')[w_name] = Gauge(f'workflow_pods_pending_{w_name}_count'.replace('-','_'), f'Number of workflows with pending pods for {w_name}')
-                self.metrics.get('workflows').get('Running')[w_name] = Gauge(f'workflow_running_{w_name}_count'.replace('-','_'), f'Number of running workflows for {w_name}')
-                self.metrics.get('workflows').get('Succeeded')[w_name] = Gauge(f'workflow_succeed_{w_name}_count'.replace('-','_'), f'Number of succeed workflows for {w_name}')
-                self.metrics.get('workflows').get('Error')[w_name] = Gauge(f'error_finished_{w_name}_count'.replace('-','_'), f'Number of error workflows for {w_name}')
-                self.metrics.get('workflows').get('Failed')[w_name] = Gauge(f'failed_finished_{w_name}_count'.replace('-','_'), f'Number of failed workflows for {w_name}')
-        
-        else:
-            self.metrics = {}
+            log.error(f"Cluster context can not be retrieved: {e}")
+
+
+    def __workflow_caches(self):
+        """
+        Returns the workflow caches of the tracked namespaces, restricted to
+        the namespaces or workersizes of this shard. Namespace sharding of
+        all the namespaces filters the workflows as they are received, the
+        other modes only watch the owned workflows.
+        """
+        namespaces = workflow_namespaces()
+        label_selector = self.shard.label_selector(self.worker_catalogue.names())
+
+        log.info(
+            f"Tracking the workflows of {', '.join(namespaces) if namespaces else 'all namespaces'}, "
+            f"shard {self.shard}."
+        )
 
-    def __get_workflows(self, label_selector=''):
-        try:
-            crd_client = CustomObjectsApi(self.api_client)
-
-            workflows = crd_client.list_namespaced_custom_object(
-                group='argoproj.io', 
-                version='v1alpha1', 
-                namespace='argo',
-                plural='workflows',
-                label_selector=label_selector,
-            )
-            return workflows.get('items')
-        except client.ApiException as e:
-            print(f"Error fetching Argo Workflows: {e}", flush=True) 
-            return []
-
-    def publish_metrics(self):
-        for worker, size in self.workers.items():
-            self.metrics.get('nodes').get(worker).set(size)
-            
-        for state, workers  in self.metrics.get('workflows').items():
-            for worker_type, metric in workers.items():
-                if metric != 'Pods_pending':
-                    label_selector = f'workflow.nebulouscloud.eu/workersize={worker_type}'
-                    metric.set(
-                        len(self.__get_workflows(
-                            label_selector+f',workflows.argoproj.io/phase={state}'
-                        ))
-                    )
-
-        for worker in self.workers:
-            workflows = self.__get_workflows(
-                f'workflow.nebulouscloud.eu/workersize={worker},workflows.argoproj.io/phase=Running',
+        if namespaces is None:
+            by_namespace = self.shard.enabled and self.shard.by == 'namespace'
+            return [WorkflowCache(
+                self.api_client,
+                None,
+                label_selector,
+                filter=self.shard.owns_workflow if by_namespace else None,
+            )]
+
+        if self.shard.by == 'namespace':
+            namespaces = [namespace for namespace in namespaces if self.shard.owns(namespace)]
+        return [
+            WorkflowCache(self.api_client, namespace, label_selector)
+            for namespace in namespaces
+        ]
+
+    def __reshard(self):
+        """
+        Follows the workersizes owned by this shard as the catalogue changes.
+        """
+        label_selector = self.shard.label_selector(self.worker_catalogue.names())
+        for cache in self.workflow_caches:
+            if cache.kwargs.get('label_selector') != label_selector:
+                log.info(f"Watching {cache.name} with {label_selector}.")
+                cache.reselect(label_selector=label_selector)
+
+    @classmethod
+    def offline(cls, worker_catalogue, admission, sizing_mode=SIZING_MODE):
+        """
+        Returns a Scheduler that only sizes workflows, with the given
+        catalogue (a SizeIndex) and AdmissionPolicy and without any cluster
+        connection, for the simulator.
+        """
+        scheduler = cls.__new__(cls)
+        scheduler.worker_catalogue = worker_catalogue
+        scheduler.admission = admission
+        scheduler.sizing_mode = sizing_mode
+        return scheduler
+
+    def caches(self):
+        caches = [self.worker_catalogue, self.node_controller, *self.workflow_caches]
+        if self.shard_demand is not None:
+            caches.append(self.shard_demand.leases)
+        return caches
+
+    def initial_sweep(self):
+        """
+        Second phase of the startup, in the background: waits for every cache
+        to sync and labels all the nodes at once, after which the scheduler
+        is ready.
+        """
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        for cache in self.caches():
+            if not cache.wait_for_sync(max(0, deadline - time.monotonic())):
+                log.error(f"Cache {cache.name} not synced after {STARTUP_TIMEOUT:.0f}s, the scheduler is not ready.")
+                cache.wait_for_sync()
+                log.info(f"Cache {cache.name} synced.")
+
+        if not self.worker_catalogue.names():
+            log.error("No workflow workers defined.")
+
+        self.label_workflow_nodes()
+        self.started.set()
+        log.info("Scheduler ready.")
+
+    def readiness(self):
+        """
+        Returns whether the initial sweep is over, along with the state of
+        each startup phase.
+        """
+        # Also answered when the construction failed part of the way.
+        started = getattr(self, 'started', None)
+        worker_catalogue = getattr(self, 'worker_catalogue', None)
+        node_controller = getattr(self, 'node_controller', None)
+        caches = getattr(self, 'workflow_caches', ())
+
+        if worker_catalogue is not None and worker_catalogue.synced.is_set():
+            catalogue = 'synced'
+        else:
+            catalogue = 'warm' if getattr(self, 'warm_started', False) else 'empty'
+
+        ready = started is not None and started.is_set()
+        return ready, {
+            'catalogue': catalogue,
+            'nodes': node_controller is not None and node_controller.nodes.synced.is_set(),
+            'workflows': bool(caches) and all(cache.synced.is_set() for cache in caches),
+            'labelled': ready,
+        }
+
+    def __await_catalogue(self):
+        """
+        Waits, up to CATALOGUE_SYNC_WAIT, for the first list of the catalogue
+        when it was not warm started: sized against an empty catalogue every
+        submission would be unschedulable.
+        """
+        if getattr(self, 'warm_started', False):
+            return
+        synced = getattr(self.worker_catalogue, 'synced', None)
+        if synced is None or synced.is_set():
+            return
+        if not synced.wait(CATALOGUE_SYNC_WAIT):
+            log.warning(f"Catalogue not synced after {CATALOGUE_SYNC_WAIT:.0f}s, sizing against what is known.")
+
+    def limit_held(self, threads):
+        if getattr(self, 'admission', None) is not None:
+            self.admission.limit_held(threads)
+
+    def leading(self):
+        return self.elector is None or self.elector.leading
+
+    def start(self):
+        """
+        Starts the control loops, or campaigns for them with LEADER_ELECTION:
+        every replica serves submissions from its own caches, but only the
+        leader labels the nodes and syncs the WorkflowNodes.
+        """
+        if self.elector is not None:
+            self.elector.start()
+        else:
+            self.start_control_loops()
+
+    def stop(self):
+        if self.elector is not None:
+            self.elector.stop(timeout=2)
+        if self.shard_demand is not None:
+            self.shard_demand.stop(timeout=2)
+        self.stop_control_loops()
+
+    def start_control_loops(self):
+        self.control_loops = [
+            RefreshLoop(self.refresh, self.refresh_fingerprint, name='label-resync').start(),
+        ]
+        if WORKFLOW_NODES_SYNC:
+            self.control_loops.append(
+                RefreshLoop(self.sync_workflow_nodes, name='workflownodes-sync').start()
             )
+        LEADER.set(1)
+
+        if self.elector is not None and hasattr(self, 'node_controller'):
+            self.node_controller.enqueue_all()
+
+    def stop_control_loops(self):
+        loops, self.control_loops = self.control_loops, []
+        for loop in loops:
+            loop.stop(timeout=2)
+        LEADER.set(0)
+
+    @property
+    def workers(self):
+        return self.node_controller.workers()
+
+    def label_workflow_nodes(self, force=False, budget=None):
+        """
+        Relabels all the worker nodes at once. Nodes are otherwise labelled
+        by the node controller as they are added or change.
+        """
+        return self.node_controller.reconcile_all(force, budget)
+
+    def refresh(self, budget):
+        """
+        Periodic resync run by the label-resync loop: relabels the nodes whose label
+        drifted, within the API call budget of the cycle.
+        """
+        return self.label_workflow_nodes(budget=budget)
+
+    def refresh_fingerprint(self):
+        """
+        Changes with the node labels, schedulability and capacity and with
+        the catalogue, which are all the label resync depends on.
+        """
+        return (
+            self.node_controller.revision,
+            self.worker_catalogue.generation,
+        )
 
-            pending_workflows = 0
-            for workflow in workflows:
-                children = []
-                children_running = False
-                for node_id, node in workflow.get('status').get('nodes').items():
-                    if node.get('type') == 'DAG':
-                        if node.get('phase') == 'Pending':
-                            pending_workflows += 1
-                            break
-                        else:
-                            children = node.get('children')
-                    else:
-                        if children:
-                            if node_id in children:
-                                if node.get('phase') == 'Running':
-                                    children_running = True
-                                    break
-                            else: 
-                                children_running = True
-                                break
-                        else:
-                            if node.get('phase') == 'Pending':
-                                pending_workflows += 1
-                                break
-                    
-                if not children_running:
-                    pending_workflows += 1
-
-            self.metrics.get('workflows').get('Pods_pending') \
-                .get(worker).set(pending_workflows)
-
-
-    def check_publish_metrics(self):
-        if not self.metrics:
-            self.define_metrics()
-
-            if self.metrics:
-                self.label_workflow_nodes()
-                self.publish_metrics()
-            else:
-                error_message = "No workflow workers defined."
-                print(error_message, flush=True)
-                raise Exception(error_message)
-
-        self.publish_metrics()         
-
-    def __read_worker_sizes(self):
-        try:
-            workflow_nodes = self.__get_crds("workflowworkers")
 
-            if workflow_nodes.items: 
-                for i in workflow_nodes['items']: 
-                    pass
+    def sync_workflow_nodes(self, budget=None):
+        """
+        Mirrors the worker nodes as WorkflowNodes, within the API call
+        budget of the cycle.
+        """
+        return self.workflow_nodes.sync(budget)
 
-            return workflow_nodes
-        except client.ApiException as e:
-            print(f"Error fetching Argo Workflows: {e}", flush=True) 
-            return []
+    def get_status():
+        pass
 
+    def schedule_job():
+        pass
 
-    def __get_crds(self, plural):
+    def schedule_workflow(self, workflow, dry_run=False, catalogue=None):
+        return self.admit_workflow(workflow, dry_run, catalogue)[0]
+
+    def dry_run(self, workflows):
+        """
+        Schedules a batch of workflows without admitting them, all against
+        the same snapshot of the catalogue, and returns the patched
+        workflows along with their Admissions. Each workflow is decided as
+        if the ones before it had been admitted.
+        """
+        self.__await_catalogue()
+        catalogue = self.worker_catalogue.snapshot()
+        reserved = Counter()
+        return [
+            self.admit_workflow(workflow, dry_run=True, catalogue=catalogue, reserved=reserved)
+            for workflow in workflows
+        ]
+
+    def admit_workflow(self, workflow, dry_run=False, catalogue=None, reserved=None):
+        """
+        Pins the workflow to the workersize chosen by the admission policy
+        and returns it along with the Admission decision. The workflow
+        needs the largest CPU and the largest memory of its templates. With
+        the "template" SIZING_MODE every template is pinned to its own size.
+        A dry run decides from ``catalogue`` (by default the live one)
+        without reserving capacity or holding the workflow, counting the
+        hypothetical reservations in ``reserved`` instead.
+        """
+        if catalogue is None:
+            self.__await_catalogue()
+        if self.sizing_mode == 'template':
+            return self.admit_templates(workflow, dry_run, catalogue, reserved)
+
+        stamped = []
+        replaced = []
+        admission = None
         try:
-            crd_client = CustomObjectsApi(self.api_client)
-            crds = crd_client.list_cluster_custom_object(
-                self.group, 
-                self.v, 
-                plural
-            )
+            metadata = workflow.get('workflow').get('metadata')
+            spec = workflow.get('workflow').get('spec')
+
+            # One walk reads the resources and stamps the templates with a
+            # nodeSelector and an affinity shared by all of them; the
+            # workersize is filled in once admitted, or the stamps undone.
+            node_selector = {}
+            affinity = co_location_affinity(workflow.get('workflow'))
+            cpu = memory = None
+
+            with STAGES['resources'].time():
+                for template in spec.get('templates'):
+                    for kind in ('script', 'container'):
+                        if template.get(kind) and template.get(kind).get('resources'):
+                            for resource in template.get(kind).get('resources').values():
+                                cpu = max(cpu or 0, parse_cpu_to_millicores(resource.get('cpu', 0)))
+                                memory = max(memory or 0, parse_memory_to_bytes(resource.get('memory', 0)))
+
+                    if 'affinity' in template or 'nodeSelector' in template:
+                        replaced.append((template, template.get('affinity'), template.get('nodeSelector')))
+                    stamped.append(template)
+                    template['affinity'] = affinity
+                    template['nodeSelector'] = node_selector
+
+                if cpu is None:
+                    raise ValueError("no template requests resources")
+
+            with STAGES['admission'].time():
+                admission = self.admission.admit(
+                    cpu,
+                    memory,
+                    spec.get('priority') or 0,
+                    dry_run,
+                    catalogue,
+                    reserved,
+                )
+            log.debug("Workflow admitted", extra={'admission': admission})
 
-            return crds
-        except client.ApiException as e:
-            print(f"Error fetching CRDS: {e}", flush=True) 
-            return []
+            with STAGES['stamp'].time():
+                if admission.workersize:
+                    node_selector[WORKERSIZE_LABEL] = admission.workersize
+                    metadata.get('labels')[WORKERSIZE_LABEL] = admission.workersize
+                else:
+                    self.__unstamp(stamped, replaced)
+
+            return workflow, admission
         
-    def label_workflow_nodes(self):
-        nodes = sorted([ 
-                node for node in self.core_client.list_node().items if filter_nodes_by_label(node.metadata.labels, r"nebulouscloud\.eu/?.+worker?.+") and not node.spec.unschedulable
-            ], 
-            key=lambda x: (x.status.capacity.get("cpu"), x.status.capacity.get("memory")),
-            reverse=True,
-        )
+        except Exception as e:
+            log.warning(f"Workflow forwarded unscheduled: {e}")
+            self.__unstamp(stamped, replaced)
+            self.__release(admission, dry_run)
+            return workflow, Admission('error', None, None, 0)
+
+    @staticmethod
+    def __unstamp(templates, replaced):
+        """
+        Restores the affinity and nodeSelector of the templates as they were
+        submitted.
+        """
+        for template in templates:
+            template.pop('affinity', None)
+            template.pop('nodeSelector', None)
+        for template, affinity, node_selector in replaced:
+            if affinity is not None:
+                template['affinity'] = affinity
+            if node_selector is not None:
+                template['nodeSelector'] = node_selector
+
+    def __release(self, admission, dry_run):
+        """
+        Gives back the capacity reserved for a workflow that is forwarded
+        unscheduled after all.
+        """
+        if admission is not None and admission.workersize and not dry_run:
+            self.admission.release(admission)
+
+    def admit_templates(self, workflow, dry_run=False, catalogue=None, reserved=None):
+        """
+        Sizes every container and script template from its own requests,
+        and leaves the workflow unscheduled if one of them fits no size.
+        The workflow goes through the admission policy with the largest
+        CPU and the largest memory of its templates, and the templates of
+        that size follow the decision. Only the templates that ask for
+        co-location, or all of them if the workflow does, get the
+        co-location affinity, and they share a size holding all of them
+        since their pods must fit the same node.
+        """
+        stamped = []
+        replaced = []
+        admission = None
+        try:
+            metadata = workflow.get('workflow').get('metadata')
+            spec = workflow.get('workflow').get('spec')
+            index = catalogue or self.worker_catalogue
 
-        workflow_nodes = sorted(
-            self.__get_crds("workflowworkers").get("items"),
-            key=lambda x: (x.get("spec").get("cpu"), x.get("spec").get("memory")),
-            reverse=True,
-        )
+            with STAGES['resources'].time():
+                colocate_all = colocated(workflow.get('workflow'))
 
-        workers = {}
-
-        for node in nodes:
-            for workflow_node in workflow_nodes:
-                if node.status.capacity.get('cpu') >= workflow_node.get('spec').get('cpu') and \
-                    parse_memory_to_bytes(node.status.capacity.get('memory')) >= parse_memory_to_bytes(workflow_node.get('spec').get('memory')):
-                        try:
-                            body = {
-                                "metadata": {
-                                    "labels": {
-                                        "workflow.nebulouscloud.eu/workersize": workflow_node.get('metadata').get('name')
-                                    }
-                                }
-                            }
-
-                            self.core_client.patch_node(
-                                node.metadata.name,
-                                body,
-                            )
-                            if workflow_node.get('metadata').get('name') in workers:
-                                workers[workflow_node.get('metadata').get('name')] += 1
-                            else:
-                                workers[workflow_node.get('metadata').get('name')] = 1
-                            break
-
-                        except Exception as e:
-                            print(e, flush=True)
-
-        self.workers = workers
-
-
-    def sync_workflow_nodes(self):
-        group = "workflow.io"
-        plural = "workflownodes"
-        v = "v1"
-
-        nodes = self.core_client.list_node()
-
-        cluster_nodes = {}
-
-        if nodes.items:
-            for i in nodes.items:
-                if bool(re.match(r".+-ip-.+", i.metadata.name)) and not i.spec.unschedulable:
-                    cluster_nodes[i.metadata.name] = i.status.capacity
-
-        crd_client = CustomObjectsApi(self.api_client)
-        workflow_nodes = crd_client.list_cluster_custom_object(
-            group, 
-            v, 
-            plural
-        )
+                pods = []
+                for template in spec.get('templates'):
+                    resources = template_resources(template)
+                    if resources is not None:
+                        pods.append((template, resources, colocate_all or colocated(template)))
+
+                if not pods:
+                    return workflow, Admission('unschedulable', None, None, 0)
 
-        worker_nodes = []
-        if workflow_nodes.items: 
-            for i in workflow_nodes['items']: 
-                worker_nodes.append(i['metadata']['name'])
-
-        nodes_to_delete = set(worker_nodes) - set(cluster_nodes.keys())
-        nodes_to_add = set(cluster_nodes.keys()) - set(worker_nodes)
-
-        if nodes_to_delete:
-            for i in nodes_to_delete: 
-                api_response = crd_client.delete_cluster_custom_object(
-                    group, 
-                    v, 
-                    plural,
-                    i,
-                    body=client.V1DeleteOptions(),
+                group_resources = largest_resources(
+                    resources for _, resources, colocate in pods if colocate
                 )
-                print(api_response, flush=True)
-
-        if nodes_to_add:
-            for i in nodes_to_add: 
-                body = {
-                    "apiVersion": f"{group}/{v}",
-                    "kind": "WorkflowNodes",
-                    "metadata": {
-                        "name": i
-                    },
-                    "spec": cluster_nodes[i]
-                }
-
-                api_response = crd_client.create_cluster_custom_object(
-                    group, 
-                    v, 
-                    plural,
-                    body=body
+
+                # Every template is sized before anything is admitted or
+                # stamped.
+                sizes = {}
+                for _, resources, colocate in pods:
+                    resources = group_resources if colocate else resources
+                    if resources not in sizes:
+                        size = index.smallest_fitting(*resources)
+                        if size is None:
+                            return workflow, Admission('unschedulable', None, None, 0)
+                        sizes[resources] = size.name
+
+            with STAGES['admission'].time():
+                admission = self.admission.admit(
+                    *largest_resources(resources for _, resources, _ in pods),
+                    spec.get('priority') or 0,
+                    dry_run,
+                    catalogue,
+                    reserved,
                 )
+            log.debug("Workflow admitted", extra={'admission': admission})
 
-        self.publish_metrics()
+            if not admission.workersize:
+                return workflow, admission
 
-    def get_status():
-        pass
+            with STAGES['stamp'].time():
+                # The templates of a size share one nodeSelector, and the
+                # co-located ones one affinity.
+                affinity = None
+                node_selectors = {}
+                for template, resources, colocate in pods:
+                    workersize = sizes[group_resources if colocate else resources]
+                    if workersize == admission.requested:
+                        workersize = admission.workersize
 
-    def schedule_job():
-        pass
+                    node_selector = node_selectors.get(workersize)
+                    if node_selector is None:
+                        node_selector = node_selectors[workersize] = {WORKERSIZE_LABEL: workersize}
 
-    def schedule_workflow(self, workflow):
-        try:
+                    if 'affinity' in template or 'nodeSelector' in template:
+                        replaced.append((template, template.get('affinity'), template.get('nodeSelector')))
+                    stamped.append(template)
 
-            resources = []
-
-            for template in workflow.get('workflow').get('spec').get('templates'):
-                if template.get('script'):
-                    if template.get('script').get('resources'):
-                        for resource in template.get('script').get('resources').values():
-                            resources.append(resource)
-                if template.get('container'):
-                    if template.get('container').get('resources'):
-                        for resource in template.get('container').get('resources').values():
-                            resources.append(resource)
-
-            resources = sorted(
-                resources, 
-                key=lambda x: (x.get('cpu'), parse_memory_to_bytes(x.get('memory'))),
-                reverse=False,
-            )[-1]
-
-            workflow_nodes = sorted(
-                self.__get_crds("workflowworkers").get("items"),
-                key=lambda x: (x.get("spec").get("cpu"), x.get("spec").get("memory")),
-                reverse=False,
-            )
+                    if colocate:
+                        if affinity is None:
+                            affinity = co_location_affinity(workflow.get('workflow'))
+                        template['affinity'] = affinity
+                    template['nodeSelector'] = node_selector
+
+                metadata.get('labels')[WORKERSIZE_LABEL] = admission.workersize
+
+            return workflow, admission
 
-            for workflow_node in workflow_nodes:
-                if workflow_node.get('spec').get('cpu') >= resources.get('cpu') and \
-                    parse_memory_to_bytes(workflow_node.get('spec').get('memory')) >= parse_memory_to_bytes(resources.get('memory')):
-                        workflow.get('workflow').get('metadata') \
-                            .get('labels')['workflow.nebulouscloud.eu/workersize'] = workflow_node.get("metadata").get("name")
-                        for template in workflow.get('workflow').get('spec').get('templates'):
-                            template['affinity'] = {
-                                'podAffinity': {
-                                    'requiredDuringSchedulingIgnoredDuringExecution': [{
-                                        'labelSelector': {
-                                            'matchLabels': {
-                                                'workflow': workflow.get("workflow").get('metadata').get('labels').get('workflow')
-                                            },
-                                        },
-                                        'topologyKey': 'kubernetes.io/hostname',
-                                    }]
-                                }
-                            }
-                            template['nodeSelector'] = {
-                                'workflow.nebulouscloud.eu/workersize': workflow_node.get("metadata").get("name")
-                            }
-                        break
-
-            return workflow
-        
         except Exception as e:
-            print(e, flush=True)
-            return workflow
+            log.warning(f"Workflow forwarded unscheduled: {e}")
+            self.__unstamp(stamped, replaced)
+            self.__release(admission, dry_run)
+            return workflow, Admission('error', None, None, 0)
 
 def main():
     sched = Scheduler()
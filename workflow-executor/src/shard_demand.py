@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import Counter
+from datetime import datetime, timezone
+from kubernetes import client
+
+from informer import Informer, object_key
+from leader import LEASE_NAME, lease_identity, lease_namespace
+
+
+log = logging.getLogger(__name__)
+
+SHARD_DEMAND_LABEL = 'workflow.nebulouscloud.eu/shard-demand'
+DEMAND_ANNOTATION = 'workflow.nebulouscloud.eu/demand'
+
+# Seconds between two publications of the demand of this shard.
+SHARD_DEMAND_PERIOD = float(os.environ.get('SHARD_DEMAND_PERIOD', 5))
+# Seconds after which the demand of a shard that stopped publishing is dropped.
+SHARD_DEMAND_TTL = float(os.environ.get('SHARD_DEMAND_TTL', 30))
+
+
+def lease_demand(lease):
+    """
+    Returns the demand per workersize published on a shard Lease.
+    """
+    annotations = lease.metadata.annotations or {}
+    demand = json.loads(annotations.get(DEMAND_ANNOTATION) or '{}')
+    return {str(size): int(count) for size, count in demand.items()}
+
+
+class ShardDemand():
+    """
+    The pending demand of every shard, as seen from one replica. Each
+    replica publishes the demand of its own shard, read through ``local``,
+    every ``period`` seconds on a Lease of its own ("<name>-shard-<index>")
+    and watches the Leases of the others. A shard whose Lease was not
+    renewed for ``ttl`` seconds, measured on the local clock since it was
+    last seen changing, no longer counts.
+
+    Each replica thus watches a handful of Leases instead of the workflows
+    of the other shards, and the demand it admits against lags theirs by
+    about ``period`` seconds.
+    """
+
+    def __init__(
+            self,
+            coordination_client,
+            shard,
+            local,
+            name = LEASE_NAME,
+            namespace = None,
+            identity = None,
+            period = SHARD_DEMAND_PERIOD,
+            ttl = SHARD_DEMAND_TTL,
+        ):
+
+        self.coordination_client = coordination_client
+        self.shard = shard
+        self.local = local
+        self.name = f"{name}-shard-{shard.index}"
+        self.namespace = namespace or lease_namespace()
+        self.identity = identity or lease_identity()
+        self.period = period
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        self.remote = {}
+        self.leases = Informer(
+            coordination_client.list_namespaced_lease,
+            self.namespace,
+            label_selector=SHARD_DEMAND_LABEL,
+            name='leases/shard-demand',
+        )
+        self.leases.add_handler(self.on_lease, lambda old, new: self.on_lease(new), self.on_lease_deleted)
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self.leases.start()
+            self._thread = threading.Thread(target=self.run, name="shard-demand", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stops publishing and deletes the Lease of this shard, so that the
+        other replicas drop its demand without waiting for ``ttl``.
+        """
+        self._stopped.set()
+        self.leases.stop()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def demand(self):
+        """
+        Returns the pending demand per workersize of this shard, live, and
+        of the other shards, as last published.
+        """
+        demand = Counter(self.local())
+        now = time.monotonic()
+        with self.lock:
+            for observed_at, remote in self.remote.values():
+                if now - observed_at < self.ttl:
+                    demand.update(remote)
+        return {workersize: count for workersize, count in demand.items() if count > 0}
+
+    def run(self):
+        log.info(f"Publishing the demand of shard {self.shard} on lease {self.namespace}/{self.name}.")
+        while not self._stopped.is_set():
+            try:
+                self.publish()
+            except Exception as e:
+                log.warning(f"Error publishing the demand on lease {self.namespace}/{self.name}: {e}")
+            self._stopped.wait(self.period)
+        self.withdraw()
+
+    def publish(self):
+        """
+        Writes the demand of this shard on its Lease, creating it if needed.
+        The renew time changes on every call, which tells the other
+        replicas that the shard is alive even when its demand does not.
+        """
+        body = client.V1Lease(
+            metadata=client.V1ObjectMeta(
+                name=self.name,
+                namespace=self.namespace,
+                labels={SHARD_DEMAND_LABEL: str(self.shard.index)},
+                annotations={DEMAND_ANNOTATION: json.dumps(self.local(), sort_keys=True)},
+            ),
+            spec=client.V1LeaseSpec(
+                holder_identity=self.identity,
+                lease_duration_seconds=int(self.ttl),
+                renew_time=datetime.now(timezone.utc),
+            ),
+        )
+        try:
+            self.coordination_client.patch_namespaced_lease(self.name, self.namespace, body)
+        except client.ApiException as e:
+            if e.status != 404:
+                raise
+            self.coordination_client.create_namespaced_lease(self.namespace, body)
+
+    def withdraw(self):
+        try:
+            self.coordination_client.delete_namespaced_lease(self.name, self.namespace)
+        except client.ApiException as e:
+            if e.status != 404:
+                log.warning(f"Error deleting lease {self.namespace}/{self.name}: {e}")
+        except Exception as e:
+            log.warning(f"Error deleting lease {self.namespace}/{self.name}: {e}")
+
+    def on_lease(self, lease):
+        if lease.metadata.name == self.name:
+            return
+        try:
+            demand = lease_demand(lease)
+        except (TypeError, ValueError, AttributeError) as e:
+            log.warning(f"Ignoring the demand of lease {object_key(lease)}: {e}")
+            return
+        with self.lock:
+            self.remote[object_key(lease)] = (time.monotonic(), demand)
+
+    def on_lease_deleted(self, lease):
+        with self.lock:
+            self.remote.pop(object_key(lease), None)
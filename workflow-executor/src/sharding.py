@@ -0,0 +1,104 @@
+import hashlib
+import os
+import re
+
+from bisect import bisect
+from workflow_cache import WORKERSIZE_LABEL
+
+
+# Comma separated namespaces whose workflows are tracked, "*" for all.
+WORKFLOW_NAMESPACES = os.environ.get('WORKFLOW_NAMESPACES', 'argo')
+
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 1))
+SHARD_INDEX = os.environ.get('SHARD_INDEX')
+SHARD_BY = os.environ.get('SHARD_BY', 'namespace')
+SHARD_REPLICAS = int(os.environ.get('SHARD_REPLICAS', 64))
+
+# Label selector no workflow matches, for the shards owning no workersize.
+MATCH_NOTHING = f"{WORKERSIZE_LABEL},!{WORKERSIZE_LABEL}"
+
+
+def workflow_namespaces(value=WORKFLOW_NAMESPACES):
+    """
+    Returns the namespaces to track, or None for all of them.
+    """
+    namespaces = [x.strip() for x in value.split(',') if x.strip()]
+    return None if not namespaces or '*' in namespaces else namespaces
+
+
+def shard_index(value=SHARD_INDEX):
+    """
+    Returns SHARD_INDEX or, when it is not set, the ordinal of a StatefulSet
+    pod taken from its hostname (e.g. "workflow-executor-2").
+    """
+    if value:
+        return int(value)
+    match = re.search(r"-(\d+)$", os.environ.get('HOSTNAME', ''))
+    return int(match.group(1)) if match else 0
+
+
+class HashRing():
+    """
+    Consistent hash ring of ``shards`` shards with ``replicas`` points each:
+    when the number of shards changes, only the keys of the moved arcs
+    change owner.
+    """
+
+    def __init__(self, shards, replicas=SHARD_REPLICAS):
+        points = sorted(
+            (self.hash(f"{shard}:{replica}"), shard)
+            for shard in range(shards)
+            for replica in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    @staticmethod
+    def hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def owner(self, key):
+        return self.shards[bisect(self.hashes, self.hash(key)) % len(self.hashes)]
+
+
+class Shard():
+    """
+    The part of the workflows tracked by this replica: the namespaces or the
+    workersizes that the hash ring gives to ``index`` out of ``count``.
+    Submissions are still admitted by any replica, from the demand of all
+    the shards that the replicas exchange through ShardDemand.
+    """
+
+    def __init__(self, index=None, count=SHARD_COUNT, by=SHARD_BY):
+        if by not in ('namespace', 'workersize'):
+            raise ValueError(f"Unknown SHARD_BY '{by}', expected namespace or workersize.")
+
+        self.index = shard_index() if index is None else index
+        self.count = count
+        self.by = by
+        self.ring = HashRing(count) if count > 1 else None
+
+    @property
+    def enabled(self):
+        return self.ring is not None
+
+    def owns(self, key):
+        return self.ring is None or self.ring.owner(key) == self.index
+
+    def owns_workflow(self, workflow):
+        return self.owns((workflow.get('metadata') or {}).get('namespace') or '')
+
+    def label_selector(self, workersizes):
+        """
+        Returns the label selector of the workflows of the owned workersizes.
+        """
+        if self.by != 'workersize' or not self.enabled:
+            return WORKERSIZE_LABEL
+
+        owned = sorted(x for x in workersizes if self.owns(x))
+        if not owned:
+            return MATCH_NOTHING
+        return f"{WORKERSIZE_LABEL} in ({','.join(owned)})"
+
+    def __str__(self):
+        return f"{self.index}/{self.count} by {self.by}" if self.enabled else "unsharded"
@@ -0,0 +1,70 @@
+import os
+
+from quantity import parse_cpu_to_millicores, parse_memory_to_bytes
+
+
+# "workflow" sizes the whole workflow after its largest template, "template"
+# sizes every template on its own.
+SIZING_MODE = os.environ.get('SIZING_MODE', 'workflow')
+
+COLOCATE_ANNOTATION = 'workflow.nebulouscloud.eu/colocate'
+
+POD_TEMPLATES = ('container', 'script')
+
+
+def template_resources(template):
+    """
+    Returns the (millicores, bytes) a container or script template needs to
+    be scheduled, or None for the templates that run no pod of their own.
+    As in Kubernetes, a resource without a request is requested at its
+    limit.
+    """
+    for kind in POD_TEMPLATES:
+        if template.get(kind) is not None:
+            resources = template.get(kind).get('resources') or {}
+            requests = resources.get('requests') or {}
+            limits = resources.get('limits') or {}
+
+            return (
+                parse_cpu_to_millicores(requests.get('cpu', limits.get('cpu', 0))),
+                parse_memory_to_bytes(requests.get('memory', limits.get('memory', 0))),
+            )
+    return None
+
+
+def largest_resources(resources):
+    """
+    Returns the (millicores, bytes) that hold every one of ``resources``,
+    the largest CPU and the largest memory, or None if there are none.
+    """
+    largest = None
+    for cpu, memory in resources:
+        largest = (cpu, memory) if largest is None else (max(largest[0], cpu), max(largest[1], memory))
+    return largest
+
+
+def colocated(obj):
+    """
+    Tells whether a workflow or a template asks, through the colocate
+    annotation, for its pods to run on the same node.
+    """
+    annotations = (obj.get('metadata') or {}).get('annotations') or {}
+    return str(annotations.get(COLOCATE_ANNOTATION, '')).lower() == 'true'
+
+
+def co_location_affinity(workflow):
+    """
+    Returns the pod affinity that keeps the pods of a workflow on one node.
+    """
+    return {
+        'podAffinity': {
+            'requiredDuringSchedulingIgnoredDuringExecution': [{
+                'labelSelector': {
+                    'matchLabels': {
+                        'workflow': workflow.get('metadata').get('labels').get('workflow')
+                    },
+                },
+                'topologyKey': 'kubernetes.io/hostname',
+            }]
+        }
+    }
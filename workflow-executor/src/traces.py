@@ -0,0 +1,76 @@
+import codec
+import logging
+import os
+import threading
+import time
+
+from sizing import POD_TEMPLATES
+
+
+log = logging.getLogger(__name__)
+
+# JSON lines file the submissions are appended to, for the simulator.
+TRACE_FILE = os.environ.get('TRACE_FILE')
+
+
+def trace_record(workflow):
+    """
+    Returns the parts of a workflow submission the scheduler sizes it from:
+    its metadata, priority and, for each template, its name, annotations
+    and resources. Taken before the rewrite, which modifies the workflow.
+    """
+    workflow = workflow.get('workflow') or {}
+    metadata = workflow.get('metadata') or {}
+    spec = workflow.get('spec') or {}
+
+    templates = []
+    for template in spec.get('templates') or ():
+        trimmed = {'name': template.get('name')}
+        if template.get('metadata'):
+            trimmed['metadata'] = template.get('metadata')
+        for kind in POD_TEMPLATES:
+            if template.get(kind) is not None:
+                trimmed[kind] = {'resources': template.get(kind).get('resources') or {}}
+        templates.append(trimmed)
+
+    return {
+        # Copies, since the rewrite adds the workersize label.
+        'metadata': {
+            key: dict(metadata[key]) if isinstance(metadata[key], dict) else metadata[key]
+            for key in ('name', 'generateName', 'namespace', 'labels', 'annotations')
+            if key in metadata
+        },
+        'spec': {
+            'priority': spec.get('priority'),
+            'templates': templates,
+        },
+    }
+
+
+class TraceRecorder():
+    """
+    Appends one JSON line per submission to ``path``: the submission time,
+    the trace_record of the workflow and the Admission it got.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'ab')
+        log.info(f"Recording the submissions to {path}.")
+
+    def record(self, workflow, admission, submitted=None):
+        line = codec.dumps({
+            'time': submitted or time.time(),
+            'workflow': workflow,
+            'admission': admission._asdict(),
+        })
+        try:
+            with self.lock:
+                self.file.write(line + b"\n")
+                self.file.flush()
+        except OSError as e:
+            log.warning(f"Could not record the submission to {self.path}: {e}")
+
+
+TRACER = TraceRecorder(TRACE_FILE) if TRACE_FILE else None
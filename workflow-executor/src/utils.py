@@ -1,54 +1,160 @@
+import json
 import logging
+import os
+import random
 import re
+import sys
+import time
+
+
+CHUNK_SIZE = 64 * 1024
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+
+# Attributes every LogRecord has; anything else was passed through ``extra``.
+RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+HOP_BY_HOP_HEADERS = frozenset([
+    'connection',
+    'keep-alive',
+    'proxy-authenticate',
+    'proxy-authorization',
+    'proxy-connection',
+    'te',
+    'trailer',
+    'transfer-encoding',
+    'upgrade',
+])
 
 class StreamFlushingHandler(logging.StreamHandler):
     def emit(self, record):
         super().emit(record)
         self.flush()
 
+class StructuredFormatter(logging.Formatter):
+    """
+    Appends the fields passed through ``extra`` to the message as key=value
+    pairs or, with ``json_lines``, formats each record as a JSON object.
+    """
+
+    def __init__(self, json_lines=False):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+        self.json_lines = json_lines
+
+    def format(self, record):
+        if not self.json_lines:
+            return super().format(record)
+
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(self.fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+    def formatMessage(self, record):
+        return super().formatMessage(record) + ''.join(
+            f" {key}={value}" for key, value in self.fields(record).items()
+        )
+
+    def fields(self, record):
+        return {
+            key: value for key, value in vars(record).items()
+            if key not in RECORD_ATTRIBUTES
+        }
+
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT):
+    """
+    Sends the records of every logger to stdout, flushed as they are
+    written, as text or as JSON lines (LOG_FORMAT=json).
+    """
+    handler = StreamFlushingHandler(sys.stdout)
+    handler.setFormatter(StructuredFormatter(json_lines=log_format == 'json'))
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+class BodyStream():
+    """
+    File-like view over the next ``length`` bytes of a socket stream. It has a
+    length, so requests forwards it with a Content-Length while reading it in
+    chunks instead of buffering it.
+    """
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def __len__(self):
+        return self.remaining
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        chunk = self.rfile.read(size) if size else b""
+        self.remaining -= len(chunk)
+        return chunk
+
+def read_body(body):
+    """
+    Reads a whole request body, a BodyStream in one read and a chunked one
+    chunk by chunk.
+    """
+    if isinstance(body, BodyStream):
+        return body.read()
+    return b"".join(body or ())
+
+def iter_chunked_body(rfile):
+    """
+    Decodes a ``Transfer-Encoding: chunked`` request body chunk by chunk.
+    """
+    while True:
+        size = int(rfile.readline().split(b';')[0].strip(), 16)
+        if size == 0:
+            while rfile.readline() not in (b'\r\n', b'\n', b''):
+                pass
+            return
+        yield rfile.read(size)
+        rfile.readline()
+
+def end_to_end_headers(headers):
+    """
+    Returns the (name, value) pairs of ``headers`` that a proxy must forward,
+    dropping hop-by-hop headers.
+    """
+    return [
+        (key, value) for key, value in headers.items()
+        if key.lower() not in HOP_BY_HOP_HEADERS
+    ]
+
 def filter_nodes_by_label(labels, regex):
     for key, _ in labels.items():   # iter on both keys and values
         if bool(re.match(regex, key)):
             return True
     return False
     
-def parse_memory_to_bytes(memory_string):
-    """
-    Parses a memory string (e.g., "1000Mi", "2Gi", "500Ki", or plain number for bytes)
-    into an integer representing bytes.
-    - Supports Ki (Kibibytes), Mi (Mebibytes), Gi (Gibibytes).
-    - Units are case-insensitive (e.g., "mi", "Mi" are both Mebibytes).
-    - Assumes powers of 1024 (Ki = 1024, Mi = 1024*1024, etc.).
-    - Supports decimal values (e.g., "1.5Gi").
-    """
-    if isinstance(memory_string, (int, float)): # If already a number, assume it's bytes
-        return int(memory_string)
-    if not isinstance(memory_string, str):
-        raise TypeError(f"Memory value must be a string or number, got {type(memory_string)}: '{memory_string}'")
-
-    memory_string = memory_string.strip()
-
-    # Check for plain number first (assumed to be bytes)
-    if memory_string.replace('.', '', 1).isdigit(): # Allows for a single decimal point
-        return int(float(memory_string))
-
-    # Regex to capture value and unit (Ki, Mi, Gi, case-insensitive)
-    # Updated regex to allow for decimal values in the number part
-    match = re.match(r"(\d+(\.\d+)?)([KkMmGg]i)$", memory_string)
-    if not match:
-        raise ValueError(
-            f"Invalid memory string format: '{memory_string}'. "
-            "Expected format like '1024Ki', '100Mi', '2Gi', '1.5Gi', or a plain number for bytes."
-        )
 
-    value = float(match.group(1)) # Use float to handle decimal values
-    unit = match.group(3).lower() # Converts unit to lowercase 'ki', 'mi', or 'gi'
-
-    if unit == "ki":
-        return int(value * 1024)
-    elif unit == "mi":
-        return int(value * (1024**2))
-    elif unit == "gi":
-        return int(value * (1024**3))
-    else:
-        raise ValueError(f"Unknown memory unit suffix: '{unit}' in '{memory_string}'")
\ No newline at end of file
+def call_with_retry(func, *args, attempts=3, backoff=0.5, retryable=None, **kwargs):
+    """
+    Calls ``func`` and retries it up to ``attempts`` times with jittered
+    exponential backoff while ``retryable(exception)`` is true.
+    """
+    for attempt in range(attempts):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts - 1 or (retryable and not retryable(e)):
+                raise
+            time.sleep(backoff * 2**attempt * random.uniform(0.5, 1.5))
@@ -0,0 +1,167 @@
+import codec
+import logging
+import os
+
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from kubernetes.client import CustomObjectsApi
+from informer import Informer
+from quantity import parse_cpu_to_millicores, parse_memory_to_bytes
+
+
+log = logging.getLogger(__name__)
+
+WorkerSize = namedtuple('WorkerSize', ['cpu', 'memory', 'name'])
+
+
+def build_index(workflow_workers):
+    """
+    Returns the (sizes, cpus) index of WorkflowWorkers objects, sorted by
+    (cpu, memory).
+    """
+    sizes = []
+
+    for workflow_worker in workflow_workers:
+        name = workflow_worker.get('metadata').get('name')
+        spec = workflow_worker.get('spec') or {}
+        try:
+            sizes.append(WorkerSize(
+                parse_cpu_to_millicores(spec.get('cpu')),
+                parse_memory_to_bytes(spec.get('memory')),
+                name,
+            ))
+        except (TypeError, ValueError) as e:
+            log.warning(f"Ignoring WorkflowWorkers {name}: {e}")
+
+    sizes.sort()
+    return (sizes, [size.cpu for size in sizes])
+
+
+class SizeIndex():
+    """
+    WorkerSizes sorted by (cpu, memory), so fitting a request to a size is a
+    bisect on cpu followed by a short scan on memory. A SizeIndex built from
+    ``WorkerCatalogue.snapshot()`` keeps answering from the catalogue as it
+    was, whatever changes meanwhile.
+    """
+
+    def __init__(self, index=([], [])):
+        self.index = index
+
+    def snapshot(self):
+        return SizeIndex(self.index)
+
+    def names(self):
+        return [size.name for size in self.index[0]]
+
+    def smallest_fitting(self, cpu, memory):
+        """
+        Returns the smallest size with at least ``cpu`` millicores and
+        ``memory`` bytes, or None.
+        """
+        sizes, cpus = self.index
+
+        for i in range(bisect_left(cpus, cpu), len(sizes)):
+            if sizes[i].memory >= memory:
+                return sizes[i]
+        return None
+
+    def fitting(self, cpu, memory, count=None):
+        """
+        Returns, smallest first, up to ``count`` sizes with at least ``cpu``
+        millicores and ``memory`` bytes.
+        """
+        sizes, cpus = self.index
+
+        result = []
+        for i in range(bisect_left(cpus, cpu), len(sizes)):
+            if sizes[i].memory >= memory:
+                result.append(sizes[i])
+                if len(result) == count:
+                    break
+        return result
+
+    def largest_fitting(self, cpu, memory):
+        """
+        Returns the largest size that fits in ``cpu`` millicores and
+        ``memory`` bytes, or None.
+        """
+        sizes, cpus = self.index
+
+        for i in range(bisect_right(cpus, cpu) - 1, -1, -1):
+            if sizes[i].memory <= memory:
+                return sizes[i]
+        return None
+
+
+class WorkerCatalogue(Informer, SizeIndex):
+    """
+    Watch-driven catalogue of the WorkflowWorkers sizes. CPU (millicores) and
+    memory (bytes) are normalized once per change into a SizeIndex.
+    """
+
+    def __init__(self, api_client, group="workflow.io", version="v1", cache_file=None, **kwargs):
+        crd_client = CustomObjectsApi(api_client)
+        self.cache_file = cache_file
+
+        super().__init__(
+            crd_client.list_cluster_custom_object,
+            group=group,
+            version=version,
+            plural='workflowworkers',
+            name='workflowworkers',
+            **kwargs,
+        )
+
+        self.index = ([], [])
+
+        self.add_handler(
+            lambda x: self.__rebuild(),
+            lambda x, y: self.__rebuild(),
+            lambda x: self.__rebuild(),
+        )
+
+    def warm_start(self):
+        """
+        Seeds the catalogue with the copy saved in ``cache_file`` by the
+        last run, so that submissions are sized before the first list.
+        Returns whether a copy was loaded.
+        """
+        if not self.cache_file:
+            return False
+        try:
+            with open(self.cache_file, 'rb') as f:
+                items = codec.loads(f.read())
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            log.warning(f"Ignoring the saved catalogue {self.cache_file}: {e}")
+            return False
+
+        self.seed(items)
+        log.info(f"Warm started the catalogue with {len(items)} sizes from {self.cache_file}.")
+        return True
+
+    def relist(self):
+        super().relist()
+        self.save()
+
+    def save(self):
+        """
+        Saves the listed catalogue to ``cache_file`` for the next warm start.
+        """
+        if not self.cache_file:
+            return
+        try:
+            temporary = f"{self.cache_file}.tmp"
+            with open(temporary, 'wb') as f:
+                f.write(codec.dumps(self.list()))
+            os.replace(temporary, self.cache_file)
+        except OSError as e:
+            log.warning(f"Could not save the catalogue to {self.cache_file}: {e}")
+
+    def __rebuild(self):
+        self.index = build_index(self.store.values())
+
+        if self.synced.is_set():
+            self.save()
@@ -0,0 +1,37 @@
+from kubernetes.client import CustomObjectsApi
+from informer import Informer
+
+
+WORKERSIZE_LABEL = 'workflow.nebulouscloud.eu/workersize'
+PHASE_LABEL = 'workflows.argoproj.io/phase'
+
+
+def workflow_labels(workflow):
+    return (workflow.get('metadata') or {}).get('labels') or {}
+
+
+class WorkflowCache(Informer):
+    """
+    Watch-driven cache of the Argo workflows that carry a workersize label.
+    A ``namespace`` of None watches the workflows of all the namespaces.
+    """
+
+    def __init__(self, api_client, namespace='argo', label_selector=WORKERSIZE_LABEL, **kwargs):
+        crd_client = CustomObjectsApi(api_client)
+
+        if namespace is None:
+            list_func = crd_client.list_cluster_custom_object
+        else:
+            list_func = crd_client.list_namespaced_custom_object
+            kwargs['namespace'] = namespace
+
+        super().__init__(
+            list_func,
+            group='argoproj.io',
+            version='v1alpha1',
+            plural='workflows',
+            label_selector=label_selector,
+            name=f"workflows/{namespace or '*'}",
+            **kwargs,
+        )
+
@@ -0,0 +1,110 @@
+import threading
+
+from collections import Counter
+from informer import object_key
+from workflow_cache import PHASE_LABEL, WORKERSIZE_LABEL, workflow_labels
+
+
+PODS_PENDING = 'Pods_pending'
+
+
+def workflow_pods_pending(workflow):
+    """
+    Tells whether a Running workflow is waiting for its pods: either a DAG or
+    a step is Pending, or none of the children of the DAG is Running yet.
+    """
+    nodes = (workflow.get('status') or {}).get('nodes') or {}
+
+    children = []
+    for node_id, node in nodes.items():
+        if node.get('type') == 'DAG':
+            if node.get('phase') == 'Pending':
+                return True
+            children = node.get('children')
+        else:
+            if children:
+                if node_id not in children or node.get('phase') == 'Running':
+                    return False
+            elif node.get('phase') == 'Pending':
+                return True
+
+    return True
+
+
+class WorkflowCounters():
+    """
+    Workflow counts per (workersize, phase) and per workersize with pending
+    pods, maintained from the add, update and delete events of a workflow
+    informer. Each event only touches the counters of the workflow it
+    carries.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = Counter()
+        self.pods_pending = Counter()
+        self.entries = {}
+
+    def attach(self, informer):
+        informer.add_handler(self.on_add, self.on_update, self.on_delete)
+        return self
+
+    def on_add(self, workflow):
+        self.__apply(object_key(workflow), workflow)
+
+    def on_update(self, old, new):
+        self.__apply(object_key(new), new)
+
+    def on_delete(self, workflow):
+        self.__apply(object_key(workflow), None)
+
+    def demand(self):
+        """
+        Returns the pending demand per workersize: the Pending workflows and
+        the Running workflows waiting for their pods.
+        """
+        with self.lock:
+            demand = Counter(self.pods_pending)
+            for (workersize, phase), count in self.phases.items():
+                if phase == 'Pending':
+                    demand[workersize] += count
+            return {workersize: count for workersize, count in demand.items() if count > 0}
+
+    def snapshot(self):
+        """
+        Returns copies of the counts per (workersize, phase) and of the
+        counts of workflows with pending pods per workersize.
+        """
+        with self.lock:
+            return dict(self.phases), dict(self.pods_pending)
+
+    def __apply(self, key, workflow):
+        entry = None
+        if workflow is not None:
+            labels = workflow_labels(workflow)
+            phase = labels.get(PHASE_LABEL)
+            entry = (
+                labels.get(WORKERSIZE_LABEL),
+                phase,
+                phase == 'Running' and workflow_pods_pending(workflow),
+            )
+
+        with self.lock:
+            old = self.entries.get(key)
+            if old == entry:
+                return
+
+            if old is not None:
+                self.__count(old, -1)
+                del self.entries[key]
+            if entry is not None:
+                self.__count(entry, 1)
+                self.entries[key] = entry
+
+    def __count(self, entry, delta):
+        workersize, phase, pods_pending = entry
+
+        self.phases[(workersize, phase)] += delta
+
+        if pods_pending:
+            self.pods_pending[workersize] += delta
@@ -0,0 +1,127 @@
+import logging
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from kubernetes import client
+from kubernetes.client import CustomObjectsApi
+from node_controller import is_worker_node, retryable
+from utils import call_with_retry
+
+
+log = logging.getLogger(__name__)
+
+WORKFLOW_NODES_WORKERS = int(os.environ.get('WORKFLOW_NODES_WORKERS', 16))
+WORKFLOW_NODES_ATTEMPTS = int(os.environ.get('WORKFLOW_NODES_ATTEMPTS', 3))
+
+
+class WorkflowNodesMirror():
+    """
+    Mirrors the schedulable worker nodes as WorkflowNodes objects whose spec
+    is the node capacity. The nodes are read from the node informer, so a
+    sync costs one LIST of the WorkflowNodes, and only the objects that are
+    missing, stale or orphaned are created, patched or deleted,
+    concurrently with up to WORKFLOW_NODES_WORKERS calls in flight.
+    """
+
+    def __init__(self, api_client, nodes, group="workflow.io", version="v1"):
+        self.crd_client = CustomObjectsApi(api_client)
+        self.nodes = nodes
+        self.group = group
+        self.version = version
+        self.plural = "workflownodes"
+
+    def sync(self, budget=None):
+        """
+        Brings the WorkflowNodes in line with the nodes. With a budget, the
+        writes it does not allow are left for the next sync, which is told
+        by returning False.
+        """
+        desired = {
+            node.metadata.name: dict(node.status.capacity or {})
+            for node in self.nodes.list()
+            if is_worker_node(node)
+        }
+
+        mirrored = self.crd_client.list_cluster_custom_object(
+            self.group,
+            self.version,
+            self.plural,
+        )
+        current = {
+            item['metadata']['name']: item.get('spec') or {}
+            for item in mirrored.get('items') or []
+        }
+
+        writes = [
+            (self.__delete, name) for name in current.keys() - desired.keys()
+        ] + [
+            (self.__create, name, desired[name]) for name in desired.keys() - current.keys()
+        ] + [
+            (self.__patch, name, current[name], desired[name])
+            for name in desired.keys() & current.keys()
+            if current[name] != desired[name]
+        ]
+
+        granted = budget.take(len(writes)) if budget else len(writes)
+        if writes[:granted]:
+            with ThreadPoolExecutor(max_workers=WORKFLOW_NODES_WORKERS) as executor:
+                for _ in executor.map(lambda x: self.__try(*x), writes[:granted]):
+                    pass
+
+        return granted == len(writes)
+
+    def __try(self, func, name, *args):
+        try:
+            call_with_retry(
+                func,
+                name,
+                *args,
+                attempts=WORKFLOW_NODES_ATTEMPTS,
+                retryable=retryable,
+            )
+        except client.ApiException as e:
+            # Created or deleted meanwhile: the next sync sees the result.
+            if e.status not in (404, 409):
+                log.warning(f"Error syncing WorkflowNodes {name}: {e}")
+        except Exception as e:
+            log.warning(f"Error syncing WorkflowNodes {name}: {e}")
+
+    def __create(self, name, capacity):
+        self.crd_client.create_cluster_custom_object(
+            self.group,
+            self.version,
+            self.plural,
+            body={
+                "apiVersion": f"{self.group}/{self.version}",
+                "kind": "WorkflowNodes",
+                "metadata": {
+                    "name": name
+                },
+                "spec": capacity,
+            },
+        )
+        log.info("Created WorkflowNodes", extra={'node': name})
+
+    def __patch(self, name, old, new):
+        # Merge patch: the resources the node no longer has are nulled.
+        spec = dict(new)
+        spec.update((key, None) for key in old.keys() - new.keys())
+
+        self.crd_client.patch_cluster_custom_object(
+            self.group,
+            self.version,
+            self.plural,
+            name,
+            {"spec": spec},
+        )
+        log.info("Updated WorkflowNodes", extra={'node': name})
+
+    def __delete(self, name):
+        self.crd_client.delete_cluster_custom_object(
+            self.group,
+            self.version,
+            self.plural,
+            name,
+            body=client.V1DeleteOptions(),
+        )
+        log.info("Deleted WorkflowNodes", extra={'node': name})
@@ -0,0 +1,122 @@
+import heapq
+import threading
+import time
+
+from collections import deque
+
+
+class RateLimitedQueue():
+    """
+    Work queue in the spirit of client-go's rate limited queue. An item is
+    queued at most once, is never handed to two workers at the same time,
+    and items that failed are retried after a per-item exponential backoff.
+    All items leave the queue through a token bucket of ``qps`` with
+    ``burst``.
+    """
+
+    def __init__(self, qps=10, burst=100, base_delay=0.5, max_delay=60):
+        self.qps = qps
+        self.burst = burst
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.condition = threading.Condition()
+        self.queue = deque()
+        self.dirty = set()
+        self.processing = set()
+        self.delayed = []
+        self.failures = {}
+
+        self.tokens = burst
+        self.refilled = time.monotonic()
+        self.stopped = False
+
+    def add(self, item):
+        with self.condition:
+            if self.stopped or item in self.dirty:
+                return
+            self.dirty.add(item)
+            if item not in self.processing:
+                self.queue.append(item)
+                self.condition.notify()
+
+    def add_after(self, item, delay):
+        with self.condition:
+            heapq.heappush(self.delayed, (time.monotonic() + delay, id(item), item))
+            self.condition.notify()
+
+    def add_rate_limited(self, item):
+        with self.condition:
+            failures = self.failures.get(item, 0)
+            self.failures[item] = failures + 1
+        self.add_after(item, min(self.base_delay * 2**failures, self.max_delay))
+
+    def forget(self, item):
+        with self.condition:
+            self.failures.pop(item, None)
+
+    def get(self, timeout=None):
+        """
+        Returns the next item to process, or None on shutdown or timeout.
+        Every item returned must be handed back with ``done``.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self.condition:
+            while not self.stopped:
+                now = time.monotonic()
+                while self.delayed and self.delayed[0][0] <= now:
+                    self.__add(heapq.heappop(self.delayed)[2])
+
+                wait = self.__take_token(now) if self.queue else None
+                if self.queue and wait == 0:
+                    item = self.queue.popleft()
+                    self.dirty.discard(item)
+                    self.processing.add(item)
+                    return item
+
+                if self.delayed:
+                    wait = min(wait or self.max_delay, self.delayed[0][0] - now)
+                if deadline is not None:
+                    if now >= deadline:
+                        return None
+                    wait = min(wait or deadline - now, deadline - now)
+                self.condition.wait(wait)
+
+        return None
+
+    def done(self, item):
+        with self.condition:
+            self.processing.discard(item)
+            if item in self.dirty:
+                self.queue.append(item)
+                self.condition.notify()
+
+    def shutdown(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def __len__(self):
+        with self.condition:
+            return len(self.queue) + len(self.delayed)
+
+    def __add(self, item):
+        if item in self.dirty:
+            return
+        self.dirty.add(item)
+        if item not in self.processing:
+            self.queue.append(item)
+
+    def __take_token(self, now):
+        """
+        Takes a token if one is available and returns 0, otherwise returns
+        the time to wait for the next one.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.qps)
+        self.refilled = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.qps
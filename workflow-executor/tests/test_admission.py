@@ -0,0 +1,201 @@
+import threading
+import time
+
+from collections import Counter
+
+from admission import AdmissionPolicy
+from worker_catalogue import SizeIndex, build_index
+
+GIB = 2**30
+
+CATALOGUE = SizeIndex(build_index([
+    {'metadata': {'name': 'small'}, 'spec': {'cpu': '1', 'memory': '2Gi'}},
+    {'metadata': {'name': 'medium'}, 'spec': {'cpu': '2', 'memory': '4Gi'}},
+    {'metadata': {'name': 'large'}, 'spec': {'cpu': '4', 'memory': '8Gi'}},
+]))
+
+
+def policy(workers, demand=None, **kwargs):
+    kwargs.setdefault('max_promotion', 1)
+    kwargs.setdefault('hold_timeout', 0)
+    kwargs.setdefault('reservation_ttl', 0)
+    return AdmissionPolicy(CATALOGUE, lambda: workers, lambda: demand or {}, **kwargs)
+
+
+def test_admit_smallest_fitting():
+    admission = policy({'small': 1, 'medium': 1}).admit(500, GIB)
+
+    assert admission.action == 'admit'
+    assert admission.workersize == 'small'
+
+
+def test_unschedulable():
+    admission = policy({'large': 1}).admit(8000, GIB)
+
+    assert admission.action == 'unschedulable'
+    assert admission.workersize is None
+
+
+def test_promote_when_saturated():
+    admission = policy({'small': 1, 'medium': 1}, {'small': 1}).admit(500, GIB)
+
+    assert admission.action == 'promote'
+    assert admission.workersize == 'medium'
+    assert admission.requested == 'small'
+
+
+def test_promote_within_max_promotion():
+    workers, demand = {'small': 1, 'large': 1}, {'small': 1}
+
+    assert policy(workers, demand, max_promotion=1).admit(500, GIB).action == 'overflow'
+    assert policy(workers, demand, max_promotion=2).admit(500, GIB).workersize == 'large'
+
+
+def test_no_promotion():
+    admission = policy({'small': 1, 'medium': 1}, {'small': 1}, max_promotion=0).admit(500, GIB)
+
+    assert admission.action == 'overflow'
+    assert admission.workersize == 'small'
+
+
+def test_pool_without_nodes_is_saturated():
+    admission = policy({'medium': 1}).admit(500, GIB)
+
+    assert admission.action == 'promote'
+    assert admission.workersize == 'medium'
+
+
+def test_reservations_count_as_backlog():
+    admissions = policy({'small': 1, 'medium': 1}, reservation_ttl=60)
+
+    assert admissions.admit(500, GIB).workersize == 'small'
+    assert admissions.admit(500, GIB).workersize == 'medium'
+    assert admissions.admit(500, GIB).action == 'overflow'
+
+
+def test_reservations_expire():
+    admissions = policy({'small': 1}, reservation_ttl=0.05)
+
+    assert admissions.admit(500, GIB).action == 'admit'
+    assert admissions.admit(500, GIB).action == 'overflow'
+    time.sleep(0.06)
+    assert admissions.admit(500, GIB).action == 'admit'
+
+
+def test_dry_run_reserves_nothing():
+    admissions = policy({'small': 1}, reservation_ttl=60, hold_timeout=1)
+
+    for _ in range(3):
+        assert admissions.admit(500, GIB, dry_run=True).action == 'admit'
+    assert admissions.admit(500, GIB).action == 'admit'
+    assert admissions.admit(500, GIB, dry_run=True).action == 'hold'
+
+
+def test_dry_run_batch_counts_its_own_reservations():
+    admissions = policy({'small': 1, 'medium': 1}, reservation_ttl=60)
+    reserved = Counter()
+
+    decisions = [admissions.admit(500, GIB, dry_run=True, reserved=reserved) for _ in range(3)]
+
+    assert [x.workersize for x in decisions] == ['small', 'medium', 'small']
+    assert [x.action for x in decisions] == ['admit', 'promote', 'overflow']
+    assert reserved == Counter(small=2, medium=1)
+    assert sum(admissions.reserved.values()) == 0
+
+
+def test_hold_until_capacity():
+    workers = {'small': 1}
+    admissions = policy(workers, {'small': 1}, max_promotion=0, hold_timeout=5)
+
+    result = []
+    held = threading.Thread(target=lambda: result.append(admissions.admit(500, GIB)))
+    held.start()
+    time.sleep(0.05)
+    assert not result and admissions.held
+
+    workers['small'] = 2
+    admissions.notify()
+    held.join(1)
+
+    assert result[0].action == 'admit'
+    assert result[0].held >= 0.05
+    assert admissions.held == {}
+
+
+def test_hold_by_priority():
+    workers = {'small': 1}
+    admissions = policy(workers, {'small': 1}, max_promotion=0, hold_timeout=5, reservation_ttl=60)
+
+    order = []
+
+    def admit(name, priority):
+        admissions.admit(500, GIB, priority)
+        order.append(name)
+
+    threads = []
+    for name, priority in (('low', 0), ('high', 10)):
+        threads.append(threading.Thread(target=admit, args=(name, priority)))
+        threads[-1].start()
+        time.sleep(0.05)
+
+    workers['small'] = 2
+    admissions.notify()
+    time.sleep(0.05)
+    assert order == ['high']
+
+    workers['small'] = 3
+    admissions.notify()
+    for thread in threads:
+        thread.join(1)
+    assert order == ['high', 'low']
+
+
+def test_hold_timeout_overflows():
+    admission = policy({'small': 1}, {'small': 1}, max_promotion=0, hold_timeout=0.1).admit(500, GIB)
+
+    assert admission.action == 'overflow'
+    assert admission.workersize == 'small'
+    assert admission.held >= 0.1
+
+
+def test_full_hold_queue_overflows():
+    workers = {'small': 1}
+    admissions = policy(workers, {'small': 1}, max_promotion=0, hold_timeout=5, max_held=1)
+
+    held = threading.Thread(target=admissions.admit, args=(500, GIB))
+    held.start()
+    time.sleep(0.05)
+
+    admission = admissions.admit(500, GIB)
+    assert admission.action == 'overflow'
+    assert admission.held == 0
+
+    workers['small'] = 2
+    admissions.notify()
+    held.join(1)
+    assert not held.is_alive()
+
+
+def test_catalogue_snapshot():
+    snapshot = SizeIndex(build_index([
+        {'metadata': {'name': 'huge'}, 'spec': {'cpu': '16', 'memory': '64Gi'}},
+    ]))
+    admission = policy({'huge': 1}).admit(8000, GIB, dry_run=True, catalogue=snapshot)
+
+    assert admission.action == 'admit'
+    assert admission.workersize == 'huge'
+
+
+def test_limit_held():
+    admissions = policy({'small': 1}, max_held=256)
+
+    admissions.limit_held(128)
+    assert admissions.max_held == 128
+    admissions.limit_held(512)
+    assert admissions.max_held == 128
+
+
+def test_no_promotion_by_default():
+    admissions = AdmissionPolicy(CATALOGUE, lambda: {'small': 1, 'medium': 1}, lambda: {'small': 1})
+
+    assert admissions.admit(500, GIB).action == 'overflow'
@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from assignment import DemandAware, LargestFit, apportion, strategy
+from worker_catalogue import SizeIndex, build_index
+
+GIB = 2**30
+
+CATALOGUE = SizeIndex(build_index([
+    {'metadata': {'name': 'small'}, 'spec': {'cpu': '1', 'memory': '2Gi'}},
+    {'metadata': {'name': 'large'}, 'spec': {'cpu': '4', 'memory': '8Gi'}},
+]))
+
+
+def test_apportion_proportional():
+    assert apportion(10, {'a': 3, 'b': 1, 'c': 1}) == {'a': 6, 'b': 2, 'c': 2}
+
+
+def test_apportion_largest_remainders():
+    assert apportion(10, {'a': 1, 'b': 1, 'c': 1}) == {'a': 4, 'b': 3, 'c': 3}
+    assert apportion(4, {'a': 1, 'b': 2, 'c': 4}) == {'a': 1, 'b': 1, 'c': 2}
+
+
+@pytest.mark.parametrize('total, weights', [
+    (0, {'a': 1}),
+    (-3, {'a': 1, 'b': 2}),
+    (5, {'a': 0, 'b': 0}),
+    (5, {}),
+])
+def test_apportion_nothing(total, weights):
+    assert apportion(total, weights) == {key: 0 for key in weights}
+
+
+def test_apportion_keeps_the_total():
+    rng = random.Random(0)
+    for _ in range(200):
+        weights = {key: rng.randint(1, 50) for key in 'abcdef'}
+        total = rng.randint(1, 100)
+        shares = apportion(total, weights)
+
+        assert sum(shares.values()) == total
+        for key, weight in weights.items():
+            assert abs(shares[key] - total * weight / sum(weights.values())) < 1
+
+
+def test_largest_fit():
+    nodes = {'a': (4000, 16 * GIB), 'b': (2000, 4 * GIB), 'c': (500, GIB)}
+
+    assert LargestFit().assign(nodes, CATALOGUE) == {'a': 'large', 'b': 'small', 'c': None}
+
+
+def test_demand_aware_follows_demand():
+    nodes = {name: (4000, 8 * GIB) for name in 'abcdef'}
+    plan = DemandAware(reserve=1).assign(nodes, CATALOGUE, {'small': 3, 'large': 1})
+
+    assert sorted(plan.values()).count('small') == 4
+    assert sorted(plan.values()).count('large') == 2
+
+
+def test_demand_aware_keeps_current_labels():
+    nodes = {name: (4000, 8 * GIB) for name in 'abcd'}
+    current = {'a': 'large', 'b': 'small', 'c': 'small', 'd': 'large'}
+    plan = DemandAware(reserve=1).assign(nodes, CATALOGUE, {'small': 1, 'large': 1}, current)
+
+    assert plan == current
+
+
+def test_demand_aware_without_demand():
+    nodes = {name: (4000, 8 * GIB) for name in 'ab'}
+
+    assert DemandAware().assign(nodes, CATALOGUE, {}) == LargestFit().assign(nodes, CATALOGUE)
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        strategy('random')
@@ -0,0 +1,62 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from async_proxy import AsyncProxy
+from scheduler import Scheduler
+from worker_catalogue import SizeIndex
+
+
+def upstream(handler):
+    app = web.Application()
+    app.router.add_route('*', '/{path:.*}', handler)
+    return TestServer(app)
+
+
+async def proxied(upstream_server, path, timeout):
+    proxy = AsyncProxy(
+        Scheduler.offline(SizeIndex(), None),
+        'http://127.0.0.1',
+        upstream_server.port,
+        timeout=timeout,
+    )
+    async with TestServer(proxy.application()) as server:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(server.make_url(path)) as response:
+                return response.status, await response.read()
+
+
+def test_streams_outlive_the_timeout():
+    async def stream(request):
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for i in range(5):
+            await response.write(f"line {i}\n".encode())
+            await asyncio.sleep(0.4)
+        await response.write_eof()
+        return response
+
+    async def run():
+        async with upstream(stream) as server:
+            return await proxied(server, '/api/v1/workflows/argo/wf/log', timeout=1)
+
+    status, body = asyncio.run(run())
+
+    assert status == 200
+    assert body == b"".join(f"line {i}\n".encode() for i in range(5))
+
+
+def test_stalled_upstream_times_out():
+    async def stall(request):
+        await asyncio.sleep(3)
+        return web.Response(text="late")
+
+    async def run():
+        async with upstream(stall) as server:
+            return await proxied(server, '/api/v1/workflows/argo', timeout=0.5)
+
+    status, _ = asyncio.run(run())
+
+    assert status == 502
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+
+import aiohttp
+import pytest
+import requests
+from aiohttp.test_utils import TestServer
+
+import WorkflowProxyHandler
+from admission import AdmissionPolicy
+from async_proxy import AsyncProxy
+from scheduler import Scheduler
+from worker_catalogue import SizeIndex, build_index
+
+CATALOGUE = SizeIndex(build_index([
+    {'metadata': {'name': 'small'}, 'spec': {'cpu': '1', 'memory': '2Gi'}},
+    {'metadata': {'name': 'large'}, 'spec': {'cpu': '4', 'memory': '8Gi'}},
+]))
+
+
+def offline_scheduler():
+    admission = AdmissionPolicy(
+        CATALOGUE,
+        lambda: {'small': 1, 'large': 1},
+        dict,
+        max_backlog=1,
+        max_promotion=1,
+        hold_timeout=0,
+        reservation_ttl=60,
+    )
+    return Scheduler.offline(CATALOGUE, admission, 'workflow')
+
+
+def bare_workflow(cpu='500m', memory='1Gi'):
+    return {
+        'metadata': {'generateName': 'wf-', 'labels': {}},
+        'spec': {'templates': [
+            {'name': 'main', 'container': {'resources': {'requests': {'cpu': cpu, 'memory': memory}}}},
+        ]},
+    }
+
+
+def threaded(monkeypatch, sched):
+    monkeypatch.setattr(WorkflowProxyHandler, 'scheduler', sched)
+    server = WorkflowProxyHandler.ProxyServer(('127.0.0.1', 0), WorkflowProxyHandler.ProxyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def post(body):
+        try:
+            response = requests.post(f"http://127.0.0.1:{server.server_address[1]}/schedule", data=body, timeout=5)
+            return response.status_code, response.json()
+        finally:
+            server.shutdown()
+            server.server_close()
+    return post
+
+
+def asynchronous(monkeypatch, sched):
+    proxy = AsyncProxy(sched, 'http://127.0.0.1', 1)
+
+    async def run(body):
+        async with TestServer(proxy.application()) as server:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(server.make_url('/schedule'), data=body) as response:
+                    return response.status, await response.json()
+
+    return lambda body: asyncio.run(run(body))
+
+
+@pytest.fixture(params=[threaded, asynchronous], ids=['threaded', 'async'])
+def post(request, monkeypatch):
+    sched = offline_scheduler()
+    client = request.param(monkeypatch, sched)
+    yield client
+    assert sum(sched.admission.reserved.values()) == 0
+
+
+def test_single_submission(post):
+    status, result = post(json.dumps({'workflow': bare_workflow()}))
+
+    assert status == 200
+    assert result['workersize'] == 'small'
+    assert result['admission']['action'] == 'admit'
+    assert result['workflow']['workflow']['spec']['templates'][0]['nodeSelector'] == {
+        'workflow.nebulouscloud.eu/workersize': 'small',
+    }
+
+
+def test_bare_workflow(post):
+    status, result = post(json.dumps(bare_workflow()))
+
+    assert status == 200
+    assert result['workersize'] == 'small'
+    assert 'spec' in result['workflow']
+
+
+def test_batch_accumulates_reservations(post):
+    status, results = post(json.dumps([
+        {'workflow': bare_workflow()},
+        bare_workflow(),
+        bare_workflow(),
+    ]))
+
+    assert status == 200
+    assert [(x['admission']['action'], x['workersize']) for x in results] == [
+        ('admit', 'small'),
+        ('promote', 'large'),
+        ('overflow', 'small'),
+    ]
+
+
+def test_invalid_json(post):
+    status, result = post(b"{not json")
+
+    assert status == 400
+    assert result['error'].startswith("Invalid JSON")
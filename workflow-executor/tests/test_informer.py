@@ -0,0 +1,129 @@
+import informer
+
+from kubernetes import client
+from informer import Informer
+
+
+def workflow(name, resource_version, namespace='argo'):
+    return {'metadata': {'name': name, 'namespace': namespace, 'resourceVersion': resource_version}}
+
+
+def listing(resource_version, *items):
+    return {'metadata': {'resourceVersion': resource_version}, 'items': list(items)}
+
+
+class FakeWatch():
+    """
+    Replays the scripted streams, one per watch: a list of events or an
+    exception to raise.
+    """
+
+    def __init__(self, streams):
+        self.streams = streams
+        self.calls = []
+
+    def __call__(self):
+        return self
+
+    def stream(self, func, *args, **kwargs):
+        self.calls.append(kwargs)
+        stream = self.streams.pop(0)
+        if isinstance(stream, Exception):
+            raise stream
+        yield from stream
+
+    def stop(self):
+        pass
+
+
+def recorder(cache):
+    events = []
+    cache.add_handler(
+        lambda x: events.append(('add', x['metadata']['name'])),
+        lambda x, y: events.append(('update', y['metadata']['name'])),
+        lambda x: events.append(('delete', x['metadata']['name'])),
+    )
+    return events
+
+
+def test_relists_on_gone(monkeypatch):
+    lists = [
+        listing('10', workflow('a', '1'), workflow('b', '2')),
+        listing('20', workflow('b', '3'), workflow('c', '4')),
+    ]
+    cache = Informer(lambda *args, **kwargs: lists.pop(0), name='workflows')
+
+    def stop():
+        cache.stop()
+        yield from ()
+
+    fake = FakeWatch([client.ApiException(status=410), stop()])
+    monkeypatch.setattr(informer.watch, 'Watch', fake)
+
+    events = recorder(cache)
+    cache.run()
+
+    assert events == [
+        ('add', 'a'), ('add', 'b'),
+        ('delete', 'a'), ('update', 'b'), ('add', 'c'),
+    ]
+    assert sorted(cache.store) == ['argo/b', 'argo/c']
+    assert cache.resource_version == '20'
+    assert [call['resource_version'] for call in fake.calls] == ['10', '20']
+    assert cache.synced.is_set()
+
+
+def test_watch_resumes_from_last_event(monkeypatch):
+    cache = Informer(lambda *args, **kwargs: listing('10'), name='workflows')
+
+    def events():
+        yield {'type': 'ADDED', 'object': workflow('a', '11'), 'raw_object': workflow('a', '11')}
+        yield {'type': 'MODIFIED', 'object': workflow('a', '12'), 'raw_object': workflow('a', '12')}
+        yield {'type': 'DELETED', 'object': workflow('a', '13'), 'raw_object': workflow('a', '13')}
+        cache.stop()
+
+    fake = FakeWatch([events()])
+    monkeypatch.setattr(informer.watch, 'Watch', fake)
+
+    recorded = recorder(cache)
+    cache.run()
+
+    assert recorded == [('add', 'a'), ('update', 'a'), ('delete', 'a')]
+    assert cache.resource_version == '13'
+    assert cache.store == {}
+
+
+def test_unchanged_objects_are_not_replayed():
+    cache = Informer(lambda *args, **kwargs: listing('10', workflow('a', '1')), name='workflows')
+    events = recorder(cache)
+
+    cache.relist()
+    generation = cache.generation
+    cache.relist()
+
+    assert events == [('add', 'a')]
+    assert cache.generation == generation
+
+
+def test_filter():
+    cache = Informer(
+        lambda *args, **kwargs: listing('10', workflow('a', '1'), workflow('b', '2', 'other')),
+        name='workflows',
+        filter=lambda x: x['metadata']['namespace'] == 'argo',
+    )
+    cache.relist()
+
+    assert list(cache.store) == ['argo/a']
+
+
+def test_seed_is_reconciled_by_the_first_list():
+    cache = Informer(lambda *args, **kwargs: listing('10', workflow('a', '2')), name='workflows')
+    cache.seed([workflow('a', '1'), workflow('b', '1')])
+    events = recorder(cache)
+
+    assert events == [('add', 'a'), ('add', 'b')]
+    cache.relist()
+    assert events[2:] == [('delete', 'b'), ('update', 'a')]
+
+    cache.seed([workflow('c', '1')])
+    assert 'argo/c' not in cache.store
@@ -0,0 +1,154 @@
+import copy
+import threading
+
+from kubernetes import client
+
+import leader
+from leader import LeaderElector
+
+
+class FakeCoordination():
+    """
+    Leases in memory, with the resourceVersion checks of the API server.
+    """
+
+    def __init__(self):
+        self.leases = {}
+        self.versions = 0
+        self.fail = None
+
+    def read_namespaced_lease(self, name, namespace):
+        self.__maybe_fail()
+        if name not in self.leases:
+            raise client.ApiException(status=404)
+        return copy.deepcopy(self.leases[name])
+
+    def create_namespaced_lease(self, namespace, body):
+        self.__maybe_fail()
+        if body.metadata.name in self.leases:
+            raise client.ApiException(status=409)
+        self.__store(body)
+
+    def replace_namespaced_lease(self, name, namespace, body):
+        self.__maybe_fail()
+        if body.metadata.resource_version != self.leases[name].metadata.resource_version:
+            raise client.ApiException(status=409)
+        self.__store(body)
+
+    def holder(self, name='workflow-executor'):
+        return self.leases[name].spec.holder_identity
+
+    def __store(self, body):
+        self.versions += 1
+        body = copy.deepcopy(body)
+        body.metadata.resource_version = str(self.versions)
+        self.leases[body.metadata.name] = body
+
+    def __maybe_fail(self):
+        if self.fail:
+            raise self.fail
+
+
+class Clock():
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def elector(api, identity, **kwargs):
+    return LeaderElector(api, name='workflow-executor', namespace='default', identity=identity, **kwargs)
+
+
+def test_creates_the_lease_when_missing():
+    api = FakeCoordination()
+
+    assert elector(api, 'a').try_acquire_or_renew()
+    assert api.holder() == 'a'
+    assert api.leases['workflow-executor'].spec.lease_transitions == 0
+
+
+def test_follower_respects_an_unexpired_lease(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(leader.time, 'monotonic', clock)
+    api = FakeCoordination()
+    elector(api, 'a', lease_duration=15).try_acquire_or_renew()
+
+    follower = elector(api, 'b', lease_duration=15)
+    assert not follower.try_acquire_or_renew()
+    clock.now += 10
+    assert not follower.try_acquire_or_renew()
+    assert api.holder() == 'a'
+
+
+def test_takes_over_after_lease_duration(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(leader.time, 'monotonic', clock)
+    api = FakeCoordination()
+    elector(api, 'a', lease_duration=15).try_acquire_or_renew()
+
+    follower = elector(api, 'b', lease_duration=15)
+    assert not follower.try_acquire_or_renew()
+    clock.now += 16
+
+    assert follower.try_acquire_or_renew()
+    assert api.holder() == 'b'
+    assert api.leases['workflow-executor'].spec.lease_transitions == 1
+
+
+def test_conflicting_replace_loses(monkeypatch):
+    api = FakeCoordination()
+    candidate = elector(api, 'a')
+    candidate.try_acquire_or_renew()
+
+    replace = api.replace_namespaced_lease
+
+    def concurrent_update(name, namespace, body):
+        stale = copy.deepcopy(api.leases[name])
+        stale.spec.holder_identity = 'b'
+        replace(name, namespace, stale)
+        return replace(name, namespace, body)
+
+    monkeypatch.setattr(api, 'replace_namespaced_lease', concurrent_update)
+
+    assert not candidate.try_acquire_or_renew()
+    assert api.holder() == 'b'
+
+
+def test_steps_down_after_renew_deadline():
+    api = FakeCoordination()
+    started, stopped = threading.Event(), threading.Event()
+    candidate = elector(
+        api, 'a',
+        renew_deadline=0.1,
+        retry_period=0.01,
+        on_started_leading=started.set,
+        on_stopped_leading=stopped.set,
+    ).start()
+
+    assert started.wait(2)
+    api.fail = client.ApiException(status=500)
+
+    assert stopped.wait(2)
+    assert not candidate.leading
+    candidate.stop(timeout=2)
+
+
+def test_releases_the_lease_on_stop():
+    api = FakeCoordination()
+    started, stopped = threading.Event(), threading.Event()
+    candidate = elector(
+        api, 'a',
+        retry_period=0.01,
+        on_started_leading=started.set,
+        on_stopped_leading=stopped.set,
+    ).start()
+    assert started.wait(2)
+
+    candidate.stop(timeout=2)
+
+    assert stopped.is_set()
+    assert api.holder() is None
+    assert api.leases['workflow-executor'].spec.lease_duration_seconds == 1
@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import CollectorRegistry
+
+from metrics import SchedulerCollector, kubernetes_verb
+from workflow_cache import PHASE_LABEL, WORKERSIZE_LABEL
+from workflow_counters import WorkflowCounters
+
+
+def workflow(name, workersize, phase):
+    return {'metadata': {'namespace': 'argo', 'name': name, 'labels': {
+        WORKERSIZE_LABEL: workersize,
+        PHASE_LABEL: phase,
+    }}}
+
+
+def registry(workersizes, workers, workflows=(), legacy=False, counters=None):
+    counters = counters or WorkflowCounters()
+    for x in workflows:
+        counters.on_add(x)
+
+    scheduler = SimpleNamespace(
+        worker_catalogue=SimpleNamespace(names=lambda: list(workersizes)),
+        node_controller=SimpleNamespace(workers=lambda: dict(workers)),
+        workflow_counters=counters,
+    )
+    registry = CollectorRegistry()
+    registry.register(SchedulerCollector(scheduler, legacy=legacy))
+    return registry
+
+
+def families(registry):
+    return {family.name for family in registry.collect()}
+
+
+def test_exported_families():
+    metrics = registry(['small'], {'small': 2}, [workflow('a', 'small', 'Running')])
+
+    assert families(metrics) == {
+        'workflow_executor_worker_nodes',
+        'workflow_executor_workflows',
+        'workflow_executor_workflows_pods_pending',
+    }
+    assert metrics.get_sample_value('workflow_executor_worker_nodes', {'workersize': 'small'}) == 2
+    assert metrics.get_sample_value(
+        'workflow_executor_workflows', {'workersize': 'small', 'phase': 'Running'},
+    ) == 1
+    assert metrics.get_sample_value('workflow_executor_workflows_pods_pending', {'workersize': 'small'}) == 1
+
+
+def test_catalogue_sizes_are_zero_filled():
+    metrics = registry(['small', 'large'], {})
+
+    for workersize in ('small', 'large'):
+        assert metrics.get_sample_value('workflow_executor_worker_nodes', {'workersize': workersize}) == 0
+        assert metrics.get_sample_value('workflow_executor_workflows_pods_pending', {'workersize': workersize}) == 0
+        for phase in ('Pending', 'Running', 'Succeeded', 'Failed', 'Error'):
+            assert metrics.get_sample_value(
+                'workflow_executor_workflows', {'workersize': workersize, 'phase': phase},
+            ) == 0
+
+
+def test_removed_sizes_drop_out_with_their_last_workflow():
+    finished = workflow('a', 'medium', 'Succeeded')
+    counters = WorkflowCounters()
+    metrics = registry(['small'], {}, [finished], counters=counters)
+    labels = {'workersize': 'medium', 'phase': 'Succeeded'}
+
+    assert metrics.get_sample_value('workflow_executor_workflows', labels) == 1
+    assert metrics.get_sample_value(
+        'workflow_executor_workflows', {'workersize': 'medium', 'phase': 'Running'},
+    ) is None
+
+    counters.on_delete(finished)
+
+    assert metrics.get_sample_value('workflow_executor_workflows', labels) is None
+    assert metrics.get_sample_value('workflow_executor_worker_nodes', {'workersize': 'medium'}) is None
+
+
+def test_legacy_names():
+    metrics = registry(
+        ['extra-large'],
+        {'extra-large': 3},
+        [workflow('a', 'extra-large', 'Pending'), workflow('b', 'extra-large', 'Failed')],
+        legacy=True,
+    )
+
+    assert metrics.get_sample_value('extra_large_count') == 3
+    assert metrics.get_sample_value('workflow_pending_extra_large_count') == 1
+    assert metrics.get_sample_value('failed_finished_extra_large_count') == 1
+    assert metrics.get_sample_value('workflow_running_extra_large_count') == 0
+    assert metrics.get_sample_value('workflow_pods_pending_extra_large_count') == 0
+    assert registry(['small'], {}, legacy=False).get_sample_value('small_count') is None
+
+
+@pytest.mark.parametrize('method, path, verb', [
+    ('GET', '/api/v1/nodes', 'list'),
+    ('GET', '/api/v1/nodes/worker-1', 'get'),
+    ('GET', '/api/v1/namespaces', 'list'),
+    ('GET', '/api/v1/namespaces/argo', 'get'),
+    ('GET', '/api/v1/namespaces/argo/pods', 'list'),
+    ('GET', '/api/v1/namespaces/argo/pods/wf-1/log', 'get'),
+    ('GET', '/apis/argoproj.io/v1alpha1/workflows', 'list'),
+    ('GET', '/apis/argoproj.io/v1alpha1/namespaces/argo/workflows', 'list'),
+    ('GET', '/apis/argoproj.io/v1alpha1/namespaces/argo/workflows/wf-1', 'get'),
+    ('GET', '/apis/workflow.io/v1/workflownodes', 'list'),
+    ('GET', '/k8s/clusters/c-1/apis/coordination.k8s.io/v1/namespaces/default/leases/l', 'get'),
+    ('PATCH', '/api/v1/nodes/worker-1', 'patch'),
+    ('POST', '/apis/workflow.io/v1/workflownodes', 'create'),
+    ('DELETE', '/apis/workflow.io/v1/workflownodes/worker-1', 'delete'),
+])
+def test_kubernetes_verb(method, path, verb):
+    assert kubernetes_verb(method, f"https://10.0.0.1:6443{path}") == verb
+
+
+def test_kubernetes_watch_verb():
+    assert kubernetes_verb('GET', 'https://10.0.0.1:6443/api/v1/nodes', [('watch', True)]) == 'watch'
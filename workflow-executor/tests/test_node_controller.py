@@ -0,0 +1,71 @@
+from kubernetes import client
+
+from node_controller import NodeController
+from worker_catalogue import WorkerCatalogue
+from workflow_cache import WORKERSIZE_LABEL
+
+
+class FakeCoreClient():
+
+    def __init__(self):
+        self.items = []
+
+    def list_node(self, **kwargs):
+        return client.V1NodeList(
+            metadata=client.V1ListMeta(resource_version=str(len(self.items))),
+            items=self.items,
+        )
+
+
+def node(resource_version, labels=None, unschedulable=None, heartbeat='t0', cpu='4'):
+    return client.V1Node(
+        metadata=client.V1ObjectMeta(
+            name='node-1',
+            resource_version=resource_version,
+            labels={'nebulouscloud.eu/worker': 'true', **(labels or {})},
+        ),
+        spec=client.V1NodeSpec(unschedulable=unschedulable),
+        status=client.V1NodeStatus(
+            capacity={'cpu': cpu, 'memory': '16Gi'},
+            conditions=[client.V1NodeCondition(type='Ready', status='True', last_heartbeat_time=heartbeat)],
+        ),
+    )
+
+
+def controller():
+    core_client = FakeCoreClient()
+    return core_client, NodeController(core_client, WorkerCatalogue(None))
+
+
+def test_heartbeats_keep_the_fingerprint():
+    core_client, nodes = controller()
+    core_client.items = [node('1')]
+    nodes.nodes.relist()
+    fingerprint, generation = nodes.fingerprint(), nodes.nodes.generation
+
+    core_client.items = [node('2', heartbeat='t1')]
+    nodes.nodes.relist()
+
+    assert nodes.nodes.generation != generation
+    assert nodes.fingerprint() == fingerprint
+
+
+def test_sizing_fields_change_the_fingerprint():
+    core_client, nodes = controller()
+    core_client.items = [node('1')]
+    nodes.nodes.relist()
+
+    for changed in [
+        node('2', labels={WORKERSIZE_LABEL: 'large'}),
+        node('3', labels={WORKERSIZE_LABEL: 'large'}, unschedulable=True),
+        node('4', labels={WORKERSIZE_LABEL: 'large'}, unschedulable=True, cpu='8'),
+    ]:
+        fingerprint = nodes.fingerprint()
+        core_client.items = [changed]
+        nodes.nodes.relist()
+        assert nodes.fingerprint() != fingerprint
+
+    fingerprint = nodes.fingerprint()
+    core_client.items = []
+    nodes.nodes.relist()
+    assert nodes.fingerprint() != fingerprint
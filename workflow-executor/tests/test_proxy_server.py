@@ -0,0 +1,47 @@
+import socket
+import socketserver
+import threading
+import time
+
+from WorkflowProxyHandler import ProxyServer
+
+
+class SlowHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.running += 1
+            server.peak = max(server.peak, server.running)
+        server.release.wait(5)
+        with server.lock:
+            server.running -= 1
+
+
+class BoundedServer(ProxyServer):
+    max_threads = 2
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.running = self.peak = 0
+
+
+def test_handler_threads_are_bounded():
+    server = BoundedServer(('127.0.0.1', 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    clients = [socket.create_connection(server.server_address) for _ in range(5)]
+    try:
+        time.sleep(0.2)
+        assert server.running == 2
+
+        server.release.set()
+        for client in clients:
+            client.close()
+        time.sleep(0.2)
+        assert server.running == 0
+        assert server.peak == 2
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,61 @@
+from fractions import Fraction
+
+import pytest
+
+from quantity import parse_cpu_to_millicores, parse_memory_to_bytes, parse_quantity
+
+
+@pytest.mark.parametrize('quantity, millicores', [
+    ('500m', 500),
+    ('2', 2000),
+    ('1.5', 1500),
+    ('.5', 500),
+    ('+1', 1000),
+    ('1e3', 1000000),
+    ('100n', 1),
+    ('0.1m', 1),
+    (2, 2000),
+    (0.1, 100),
+])
+def test_cpu(quantity, millicores):
+    assert parse_cpu_to_millicores(quantity) == millicores
+
+
+@pytest.mark.parametrize('quantity, size', [
+    ('1Ki', 2**10),
+    ('1Mi', 2**20),
+    ('1.5Gi', 3 * 2**29),
+    ('500M', 500 * 10**6),
+    ('1k', 1000),
+    ('1E', 10**18),
+    ('1E3', 1000),
+    ('1e9', 10**9),
+    ('  2Gi ', 2 * 2**30),
+    ('1.5', 2),
+    (1024, 1024),
+])
+def test_memory(quantity, size):
+    assert parse_memory_to_bytes(quantity) == size
+
+
+def test_lower_case_binary_suffixes():
+    assert parse_memory_to_bytes('2gi') == parse_memory_to_bytes('2Gi')
+    assert parse_memory_to_bytes('512mi') == parse_memory_to_bytes('512Mi')
+
+
+def test_exact():
+    assert parse_quantity('0.1') == Fraction(1, 10)
+    assert parse_quantity(0.1) == Fraction(1, 10)
+    assert parse_quantity('1m') * 1000 == 1
+
+
+@pytest.mark.parametrize('quantity', ['', 'abc', '1K', '1Gb', '1e', '1.5 Gi', 'Gi'])
+def test_invalid(quantity):
+    with pytest.raises(ValueError):
+        parse_memory_to_bytes(quantity)
+
+
+@pytest.mark.parametrize('quantity', [None, True, [1]])
+def test_invalid_type(quantity):
+    with pytest.raises(TypeError):
+        parse_quantity(quantity)
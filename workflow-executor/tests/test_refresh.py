@@ -0,0 +1,57 @@
+from refresh import Budget, RefreshLoop
+
+
+def test_budget():
+    budget = Budget(5)
+
+    assert budget.take(3) == 3
+    assert budget.take(3) == 2
+    assert budget.take(3) == 0
+    assert budget.take(-1) == 0
+
+
+def test_skips_unchanged_fingerprint():
+    calls = []
+    state = {'fingerprint': 1}
+    loop = RefreshLoop(lambda budget: calls.append(budget), lambda: state['fingerprint'], interval=10)
+
+    loop.run_once()
+    loop.run_once()
+    assert len(calls) == 1
+
+    state['fingerprint'] = 2
+    loop.run_once()
+    assert len(calls) == 2
+
+
+def test_incomplete_refresh_runs_again():
+    calls = []
+
+    def refresh(budget):
+        calls.append(budget.take(100))
+        return len(calls) > 1
+
+    loop = RefreshLoop(refresh, lambda: 1, interval=10, budget=50)
+    loop.run_once()
+    loop.run_once()
+    loop.run_once()
+
+    assert calls == [50, 50]
+
+
+def test_failures_back_off():
+    def refresh(budget):
+        raise RuntimeError("API down")
+
+    loop = RefreshLoop(refresh, lambda: 1, interval=10, max_backoff=60)
+
+    assert [loop.run_once() for _ in range(4)] == [20, 40, 60, 60]
+    assert loop.last is None
+
+
+def test_slow_cycles_stretch_the_interval(monkeypatch):
+    clock = iter([0, 5])
+    monkeypatch.setattr('refresh.time.monotonic', lambda: next(clock))
+    loop = RefreshLoop(lambda budget: True, interval=10, max_duty=0.1)
+
+    assert loop.run_once() == 50
@@ -0,0 +1,197 @@
+import copy
+import threading
+
+import pytest
+
+from admission import AdmissionPolicy
+from scheduler import Scheduler
+from worker_catalogue import SizeIndex, build_index
+from workflow_cache import WORKERSIZE_LABEL
+
+
+def catalogue(**sizes):
+    return SizeIndex(build_index([
+        {'metadata': {'name': name}, 'spec': {'cpu': cpu, 'memory': memory}}
+        for name, (cpu, memory) in sizes.items()
+    ]))
+
+
+def scheduler(index, sizing_mode, workers=None):
+    admission = AdmissionPolicy(
+        index,
+        lambda: workers or {name: 1 for name in index.names()},
+        dict,
+        max_promotion=0,
+        hold_timeout=0,
+        reservation_ttl=60,
+    )
+    return Scheduler.offline(index, admission, sizing_mode)
+
+
+def workflow(*resources, labels=None):
+    return {'workflow': {
+        'metadata': {'labels': {'workflow': 'wf-1'} if labels is None else labels},
+        'spec': {'templates': [
+            {'name': 'main', 'dag': {'tasks': []}},
+        ] + [
+            {'name': f"step-{i}", 'container': {'resources': {'requests': {'cpu': cpu, 'memory': memory}}}}
+            for i, (cpu, memory) in enumerate(resources)
+        ]},
+    }}
+
+
+def selectors(submission):
+    return [
+        (template.get('nodeSelector') or {}).get(WORKERSIZE_LABEL)
+        for template in submission['workflow']['spec']['templates'][1:]
+    ]
+
+
+MIXED = catalogue(small=('1', '2Gi'), large=('4', '8Gi'), xlarge=('8', '64Gi'))
+
+
+def test_workflow_mode_fits_every_resource():
+    submission, admission = scheduler(MIXED, 'workflow').admit_workflow(
+        workflow(('4', '1Gi'), ('2', '32Gi'), ('500m', '1Gi')),
+    )
+
+    assert admission.workersize == 'xlarge'
+    assert submission['workflow']['metadata']['labels'][WORKERSIZE_LABEL] == 'xlarge'
+    assert selectors(submission) == ['xlarge'] * 3
+
+
+def test_template_mode_mixed_templates():
+    submission, admission = scheduler(MIXED, 'template').admit_workflow(
+        workflow(('4', '1Gi'), ('2', '32Gi'), ('500m', '1Gi')),
+    )
+
+    assert admission.action == 'admit'
+    assert admission.workersize == 'xlarge'
+    assert submission['workflow']['metadata']['labels'][WORKERSIZE_LABEL] == 'xlarge'
+    assert selectors(submission) == ['large', 'xlarge', 'small']
+
+
+def test_template_mode_colocated_group_fits_every_member():
+    submission = workflow(('4', '1Gi'), ('2', '32Gi'), ('500m', '1Gi'))
+    for template in submission['workflow']['spec']['templates'][1:3]:
+        template['metadata'] = {'annotations': {'workflow.nebulouscloud.eu/colocate': 'true'}}
+
+    submission, admission = scheduler(MIXED, 'template').admit_workflow(submission)
+
+    assert selectors(submission) == ['xlarge', 'xlarge', 'small']
+    templates = submission['workflow']['spec']['templates']
+    assert 'affinity' in templates[1] and 'affinity' in templates[2]
+    assert 'affinity' not in templates[3]
+
+
+@pytest.mark.parametrize('sizing_mode', ['workflow', 'template'])
+def test_template_no_size_fits(sizing_mode):
+    index = catalogue(small=('1', '2Gi'), large=('4', '8Gi'))
+    sched = scheduler(index, sizing_mode)
+    submission = workflow(('4', '1Gi'), ('2', '64Gi'))
+    submitted = copy.deepcopy(submission)
+
+    submission, admission = sched.admit_workflow(submission)
+
+    assert admission.action == 'unschedulable'
+    assert submission == submitted
+    assert sum(sched.admission.reserved.values()) == 0
+
+
+@pytest.mark.parametrize('sizing_mode', ['workflow', 'template'])
+def test_error_rolls_back(sizing_mode):
+    sched = scheduler(MIXED, sizing_mode)
+    submission = workflow(('4', '1Gi'), ('500m', '1Gi'), labels={})
+    del submission['workflow']['metadata']['labels']
+    submission['workflow']['spec']['templates'][1]['nodeSelector'] = {'disk': 'ssd'}
+    submitted = copy.deepcopy(submission)
+
+    submission, admission = sched.admit_workflow(submission)
+
+    assert admission.action == 'error'
+    assert submission == submitted
+    assert sum(sched.admission.reserved.values()) == 0
+    assert not sched.admission.reservations
+
+
+@pytest.mark.parametrize('sizing_mode', ['workflow', 'template'])
+def test_dry_run_reserves_nothing(sizing_mode):
+    sched = scheduler(MIXED, sizing_mode)
+
+    _, admission = sched.admit_workflow(workflow(('4', '1Gi')), dry_run=True)
+
+    assert admission.workersize == 'large'
+    assert sum(sched.admission.reserved.values()) == 0
+
+
+class FakeCache():
+
+    def __init__(self, name, syncs_after):
+        self.name = name
+        self.syncs_after = syncs_after
+        self.synced = threading.Event()
+
+    def wait_for_sync(self, timeout=None):
+        if timeout is not None and timeout < self.syncs_after:
+            return False
+        self.synced.set()
+        return True
+
+
+def test_readiness_of_a_partly_built_scheduler():
+    ready, phases = Scheduler.__new__(Scheduler).readiness()
+
+    assert not ready
+    assert phases == {'catalogue': 'empty', 'nodes': False, 'workflows': False, 'labelled': False}
+
+
+def test_initial_sweep_reports_a_late_sync(monkeypatch, caplog):
+    monkeypatch.setattr('scheduler.STARTUP_TIMEOUT', 0.01)
+
+    sched = scheduler(MIXED, 'workflow')
+    sched.started = threading.Event()
+    late = FakeCache('workflows/argo', syncs_after=1)
+    monkeypatch.setattr(sched, 'caches', lambda: [late])
+    monkeypatch.setattr(sched, 'label_workflow_nodes', lambda: True)
+
+    sched.initial_sweep()
+
+    assert "Cache workflows/argo not synced after 0s" in caplog.text
+    assert sched.started.is_set()
+
+
+def unsynced_scheduler():
+    index = catalogue(small=('1', '2Gi'), large=('4', '8Gi'))
+    index.synced = threading.Event()
+    return scheduler(index, 'workflow')
+
+
+def test_submission_waits_for_the_catalogue():
+    sched = unsynced_scheduler()
+    threading.Timer(0.05, sched.worker_catalogue.synced.set).start()
+
+    _, admission = sched.admit_workflow(workflow(('4', '1Gi')))
+
+    assert sched.worker_catalogue.synced.is_set()
+    assert admission.workersize == 'large'
+
+
+def test_submission_wait_is_bounded(monkeypatch, caplog):
+    monkeypatch.setattr('scheduler.CATALOGUE_SYNC_WAIT', 0.01)
+    sched = unsynced_scheduler()
+
+    _, admission = sched.admit_workflow(workflow(('4', '1Gi')))
+
+    assert "Catalogue not synced after 0s" in caplog.text
+    assert admission.workersize == 'large'
+
+
+def test_warm_started_catalogue_is_not_waited_for(monkeypatch, caplog):
+    monkeypatch.setattr('scheduler.CATALOGUE_SYNC_WAIT', 60)
+    sched = unsynced_scheduler()
+    sched.warm_started = True
+
+    sched.admit_workflow(workflow(('4', '1Gi')), dry_run=True)
+
+    assert not sched.worker_catalogue.synced.is_set()
+    assert "Catalogue not synced" not in caplog.text
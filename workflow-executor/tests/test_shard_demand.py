@@ -0,0 +1,122 @@
+import json
+
+from kubernetes import client
+
+from shard_demand import DEMAND_ANNOTATION, SHARD_DEMAND_LABEL, ShardDemand
+from sharding import Shard
+
+
+class FakeLeases():
+
+    def __init__(self):
+        self.leases = {}
+        self.calls = []
+
+    def list_namespaced_lease(self, namespace, **kwargs):
+        return client.V1LeaseList(items=list(self.leases.values()), metadata=client.V1ListMeta())
+
+    def create_namespaced_lease(self, namespace, body):
+        self.calls.append('create')
+        self.leases[body.metadata.name] = body
+
+    def patch_namespaced_lease(self, name, namespace, body):
+        self.calls.append('patch')
+        if name not in self.leases:
+            raise client.ApiException(status=404)
+        self.leases[name] = body
+
+    def delete_namespaced_lease(self, name, namespace):
+        self.calls.append('delete')
+        if self.leases.pop(name, None) is None:
+            raise client.ApiException(status=404)
+
+
+def lease(index, demand):
+    return client.V1Lease(metadata=client.V1ObjectMeta(
+        name=f"workflow-executor-shard-{index}",
+        namespace='default',
+        labels={SHARD_DEMAND_LABEL: str(index)},
+        annotations={DEMAND_ANNOTATION: json.dumps(demand)},
+    ))
+
+
+def shard_demand(local=None, **kwargs):
+    return ShardDemand(
+        FakeLeases(),
+        Shard(0, count=3),
+        lambda: dict(local or {}),
+        namespace='default',
+        identity='replica-0',
+        **kwargs,
+    )
+
+
+def test_publish_creates_then_patches_the_lease():
+    demand = shard_demand({'small': 2})
+
+    demand.publish()
+    demand.publish()
+
+    leases = demand.coordination_client
+    assert leases.calls == ['patch', 'create', 'patch']
+    published = leases.leases['workflow-executor-shard-0']
+    assert published.metadata.labels == {SHARD_DEMAND_LABEL: '0'}
+    assert json.loads(published.metadata.annotations[DEMAND_ANNOTATION]) == {'small': 2}
+    assert published.spec.holder_identity == 'replica-0'
+
+
+def test_demand_adds_the_other_shards():
+    demand = shard_demand({'small': 2})
+
+    demand.on_lease(lease(1, {'small': 1, 'large': 3}))
+    demand.on_lease(lease(2, {'large': 1}))
+
+    assert demand.demand() == {'small': 3, 'large': 4}
+
+
+def test_own_lease_is_not_counted_twice():
+    demand = shard_demand({'small': 2})
+
+    demand.on_lease(lease(0, {'small': 2}))
+
+    assert demand.demand() == {'small': 2}
+
+
+def test_stale_shards_are_dropped():
+    demand = shard_demand({'small': 2}, ttl=0)
+
+    demand.on_lease(lease(1, {'small': 5}))
+
+    assert demand.demand() == {'small': 2}
+
+
+def test_deleted_shards_are_dropped():
+    demand = shard_demand()
+    remote = lease(1, {'small': 5})
+
+    demand.on_lease(remote)
+    demand.on_lease_deleted(remote)
+
+    assert demand.demand() == {}
+
+
+def test_unreadable_demand_is_ignored():
+    demand = shard_demand({'small': 1})
+    remote = lease(1, {})
+    remote.metadata.annotations[DEMAND_ANNOTATION] = 'not json'
+
+    demand.on_lease(remote)
+
+    assert demand.demand() == {'small': 1}
+
+
+def test_stop_withdraws_the_lease():
+    demand = shard_demand({'small': 1}, period=60)
+    demand.leases.watch = lambda: demand.leases._stopped.wait()
+
+    demand.start()
+    demand.stop(timeout=2)
+
+    leases = demand.coordination_client
+    assert leases.calls[-1] == 'delete'
+    assert leases.leases == {}
@@ -0,0 +1,82 @@
+import pytest
+
+from sharding import MATCH_NOTHING, HashRing, Shard, shard_index, workflow_namespaces
+from workflow_cache import WORKERSIZE_LABEL
+
+KEYS = [f"namespace-{i}" for i in range(2000)]
+
+
+def test_owner_is_stable():
+    first, second = HashRing(4), HashRing(4)
+
+    assert [first.owner(key) for key in KEYS] == [second.owner(key) for key in KEYS]
+
+
+def test_every_shard_owns_keys():
+    ring = HashRing(4)
+    owners = [ring.owner(key) for key in KEYS]
+
+    for shard in range(4):
+        assert 0.15 < owners.count(shard) / len(KEYS) < 0.35
+
+
+def test_adding_a_shard_only_moves_keys_to_it():
+    before, after = HashRing(4), HashRing(5)
+
+    moved = [key for key in KEYS if before.owner(key) != after.owner(key)]
+    assert all(after.owner(key) == 4 for key in moved)
+    assert 0.1 < len(moved) / len(KEYS) < 0.3
+
+
+def test_shard_owns():
+    shards = [Shard(index, count=3) for index in range(3)]
+
+    for key in KEYS[:100]:
+        assert sum(shard.owns(key) for shard in shards) == 1
+
+
+def test_unsharded_owns_everything():
+    shard = Shard(0, count=1)
+
+    assert not shard.enabled
+    assert shard.owns('anything')
+    assert shard.label_selector(['small', 'large']) == WORKERSIZE_LABEL
+
+
+def test_label_selector_by_workersize():
+    sizes = [f"size-{i}" for i in range(8)]
+    shards = [Shard(index, count=2, by='workersize') for index in range(2)]
+
+    owned = []
+    for shard in shards:
+        selector = shard.label_selector(sizes)
+        if selector != MATCH_NOTHING:
+            owned += selector.split('(')[1].rstrip(')').split(',')
+    assert sorted(owned) == sizes
+
+    assert Shard(0, count=2, by='workersize').label_selector([]) == MATCH_NOTHING
+
+
+def test_unknown_shard_by():
+    with pytest.raises(ValueError):
+        Shard(0, count=2, by='node')
+
+
+@pytest.mark.parametrize('value, namespaces', [
+    ('argo', ['argo']),
+    ('argo, team-a,', ['argo', 'team-a']),
+    ('*', None),
+    ('argo,*', None),
+    ('', None),
+])
+def test_workflow_namespaces(value, namespaces):
+    assert workflow_namespaces(value) == namespaces
+
+
+def test_shard_index_from_hostname(monkeypatch):
+    monkeypatch.setenv('HOSTNAME', 'workflow-executor-3')
+    assert shard_index(None) == 3
+    assert shard_index('1') == 1
+
+    monkeypatch.setenv('HOSTNAME', 'workflow-executor')
+    assert shard_index(None) == 0
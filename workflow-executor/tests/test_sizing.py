@@ -0,0 +1,44 @@
+from sizing import co_location_affinity, colocated, template_resources
+
+GIB = 2**30
+
+
+def test_requests():
+    template = {'container': {'resources': {
+        'requests': {'cpu': '500m', 'memory': '1Gi'},
+        'limits': {'cpu': '2', 'memory': '4Gi'},
+    }}}
+
+    assert template_resources(template) == (500, GIB)
+
+
+def test_limits_without_requests():
+    template = {'script': {'resources': {
+        'requests': {'cpu': '250m'},
+        'limits': {'cpu': '1', 'memory': '2Gi'},
+    }}}
+
+    assert template_resources(template) == (250, 2 * GIB)
+
+
+def test_no_resources():
+    assert template_resources({'container': {}}) == (0, 0)
+
+
+def test_templates_without_pods():
+    assert template_resources({'dag': {'tasks': []}}) is None
+    assert template_resources({'steps': []}) is None
+
+
+def test_colocated():
+    assert colocated({'metadata': {'annotations': {'workflow.nebulouscloud.eu/colocate': 'True'}}})
+    assert not colocated({'metadata': {'annotations': {'workflow.nebulouscloud.eu/colocate': 'false'}}})
+    assert not colocated({})
+
+
+def test_co_location_affinity():
+    affinity = co_location_affinity({'metadata': {'labels': {'workflow': 'wf-1'}}})
+    term = affinity['podAffinity']['requiredDuringSchedulingIgnoredDuringExecution'][0]
+
+    assert term['labelSelector'] == {'matchLabels': {'workflow': 'wf-1'}}
+    assert term['topologyKey'] == 'kubernetes.io/hostname'
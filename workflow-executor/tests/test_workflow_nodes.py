@@ -0,0 +1,119 @@
+import threading
+
+from kubernetes import client
+
+from refresh import Budget
+from workflow_nodes import WorkflowNodesMirror
+
+WORKER_LABELS = {'nebulouscloud.eu/workflow-worker': 'true'}
+
+
+class FakeCustomObjects():
+
+    def __init__(self, objects=None, errors=None):
+        self.objects = dict(objects or {})
+        self.errors = dict(errors or {})
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def list_cluster_custom_object(self, group, version, plural):
+        return {'items': [
+            {'metadata': {'name': name}, 'spec': spec}
+            for name, spec in self.objects.items()
+        ]}
+
+    def create_cluster_custom_object(self, group, version, plural, body):
+        self.__call('create', body['metadata']['name'], body['spec'])
+
+    def patch_cluster_custom_object(self, group, version, plural, name, body):
+        self.__call('patch', name, body['spec'])
+
+    def delete_cluster_custom_object(self, group, version, plural, name, body=None):
+        self.__call('delete', name, None)
+
+    def __call(self, verb, name, spec):
+        with self.lock:
+            self.calls.append((verb, name, spec))
+            if (verb, name) in self.errors:
+                raise client.ApiException(status=self.errors[(verb, name)])
+
+
+class FakeNodes():
+
+    def __init__(self, *nodes):
+        self.nodes = nodes
+
+    def list(self):
+        return list(self.nodes)
+
+
+def node(name, labels=WORKER_LABELS, unschedulable=None, **capacity):
+    return client.V1Node(
+        metadata=client.V1ObjectMeta(name=name, labels=dict(labels)),
+        spec=client.V1NodeSpec(unschedulable=unschedulable),
+        status=client.V1NodeStatus(capacity=capacity),
+    )
+
+
+def mirror(api, *nodes):
+    mirror = WorkflowNodesMirror(None, FakeNodes(*nodes))
+    mirror.crd_client = api
+    return mirror
+
+
+def test_sync_creates_patches_and_deletes():
+    api = FakeCustomObjects({
+        'kept': {'cpu': '4', 'memory': '8Gi'},
+        'resized': {'cpu': '2', 'memory': '4Gi'},
+        'gone': {'cpu': '2'},
+    })
+
+    complete = mirror(
+        api,
+        node('kept', cpu='4', memory='8Gi'),
+        node('resized', cpu='4', memory='4Gi'),
+        node('added', cpu='8', memory='16Gi'),
+        node('control-plane', labels={}, cpu='2'),
+        node('cordoned', unschedulable=True, cpu='2'),
+    ).sync()
+
+    assert complete
+    assert sorted(api.calls) == [
+        ('create', 'added', {'cpu': '8', 'memory': '16Gi'}),
+        ('delete', 'gone', None),
+        ('patch', 'resized', {'cpu': '4', 'memory': '4Gi'}),
+    ]
+
+
+def test_patch_nulls_removed_resources():
+    api = FakeCustomObjects({'worker': {'cpu': '4', 'nvidia.com/gpu': '1'}})
+
+    mirror(api, node('worker', cpu='4', memory='8Gi')).sync()
+
+    assert api.calls == [('patch', 'worker', {'cpu': '4', 'memory': '8Gi', 'nvidia.com/gpu': None})]
+
+
+def test_budget_cuts_the_sync_off():
+    api = FakeCustomObjects()
+    workers = mirror(api, *(node(f"worker-{i}", cpu='4') for i in range(5)))
+    budget = Budget(3)
+
+    assert not workers.sync(budget)
+    assert len(api.calls) == 3
+    assert budget.calls == 0
+
+    api.objects.update((name, spec) for _, name, spec in api.calls)
+    assert workers.sync(Budget(3))
+    assert len(api.calls) == 5
+
+
+def test_not_found_and_conflicts_are_tolerated(monkeypatch, caplog):
+    monkeypatch.setattr('workflow_nodes.WORKFLOW_NODES_ATTEMPTS', 1)
+    api = FakeCustomObjects(
+        {'gone': {'cpu': '2'}},
+        errors={('delete', 'gone'): 404, ('create', 'added'): 409},
+    )
+
+    assert mirror(api, node('added', cpu='4')).sync()
+    assert sorted(verb for verb, _, _ in api.calls) == ['create', 'delete']
+    assert "Error syncing WorkflowNodes" not in caplog.text
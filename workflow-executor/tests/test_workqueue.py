@@ -0,0 +1,75 @@
+import threading
+import time
+
+from workqueue import RateLimitedQueue
+
+
+def test_deduplicates():
+    queue = RateLimitedQueue()
+    queue.add('a')
+    queue.add('a')
+    queue.add('b')
+
+    assert len(queue) == 2
+    assert queue.get(timeout=0) == 'a'
+    assert queue.get(timeout=0) == 'b'
+    assert queue.get(timeout=0) is None
+
+
+def test_requeues_after_processing():
+    queue = RateLimitedQueue()
+    queue.add('a')
+    assert queue.get(timeout=0) == 'a'
+
+    # Not handed out again while it is processed.
+    queue.add('a')
+    assert queue.get(timeout=0) is None
+
+    queue.done('a')
+    assert queue.get(timeout=0) == 'a'
+    queue.done('a')
+    assert queue.get(timeout=0) is None
+
+
+def test_token_bucket():
+    queue = RateLimitedQueue(qps=10, burst=2)
+    for item in range(3):
+        queue.add(item)
+
+    started = time.monotonic()
+    assert queue.get(timeout=0) == 0
+    assert queue.get(timeout=0) == 1
+    assert queue.get(timeout=0) is None
+
+    assert queue.get(timeout=1) == 2
+    assert time.monotonic() - started >= 0.09
+
+
+def test_backoff():
+    queue = RateLimitedQueue(base_delay=0.05, max_delay=0.1)
+
+    delays = []
+    for _ in range(4):
+        queue.add_rate_limited('a')
+        delays.append(round(queue.delayed[-1][0] - time.monotonic(), 2))
+        queue.delayed.clear()
+    assert delays == [0.05, 0.1, 0.1, 0.1]
+
+    queue.forget('a')
+    queue.add_rate_limited('a')
+    assert queue.get(timeout=0) is None
+    assert queue.get(timeout=1) == 'a'
+
+
+def test_shutdown_wakes_up_getters():
+    queue = RateLimitedQueue()
+    result = []
+    getter = threading.Thread(target=lambda: result.append(queue.get()))
+    getter.start()
+
+    queue.shutdown()
+    getter.join(1)
+    assert result == [None]
+
+    queue.add('a')
+    assert len(queue) == 0